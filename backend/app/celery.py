@@ -1,4 +1,6 @@
 from celery import Celery
+from celery.signals import beat_init
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
 
@@ -13,4 +15,34 @@ celery = Celery(
 
 celery.autodiscover_tasks(['app.tasks'])  # 要讓 celery 自動找到任務位置 (註冊任務)
 
+# 寄信任務使用獨立的 mail queue (SMTP 連線池在 celery-mail worker 內重複使用, 不佔用一般任務的 worker)
+celery.conf.task_routes = {
+    "app.tasks.mail_tasks.*": {"queue": "mail"},
+}
+
+# 定期任務 (需另外啟動 celery beat)
+celery.conf.beat_schedule = {
+    # 日誌分區維護 (第一次於 beat 啟動 6 小時後執行, 啟動時另由 _on_beat_init 執行一次)
+    "rotate-log-partitions": {
+        "task": "app.tasks.tasks.rotate_log_partitions",
+        "schedule": timedelta(hours=6),
+    },
+    # 發送到期的定期/警示通知
+    "dispatch-due-notifications": {
+        "task": "app.tasks.tasks.dispatch_due_notifications",
+        "schedule": timedelta(minutes=1),
+    },
+}
+
+
+
+@beat_init.connect
+def _on_beat_init(sender=None, **kwargs):
+    """
+    beat 啟動時先執行一次日誌分區維護
+    註: 排程的第一次執行時間為啟動後一個間隔, 新部署時需立即建立分區, 不需等待 6 小時
+    """
+    celery.send_task("app.tasks.tasks.rotate_log_partitions")
+
+
 __all__ = ['celery']
@@ -1,11 +1,16 @@
 import os
 from dotenv import load_dotenv
 from mongoengine import connect
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))  # async client 連線池上限
+
+_async_client: AsyncMongoClient | None = None
 
 
 def connect_mongo():
@@ -15,3 +20,26 @@ def connect_mongo():
         alias="default",
     )
     print("<===== connecting mongo server successfully. =====>")
+
+
+def get_async_mongo_db() -> AsyncDatabase:
+    """
+    取得 async 版本的 mongo database (供 async route 的查詢/統計使用, 不會阻塞 event loop)
+    註: client 於第一次使用時建立 (需在 event loop 中), 與 mongoengine 使用相同的資料庫設定
+
+    Returns:
+        AsyncDatabase
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMongoClient(
+            MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE, tz_aware=False)
+    return _async_client[MONGO_DB] if MONGO_DB else _async_client.get_default_database()
+
+
+async def close_async_mongo():
+    """關閉 async mongo client (FastAPI shutdown 時呼叫)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
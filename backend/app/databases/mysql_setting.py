@@ -8,10 +8,13 @@ load_dotenv()
 
 MYSQL_URI = os.getenv("MYSQL_URI")
 MAX_RETRIES = 10  # mysql 重新連線次數
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 10))
+MYSQL_MAX_OVERFLOW = int(os.getenv("MYSQL_MAX_OVERFLOW", 10))
 
 for i in range(MAX_RETRIES):
     try:
-        engine = create_engine(MYSQL_URI, pool_pre_ping=True)
+        engine = create_engine(
+            MYSQL_URI, pool_pre_ping=True, pool_size=MYSQL_POOL_SIZE, max_overflow=MYSQL_MAX_OVERFLOW)
         SessionLocal = sessionmaker(
             autocommit=False, autoflush=False, bind=engine)
         break
@@ -1,24 +1,119 @@
 import os
+import threading
 import redis
+from redis import asyncio as aioredis
 from dotenv import load_dotenv
+from typing import Dict, Tuple
 
 load_dotenv()
 
 REDIS_URI = os.environ.get("REDIS_URI")
 DEFAULT_DB = 0
+REDIS_DBS = (0, 1, 2, 3)  # 0: fastapi-cache, 1: Line 登入狀態, 2: 通知排程, 3: 信箱驗證碼
 
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))  # 每個 db 的連線池上限
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30))  # 閒置超過秒數的連線使用前先 PING
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5))
 
-def connect_redis(redis_db: int = DEFAULT_DB) -> redis.Redis:
-    try:
-        # decode_responses 讓回傳值是 string
-        uri = f'{REDIS_URI}/{redis_db}'
-        pool = redis.ConnectionPool.from_url(uri, decode_responses=True)
-        r = redis.Redis(connection_pool=pool)
-        r.ping()
-        print(f'connecting redis server successfully db:{redis_db}')
+# 全域連線池 (每個 db / decode_responses 組合各一個, 第一次使用時建立)
+# 註: sync 連線池在 fork 後 (celery prefork worker) 會自動重建連線, 可與 FastAPI 共用同一份設定
+_PoolKey = Tuple[int, bool]
+_sync_pools: Dict[_PoolKey, redis.ConnectionPool] = {}
+_async_pools: Dict[_PoolKey, aioredis.ConnectionPool] = {}
+_lock = threading.Lock()
 
-        return r
 
-    except redis.exceptions.ConnectionError as e:
-        print(f'Redis 連線失敗, {e}')
-        return e
+def _pool_options(redis_db: int, decode_responses: bool) -> Tuple[str, dict]:
+    """取得連線池的 url 與設定"""
+    if redis_db not in REDIS_DBS:
+        raise ValueError(f"未定義的 redis db: {redis_db}")
+
+    return f'{REDIS_URI}/{redis_db}', {
+        "decode_responses": decode_responses,  # decode_responses 讓回傳值是 string
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+    }
+
+
+def connect_redis(redis_db: int = DEFAULT_DB, decode_responses: bool = True) -> redis.Redis:
+    """
+    取得共用連線池的 redis client (sync, 供 FastAPI 同步流程與 Celery worker 使用)
+    註: 第一次建立連線池時會 PING 確認連線, 之後直接從連線池取得連線
+
+    Args:
+        redis_db (int): redis db 編號 (0 ~ 3)。
+        decode_responses (bool): 是否將回傳值轉為 string。
+
+    Raises:
+        redis.exceptions.ConnectionError: Redis 連線失敗
+    """
+    key = (redis_db, decode_responses)
+    pool = _sync_pools.get(key)
+    if pool is None:
+        with _lock:
+            pool = _sync_pools.get(key)
+            if pool is None:
+                uri, options = _pool_options(redis_db, decode_responses)
+                pool = redis.ConnectionPool.from_url(uri, **options)
+                try:
+                    redis.Redis(connection_pool=pool).ping()
+                except redis.exceptions.ConnectionError as e:
+                    pool.disconnect()
+                    print(f'Redis 連線失敗, {e}')
+                    raise
+                _sync_pools[key] = pool
+                print(f'connecting redis server successfully db:{redis_db}')
+
+    return redis.Redis(connection_pool=pool)
+
+
+def connect_async_redis(redis_db: int = DEFAULT_DB, decode_responses: bool = True) -> aioredis.Redis:
+    """
+    取得共用連線池的 redis client (asyncio, 供 async route 與 fastapi-cache 使用)
+    註: 連線在第一次執行指令時才建立, 連線失敗時由呼叫端的指令拋出例外
+
+    Args:
+        redis_db (int): redis db 編號 (0 ~ 3)。
+        decode_responses (bool): 是否將回傳值轉為 string (fastapi-cache 需為 False)。
+    """
+    key = (redis_db, decode_responses)
+    pool = _async_pools.get(key)
+    if pool is None:
+        uri, options = _pool_options(redis_db, decode_responses)
+        pool = _async_pools.setdefault(
+            key, aioredis.ConnectionPool.from_url(uri, **options))
+
+    return aioredis.Redis(connection_pool=pool)
+
+
+def get_redis_pool_metrics() -> Dict[str, Dict[str, int]]:
+    """
+    取得各連線池的使用狀況 (供 /metrics 使用)
+
+    Returns:
+        {"sync:db1": {"in_use": 1, "available": 3, "max": 50}, ...}
+    """
+    metrics = dict()
+    for kind, pools in (("sync", _sync_pools), ("async", _async_pools)):
+        for (redis_db, decode_responses), pool in pools.items():
+            name = f'{kind}:db{redis_db}{"" if decode_responses else ":bytes"}'
+            metrics[name] = {
+                "in_use": len(pool._in_use_connections),
+                "available": len(pool._available_connections),
+                "max": pool.max_connections,
+            }
+    return metrics
+
+
+async def close_redis_pools():
+    """關閉所有連線池 (FastAPI shutdown 時呼叫)"""
+    for pool in list(_async_pools.values()):
+        await pool.disconnect()
+    _async_pools.clear()
+
+    with _lock:
+        for pool in list(_sync_pools.values()):
+            pool.disconnect()
+        _sync_pools.clear()
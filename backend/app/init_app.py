@@ -1,10 +1,9 @@
 # FastAPI
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 # cache
-import redis
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 
@@ -12,7 +11,8 @@ from fastapi_cache.backends.redis import RedisBackend
 from fastapi.middleware.cors import CORSMiddleware
 
 # database setting
-from app.databases.mongo_setting import connect_mongo
+from app.databases.mongo_setting import connect_mongo, close_async_mongo
+from app.databases.redis_setting import connect_async_redis, close_redis_pools, get_redis_pool_metrics
 from app.databases.mysql_setting import engine
 from app.models.sql_model import Base
 
@@ -25,19 +25,25 @@ from app.router.plan import user_plan
 
 
 # error handling
-from app.utils.error_handle import AuthorizationError
+from app.utils.error_handle import AuthorizationError, PasswordHasherBusyError
 from app.tasks.tasks import jwt_exception_log
+from app.services.password_services import get_password_pool_metrics
+from app.services.smtp_pool import get_mail_metrics
 
 # env
 from dotenv import load_dotenv
 import os
+import secrets
 
 load_dotenv()
-REDIS_URI = os.environ.get("REDIS_URI")
+
+# /metrics 存取權杖 (以 X-Metrics-Token header 傳入, 未設定時不開放 /metrics)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 
 def init_app() -> FastAPI:
-    app = FastAPI()
+    # 預設以 orjson 序列化回應 (讀取類 API 的回傳資料量大)
+    app = FastAPI(default_response_class=ORJSONResponse)
 
     origins = [
         "http://localhost:5173"
@@ -55,12 +61,17 @@ def init_app() -> FastAPI:
 
     @app.on_event("startup")
     async def startup():
-        # fastapi-cache memory 方式
-        redis_client = redis.from_url(REDIS_URI, decode_responses=True)
+        # fastapi-cache (RedisBackend 需使用 asyncio 版本的 redis client, 回傳值為 bytes)
+        redis_client = connect_async_redis(decode_responses=False)
         FastAPICache.init(RedisBackend(redis_client), prefix="fastapi-cache")
         connect_mongo()
         Base.metadata.create_all(bind=engine)
 
+    @app.on_event("shutdown")
+    async def shutdown():
+        await close_async_mongo()
+        await close_redis_pools()
+
     @app.get("/")
     def root():
         return {"message": "Hello from FastAPI in Docker!"}
@@ -70,6 +81,30 @@ def init_app() -> FastAPI:
         jwt_exception_log.delay(exc.client_ip, exc.user_agent, exc.token)
         return JSONResponse(status_code=401, content={"message": "Unauthorized"})
 
+    @app.exception_handler(PasswordHasherBusyError)
+    async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusyError):
+        # 密碼 thread pool 飽和時快速回應, 避免請求持續排隊
+        return JSONResponse(status_code=503, headers={"Retry-After": "1"}, content={"success": False, "message": exc.message})
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics(x_metrics_token: str | None = Header(default=None)):
+        """
+        內部監控數據 (需帶 X-Metrics-Token, 與環境變數 METRICS_TOKEN 相同)
+        註: 寄信統計存在 redis, redis 無法連線時 mail 為 None, 其餘數據照常回傳
+        """
+        if not METRICS_TOKEN:
+            return JSONResponse(status_code=404, content={"message": "Not Found"})
+        if not x_metrics_token or not secrets.compare_digest(x_metrics_token, METRICS_TOKEN):
+            return JSONResponse(status_code=401, content={"message": "Unauthorized"})
+
+        try:
+            mail_metrics = get_mail_metrics()
+        except Exception as e:
+            print(f'error: {e}')
+            mail_metrics = None
+        return {"password_hasher": get_password_pool_metrics(), "redis": get_redis_pool_metrics(),
+                "mail": mail_metrics}
+
     # router register
     app.include_router(auth.router, prefix="/app")
     app.include_router(dashboard_api.router, prefix="/app")
@@ -1,5 +1,6 @@
 import mongoengine as me
 from datetime import datetime
+from app.utils.search_tokens import SEARCH_FIELD_PREFIX, build_search_tokens
 
 
 class BaseModel(me.Document):
@@ -10,6 +11,7 @@ class BaseModel(me.Document):
         description (str): 備註。
         created_at (datetime): 建立時間。
         updated_at (datetime): 更新時間。
+        search_tokens (List[str]): 關鍵字搜尋索引 (由 SEARCH_FIELD_PREFIX 的欄位產生, 寫入時更新)。
     """
 
     meta = {
@@ -18,13 +20,51 @@ class BaseModel(me.Document):
     description = me.StringField(default="")
     created_at = me.DateTimeField(default=datetime.utcnow)
     updated_at = me.DateTimeField(default=datetime.utcnow)
+    search_tokens = me.ListField(me.StringField(), default=list)
 
     def save(self, *args, **kwargs):
         if not self.created_at:
             self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
+        self.refresh_search_tokens()
         super().save(*args, **kwargs)
 
+    def refresh_search_tokens(self):
+        """依目前的欄位值重新建立 search_tokens (以 insert_many 寫入時需另外呼叫)"""
+        self.search_tokens = self.get_search_tokens()
+
+    def get_search_tokens(self, changes: dict | None = None) -> list:
+        """
+        取得套用 changes 後的 search_tokens (以 update() 寫入時帶入 set__search_tokens)
+
+        Args:
+            changes (dict | None): 欄位: 新值
+        """
+        values = {field: getattr(self, field) for field in SEARCH_FIELD_PREFIX if field in self._fields}
+        values.update({field: value for field, value in (changes or {}).items() if field in values})
+        return build_search_tokens(values)
+
+
+def owner_indexes():
+    """
+    記帳資料索引 (依實際查詢形狀設計, 可用 `python -m app.services.mongo_index_check` 驗證)
+    所有查詢都以 owner_id (MySQL User.id) 作為使用者條件, 不再依登入方式使用不同欄位
+
+    - owner_id, created_at, _id: 交易紀錄預設排序 (created_at + _id) 與游標分頁、儀錶板 $match
+    - owner_id, unit, created_at, _id: 指定幣別 + 日期區間的篩選與排序
+    - owner_id, updated_at: 新紀錄筆數 (updated_at > 上次瀏覽時間, redis 計數不存在時的備援)
+    - owner_id, search_tokens: 關鍵字搜尋 / 模糊篩選 (multikey, 見 app/utils/search_tokens.py)
+
+    Returns:
+        mongoengine meta indexes
+    """
+    return [
+        {"fields": ["owner_id", "-created_at", "-_id"]},
+        {"fields": ["owner_id", "unit", "-created_at", "-_id"]},
+        {"fields": ["owner_id", "-updated_at"]},
+        {"fields": ["owner_id", "search_tokens"]},
+    ]
+
 
 class Accounting(BaseModel):
     """
@@ -34,6 +74,7 @@ class Accounting(BaseModel):
         statistics_kind (str): 統計類型，例如：食、衣、住、行、育、樂、生活、其他。
         category (str): 花費細項類別，例如：早餐、午餐、晚餐、宵夜、零食等。
 
+        owner_id (int): 資料擁有者 (MySQL User.id), 所有查詢的使用者條件。
         user_name (str): 使用者名稱。
         line_user_id (str): 使用者 Line ID。
 
@@ -59,6 +100,7 @@ class Accounting(BaseModel):
     statistics_kind = me.StringField(required=True, default="其他")
     category = me.StringField(default="其他")
 
+    owner_id = me.IntField(default=None)
     user_name = me.StringField(required=True)
     line_user_id = me.StringField(default=None)
     cost_name = me.StringField(required=True)
@@ -70,15 +112,7 @@ class Accounting(BaseModel):
     invoice_number = me.StringField(default="")  # 發票號碼, 之後串金流可用
 
     meta = {
-        "indexes": [
-            {
-                "fields": [
-                    "user_name", "line_user_id", "statistics_kind", "cost_status",
-                    "category", "cost_name", "store_name", "invoice_number", "created_at"
-                ],
-                "sparse": True
-            }
-        ]
+        "indexes": owner_indexes()
     }
 
     def __str__(self):
@@ -111,6 +145,7 @@ class IncomeAccounting(BaseModel):
     Attributes:
         income_kind (str): 收入類型，例如「薪資」、「紅包」、「投資」等。預設為「其他」。
         category (str): 收入分類，可更細分如「兼職」、「股利」、「租金」等。預設為空字串。
+        owner_id (int): 資料擁有者 (MySQL User.id), 所有查詢的使用者條件。
         user_name (str): 使用者名稱，對應平台登入帳號或顯示名稱。
         line_user_id (str): LINE 使用者的唯一 ID，若無綁定 LINE，則為空字串。
         amount (int): 收入金額（整數）。必填欄位。
@@ -120,6 +155,7 @@ class IncomeAccounting(BaseModel):
     """
     income_kind = me.StringField(required=True, default="其他")
     category = me.StringField(default="")
+    owner_id = me.IntField(default=None)
     user_name = me.StringField(required=True)
     line_user_id = me.StringField(default=None)
     amount = me.IntField(required=True)
@@ -128,14 +164,7 @@ class IncomeAccounting(BaseModel):
     pay_account = me.StringField(required=True)
 
     meta = {
-        'indexes': [
-            {
-                'fields': [
-                    "income_kind", "user_name", "line_user_id", "payer", "pay_account", "created_at"
-                ],
-                "sparse": True
-            }
-        ]
+        "indexes": owner_indexes()
     }
 
     def __repr__(self):
@@ -154,3 +183,47 @@ class IncomeAccounting(BaseModel):
             "description": self.description,
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
         }
+
+
+class MonthlySummary(me.Document):
+    """
+    使用者每月記帳統計表 (由記帳新增/更新/刪除時以 $inc 同步維護)
+    註: 可透過 `python -m app.services.monthly_summary` 從原始記帳資料重建
+
+    Attributes:
+        owner_id (int): 資料擁有者 (MySQL User.id)。
+        month (datetime): 統計月份 (UTC 每月 1 日 00:00:00)。
+        unit (str): 金錢單位（例如: TWD, JPY)。
+        record_type (str): 資料類型：
+            - expense: 支出 (Accounting)
+            - income: 收入 (IncomeAccounting)
+        kind (str): 支出為 statistics_kind, 收入為 income_kind。
+        cost_status (int): 支出的花費狀態 (同 Accounting.cost_status), 收入為 None。
+        total (int): 當月金額總和。
+        count (int): 當月資料筆數。
+        updated_at (datetime): 更新時間。
+    """
+    owner_id = me.IntField(required=True)
+    month = me.DateTimeField(required=True)
+    unit = me.StringField(required=True, default="TWD")
+    record_type = me.StringField(required=True, choices=("expense", "income"))
+    kind = me.StringField(required=True)
+    cost_status = me.IntField(default=None)
+    total = me.IntField(default=0)
+    count = me.IntField(default=0)
+    updated_at = me.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        "collection": "monthly_summary",
+        "indexes": [
+            {
+                "fields": [
+                    "owner_id", "month", "unit", "record_type", "kind", "cost_status"
+                ],
+                "unique": True
+            }
+        ]
+    }
+
+    def __repr__(self):
+        return f"MonthlySummary(owner_id={self.owner_id}, month={self.month:%Y-%m}, kind={self.kind}, total={self.total})"
@@ -64,12 +64,14 @@ class JwtTokenLog(Base):
         ip (str): 使用者 ip。
         ua (str): 使用者代理。
         created_at (datetime): 建立時間。
+
+    註: 以 created_at 按月分區 (app/services/log_partition.py), 分區欄位需包含在主鍵中
     """
     __tablename__ = "jwt_token_log"
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     ip = Column(String(50), nullable=False)
     ua = Column(String(255), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
 
 class UserLoginLog(Base):
@@ -84,16 +86,19 @@ class UserLoginLog(Base):
         method (str): 登入方式（如 password, line）。
         success_status (bool): 是否成功登入。
         created_at (datetime): 建立時間。
+
+    註: 以 created_at 按月分區 (app/services/log_partition.py), 分區表的 unique 索引需包含分區欄位,
+        因此 line_user_id 只建立一般索引
     """
     __tablename__ = "users_login_log"
     id = Column(Integer, primary_key=True, autoincrement=True)
     ip = Column(String(30))
     email = Column(String(100), nullable=False)
     line_user_name = Column(String(100), nullable=True)
-    line_user_id = Column(String(100), unique=True, nullable=True)
+    line_user_id = Column(String(100), index=True, nullable=True)
     method = Column(String(10), nullable=True)
     success_status = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
     def __repr__(self):
         return f"<UserLoginLog (id={self.id}, status={self.success_status})>"
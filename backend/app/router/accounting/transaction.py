@@ -1,43 +1,50 @@
 # fastApi
 from fastapi import APIRouter, Request, Depends, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 # Databases
 from app.databases.mysql_setting import connect_mysql
 from sqlalchemy.orm import Session
-from app.models.sql_model import User, UserBrowserRecord
+from app.models.sql_model import UserBrowserRecord
 from app.models.mongo_model import Accounting, IncomeAccounting
+from app.databases.mongo_setting import get_async_mongo_db
 
 # JWT
-from app.utils.jwt_verification import verify_jwt_token
+from app.utils.jwt_verification import verify_jwt_token, resolve_user_id
 
 # cache & key builder
 from fastapi_cache.decorator import cache
 from app.utils.cachekey import transaction_key_builder
 
 # Validation Schema
-from app.schemas.accounting import FilterRequest
+from app.schemas.accounting import FilterRequest, ExportRequest, SearchRequest
 
 # Tools
-from app.utils.attach_info import verify_utc_time, convert_to_utc_datetime, check_user_login_method
+from app.utils.attach_info import verify_utc_time, convert_to_utc_datetime
 from app.utils.query_map import handle_filter_query
+from app.services.transaction_services import get_transaction_match_condition, get_transaction_page, get_transaction_cursor_page, get_ledger_queries, get_ledger_sort_order, get_ledger_page, get_ledger_cursor_page, search_transactions, stream_transaction_export, EXPORT_FORMATS
+from app.services.unseen_counter import get_unseen_record_count, init_unseen_records, reset_unseen_records
+from app.utils.error_handle import InvalidCursorError
+from app.utils.threadpool import run_blocking
 from datetime import date, datetime
 from bson import ObjectId
 from typing import Tuple, Dict, List, Any
+import asyncio
 
 # tags 是在 swagger UI 中的分區名稱資料
 router = APIRouter(prefix="/transaction", tags=["transaction"])
 
 
-_CACHE_MEMORY_TIME = 300  # 快取 function 到記憶體的時間, 單位秒
+_CACHE_MEMORY_TIME = 6 * 60 * 60  # 快取時間, 單位秒 (記帳資料異動時以使用者快取版本號失效)
 
 
 @router.post("/history")
 @verify_jwt_token
 async def get_transaction_history(request: Request, query: FilterRequest):
     """
-    記帳紀錄
+    記帳紀錄 (oper: 0 支出, 1 收入, 2 合併帳本)
     註: 每一頁回傳 12/20 筆資料
+        合併帳本的篩選/排序欄位: kind, category, name, amount, unit, description, date (支出/收入欄位自動對應)
     """
     # 參數處理
     per_page = query.per_page
@@ -50,106 +57,209 @@ async def get_transaction_history(request: Request, query: FilterRequest):
     print('sort_order:', sort_order)
 
     @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
-    def _get_transaction_data(
+    async def _get_transaction_data(
         collection: Accounting | IncomeAccounting,
-        user_name: str,
-        line_user_id: str,
-        login_method: str,
+        owner_id: int,
         query: Dict[str, Any],
         sort_order: List[Tuple[str, int]],
         start_index: int,
-        end_index: int
+        per_page: int
     ):
         """
-        取得記帳資料
+        取得記帳資料 (僅取回當頁資料)
 
         Returns:
             response_data: 記帳資料
             max_page, 最大頁數
         """
-        # 根據登入方式設定查詢條件
-        if login_method == "bind":
-            match_condition = {"user_name": user_name,
-                               "line_user_id": line_user_id, **query}
-        elif login_method == "line":
-            match_condition = {"line_user_id": line_user_id, **query}
-        else:
-            match_condition = {"user_name": user_name, **query}
-
-        # 採用 aggregate 查詢
-        pipeline = [
-            {"$match": match_condition},
-        ]
-        if sort_order:
-            for field, order in sort_order:
-                pipeline.append({"$sort": {field: order}})
-        #
-
-        transaction_data = list(collection.objects.aggregate(*pipeline))
-        max_page = (len(transaction_data) + per_page - 1) // per_page
-
-        if collection.__name__ == "Accounting":
-            response_data = [
-                {
-                    "id": str(data["_id"]),
-                    "user_name": data["user_name"],
-                    "statistics_kind": data["statistics_kind"],
-                    "category": data["category"],
-                    "store_name": data["store_name"],
-                    "cost_name": data["cost_name"],
-                    "cost": data["cost"],
-                    "unit": data["unit"],
-                    "pay_method": data["pay_method"],
-                    "cost_status": data["cost_status"],
-                    "description": data["description"],
-                    "created_at": data["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
-                } for data in transaction_data[start_index:end_index]
-            ]
-        else:
-            response_data = [
-                {
-                    "id": str(data["_id"]),
-                    "user_name": data["user_name"],
-                    "income_kind": data["income_kind"],
-                    "category": data["category"],
-                    "amount": data["amount"],
-                    "unit": data["unit"],
-                    "payer": data["payer"],
-                    "pay_account": data["pay_account"],
-                    "description": data["description"],
-                    "created_at": data["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
-                } for data in transaction_data[start_index:end_index]
-            ]
-
-        return response_data, max_page
+        match_condition = get_transaction_match_condition(owner_id, query)
+        return await get_transaction_page(collection, match_condition, sort_order, start_index, per_page)
+
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
+    async def _get_transaction_cursor_data(
+        collection: Accounting | IncomeAccounting,
+        owner_id: int,
+        query: Dict[str, Any],
+        sort_order: List[Tuple[str, int]],
+        cursor: str | None,
+        per_page: int
+    ):
+        """
+        取得記帳資料 (游標分頁)
+
+        Returns:
+            response_data: 記帳資料
+            next_cursor, 下一頁游標 (沒有下一頁時為 None)
+        """
+        match_condition = get_transaction_match_condition(owner_id, query)
+        return await get_transaction_cursor_page(collection, match_condition, sort_order, cursor, per_page)
+
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
+    async def _get_ledger_data(
+        owner_id: int,
+        queries: Dict[str, Dict[str, Any]],
+        sort_order: List[Tuple[str, int]],
+        start_index: int,
+        per_page: int,
+        with_balance: bool
+    ):
+        """
+        取得合併帳本 (支出 + 收入) 資料 (僅取回當頁資料)
+
+        Returns:
+            response_data: 帳本資料
+            max_page, 最大頁數
+        """
+        return await get_ledger_page(owner_id, queries, sort_order, start_index, per_page, with_balance)
+
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
+    async def _get_ledger_cursor_data(
+        owner_id: int,
+        queries: Dict[str, Dict[str, Any]],
+        sort_order: List[Tuple[str, int]],
+        cursor: str | None,
+        per_page: int,
+        with_balance: bool
+    ):
+        """
+        取得合併帳本 (支出 + 收入) 資料 (游標分頁)
+
+        Returns:
+            response_data: 帳本資料
+            next_cursor, 下一頁游標 (沒有下一頁時為 None)
+        """
+        return await get_ledger_cursor_page(owner_id, queries, sort_order, cursor, per_page, with_balance)
 
     try:
-        # 檢查使用者登入方式
-        payload = request.state.payload
-        user_name = payload.get("username")
-        line_user_id = payload.get("line_user_id", None)
-        login_method = check_user_login_method(payload)
+        owner_id = request.state.principal.user_id
 
         oper = query.oper
-        if oper in "01":
+        if oper == "2":
+            try:
+                queries, sort_order = get_ledger_queries(query.filters), get_ledger_sort_order(query.filters)
+            except ValueError as e:
+                return ORJSONResponse(status_code=400, content={"success": False, "message": str(e)})
+
+            if query.cursor_mode:
+                response_data, next_cursor = await _get_ledger_cursor_data(
+                    owner_id, queries, sort_order, query.cursor, per_page, query.with_balance)
+                return ORJSONResponse(status_code=200, content={"success": True, "data": response_data, "next_cursor": next_cursor})
+
+            response_data, max_page = await _get_ledger_data(
+                owner_id, queries, sort_order, start_index, per_page, query.with_balance)
+            return ORJSONResponse(status_code=200, content={"success": True, "data": response_data, "max_page": max_page})
+
+        elif oper in "01" and query.cursor_mode:
+            response_data, next_cursor = await _get_transaction_cursor_data(
+                Accounting if oper == "0" else IncomeAccounting,
+                owner_id,
+                query_conditions,
+                sort_order,
+                query.cursor,
+                per_page
+            )
+            return ORJSONResponse(status_code=200, content={"success": True, "data": response_data, "next_cursor": next_cursor})
+
+        elif oper in "01":
             response_data, max_page = await _get_transaction_data(
                 Accounting if oper == "0" else IncomeAccounting,
-                user_name,
-                line_user_id,
-                login_method,
+                owner_id,
                 query_conditions,
                 sort_order,
                 start_index,
-                end_index
+                per_page
             )
-            return JSONResponse(status_code=200, content={"success": True, "data": response_data, "max_page": max_page})
+            return ORJSONResponse(status_code=200, content={"success": True, "data": response_data, "max_page": max_page})
 
         else:
-            return JSONResponse(status_code=404, content={"success": True, "message": "找不到相應的頁面"})
+            return ORJSONResponse(status_code=404, content={"success": True, "message": "找不到相應的頁面"})
+
+    except InvalidCursorError as e:
+        return ORJSONResponse(status_code=400, content={"success": False, "message": e.message})
+
+    except Exception as e:
+        print(f'error: {e}')
+        return ORJSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者交易紀錄"})
+
+
+@router.post("/search")
+@verify_jwt_token
+async def search_transaction_history(request: Request, query: SearchRequest):
+    """
+    關鍵字搜尋記帳紀錄 (支出: 花費名稱 / 店家 / 備註, 收入: 付款人 / 備註), 依相關程度排序
+    註: 中文以相鄰兩字比對 (例如「全家」), 英數以單字前綴比對
+    """
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
+    async def _get_search_data(
+        collection: Accounting | IncomeAccounting,
+        owner_id: int,
+        keyword: str,
+        start_index: int,
+        per_page: int
+    ):
+        """
+        取得搜尋結果 (僅取回當頁資料)
+
+        Returns:
+            response_data: 記帳資料
+            has_next, 是否還有下一頁
+        """
+        return await search_transactions(collection, owner_id, keyword, start_index, per_page)
+
+    if query.oper not in ("0", "1") or not query.keyword.strip() or query.page < 1 or query.per_page < 1:
+        return ORJSONResponse(status_code=400, content={"success": False, "message": "搜尋參數錯誤"})
+
+    try:
+        response_data, has_next = await _get_search_data(
+            Accounting if query.oper == "0" else IncomeAccounting,
+            request.state.principal.user_id,
+            query.keyword.strip(),
+            (query.page - 1) * query.per_page,
+            query.per_page
+        )
+        return ORJSONResponse(status_code=200, content={"success": True, "data": response_data, "has_next": has_next})
 
     except Exception as e:
         print(f'error: {e}')
-        return JSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者交易紀錄"})
+        return ORJSONResponse(status_code=500, content={"success": False, "message": "無法搜尋使用者交易紀錄"})
+
+
+@router.post("/export")
+@verify_jwt_token
+async def export_transaction_history(request: Request, query: ExportRequest):
+    """
+    匯出全部記帳紀錄 (篩選條件同 /history, 以 StreamingResponse 逐批輸出 CSV / NDJSON)
+    註: 不經過快取, 記憶體用量與匯出筆數無關
+    """
+    if query.oper not in ("0", "1") or query.format not in EXPORT_FORMATS:
+        return ORJSONResponse(status_code=400, content={"success": False, "message": "匯出參數錯誤"})
+
+    try:
+        convert_query = handle_filter_query(query=query.filters)
+        match_condition = get_transaction_match_condition(
+            request.state.principal.user_id, convert_query["mongo_query"])
+
+    except Exception as e:
+        print(f'error: {e}')
+        return ORJSONResponse(status_code=400, content={"success": False, "message": "篩選條件錯誤"})
+
+    filename = f"{'expense' if query.oper == '0' else 'income'}_{datetime.utcnow():%Y%m%d}.{query.format}"
+    media_type = EXPORT_FORMATS[query.format]
+    if query.gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        stream_transaction_export(
+            Accounting if query.oper == "0" else IncomeAccounting,
+            match_condition,
+            convert_query["sort_order"],
+            query.format,
+            query.gzip
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 
 @router.get("/new/record")
@@ -157,60 +267,35 @@ async def get_transaction_history(request: Request, query: FilterRequest):
 async def get_new_record(request: Request, sqldb: Session = Depends(connect_mysql)):
     """
     取得使用者距離上次瀏覽交易紀錄頁面時, 新增了幾筆紀錄
+    註: 由 redis 計數取得 (記帳寫入時累加, 瀏覽時歸零); 計數不存在時 (過期/redis 重啟)
+        才以 MySQL 的上次瀏覽時間計算支出 + 收入的筆數, 並重新建立計數
     """
-    payload = request.state.payload
-    username = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(User.username == username).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-
-    if not user:
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者名稱不正確"})
+    principal = request.state.principal
+    user_id = await resolve_user_id(principal, sqldb)
+    if not user_id:
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者名稱不正確"})
 
     try:
-        user_record = sqldb.query(UserBrowserRecord).filter(
-            UserBrowserRecord.user_id == user.id).first()
-
-        # 如果有瀏覽紀錄: 則支出 + 收入的筆數做總和
-        last_view_at = user_record.history_last_view_at if user_record and user_record.history_last_view_at else datetime.utcnow()
-
-        if login_method == "bind":
-            expense_count = Accounting.objects(
-                user_name=username, line_user_id=line_user_id,
-                updated_at__gt=last_view_at
-            ).count()
-            income_count = IncomeAccounting.objects(
-                user_name=username, line_user_id=line_user_id,
-                updated_at__gt=last_view_at
-            ).count()
-        elif login_method == "line":
-            expense_count = Accounting.objects(
-                line_user_id=line_user_id,
-                updated_at__gt=last_view_at
-            ).count()
-            income_count = IncomeAccounting.objects(
-                line_user_id=line_user_id,
-                updated_at__gt=last_view_at
-            ).count()
-        else:
-            expense_count = Accounting.objects(
-                user_name=username,
-                updated_at__gt=last_view_at
-            ).count()
-            income_count = IncomeAccounting.objects(
-                user_name=username,
-                updated_at__gt=last_view_at
-            ).count()
-        new_record_count = expense_count + income_count
-
-        return JSONResponse(
+        new_record_count, initialized = await get_unseen_record_count(user_id)
+
+        if not initialized:
+            user_record = await run_blocking(sqldb.query(UserBrowserRecord).filter(
+                UserBrowserRecord.user_id == user_id).first)
+
+            # 如果有瀏覽紀錄: 則支出 + 收入的筆數做總和
+            last_view_at = user_record.history_last_view_at if user_record and user_record.history_last_view_at else datetime.utcnow()
+
+            match_condition = get_transaction_match_condition(
+                user_id, {"updated_at": {"$gt": last_view_at}})
+            mongo_db = get_async_mongo_db()
+            expense_count, income_count = await asyncio.gather(
+                mongo_db[Accounting._get_collection_name()].count_documents(match_condition),
+                mongo_db[IncomeAccounting._get_collection_name()].count_documents(match_condition)
+            )
+            new_record_count = await init_unseen_records(
+                user_id, expense_count + income_count, last_view_at, baseline=new_record_count)
+
+        return ORJSONResponse(
             status_code=200,
             content={
                 "success": True,
@@ -220,7 +305,7 @@ async def get_new_record(request: Request, sqldb: Session = Depends(connect_mysq
         )
 
     except Exception as e:
-        return JSONResponse(status_code=500, content={"success": False, "message": f"伺服器錯誤: {str(e)}"})
+        return ORJSONResponse(status_code=500, content={"success": False, "message": f"伺服器錯誤: {str(e)}"})
 
 
 @router.put("/last_browser_time")
@@ -228,37 +313,30 @@ async def get_new_record(request: Request, sqldb: Session = Depends(connect_mysq
 async def update_last_browser_time(request: Request, sqldb: Session = Depends(connect_mysql)):
     """
     紀錄使用者瀏覽交易紀錄頁面的時間
-        """
-    payload = request.state.payload
-    username = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(User.username == username).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-
-    if not user:
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者名稱不正確"})
-
-    user_record = sqldb.query(UserBrowserRecord).filter(
-        UserBrowserRecord.user_id == user.id).first()
+    註: 新紀錄筆數由 redis 歸零; MySQL 只在距離上次寫入超過 UNSEEN_PERSIST_INTERVAL 時更新 (計數遺失時的備援)
+    """
+    user_id = await resolve_user_id(request.state.principal, sqldb)
+    if not user_id:
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者名稱不正確"})
+
+    view_at = datetime.utcnow()
+    if not await reset_unseen_records(user_id, view_at):
+        return ORJSONResponse(status_code=201, content={"success": True, "message": "新增瀏覽紀錄成功"})
+
+    user_record = await run_blocking(sqldb.query(UserBrowserRecord).filter(
+        UserBrowserRecord.user_id == user_id).first)
     try:
         if user_record:
-            user_record.user_id = user.id
-            user_record.history_last_view_at = datetime.utcnow()
+            user_record.user_id = user_id
+            user_record.history_last_view_at = view_at
         else:
             create_new_record = UserBrowserRecord(
-                user_id=user.id,
-                history_last_view_at=datetime.utcnow()
+                user_id=user_id,
+                history_last_view_at=view_at
             )
             sqldb.add(create_new_record)
-        sqldb.commit()
-        return JSONResponse(status_code=201, content={"success": True, "message": "新增瀏覽紀錄成功"})
+        await run_blocking(sqldb.commit)
+        return ORJSONResponse(status_code=201, content={"success": True, "message": "新增瀏覽紀錄成功"})
     except Exception as e:
         sqldb.rollback()
-        return JSONResponse(status_code=500, content={"success": False, "message": f"伺服器錯誤: {str(e)}"})
+        return ORJSONResponse(status_code=500, content={"success": False, "message": f"伺服器錯誤: {str(e)}"})
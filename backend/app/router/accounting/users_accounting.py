@@ -1,21 +1,36 @@
 # fastApi
-from fastapi import APIRouter, Query, Request, Response
+from fastapi import APIRouter, Query, Request, Response, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 
 # Databases & Schemas
 from app.models.mongo_model import Accounting, IncomeAccounting
 from app.schemas.accounting import AccountingCreate, AccountingUpdate, AccountingDelete, IncomeCreate, IncomeUpdate, IncomeDelete, FilterRequest
+from app.schemas.accounting import BulkUpdateRequest, BulkDeleteRequest, AccountingBulkChanges, IncomeBulkChanges
 
 # JWT
 from app.utils.jwt_verification import verify_jwt_token
 
 # cache & key builder
 from fastapi_cache.decorator import cache
-from app.utils.cachekey import transaction_key_builder
+from app.utils.cachekey import transaction_key_builder, bump_cache_generation
+
+# monthly summary & budget
+from app.services.monthly_summary import summary_deltas, apply_summary_deltas
+from app.services.budget_tracker import prepare_month_spend, current_month_cost, track_expense_delta
+from app.services.unseen_counter import incr_unseen_records
+
+# bulk import
+from app.services.import_services import IMPORT_BATCH_SIZE, get_import_format, import_transactions
+from app.services.bulk_services import get_bulk_match_condition, bulk_update_records, bulk_delete_records
+from bson.errors import InvalidId
+from pydantic import ValidationError
 
 # Tools
 from app.utils.attach_info import verify_utc_time, convert_to_utc_datetime, check_user_login_method
 from app.utils.query_map import handle_filter_query
+from app.services.transaction_services import get_transaction_match_condition, get_transaction_page, get_transaction_cursor_page
+from app.utils.error_handle import InvalidCursorError
+from app.utils.threadpool import run_blocking
 from datetime import date, datetime
 from bson import ObjectId
 from typing import Tuple, Dict, List, Any
@@ -24,7 +39,34 @@ from typing import Tuple, Dict, List, Any
 router = APIRouter(prefix="/accounting", tags=["accounting"])
 
 
-_CACHE_MEMORY_TIME = 300  # 快取 function 到記憶體的時間, 單位秒
+_CACHE_MEMORY_TIME = 6 * 60 * 60  # 快取時間, 單位秒 (記帳資料異動時以使用者快取版本號失效)
+
+
+# -- 記帳寫入 (含每月統計), mongoengine 為阻塞操作, 由 route 透過 run_blocking 執行 --
+def _save_record(collection: Accounting | IncomeAccounting, record: Accounting | IncomeAccounting):
+    """新增記帳資料並累加每月統計"""
+    record.save()
+    apply_summary_deltas(summary_deltas(collection, record))
+
+
+def _update_record(collection: Accounting | IncomeAccounting, record: Accounting | IncomeAccounting, update_fields: Dict[str, Any]):
+    """
+    更新記帳資料與每月統計 (先扣除舊資料, 再加上新資料; 月份或類別變動時會移動金額)
+    註: updated_at 同批次更新, 新紀錄筆數的資料庫備援查詢 (updated_at > 上次瀏覽時間) 才會計入單筆更新
+    """
+    old_deltas = summary_deltas(collection, record, -1)
+    update_fields = {**update_fields, "search_tokens": record.get_search_tokens(update_fields),
+                     "updated_at": datetime.utcnow()}
+    record.update(**{f"set__{k}": v for k, v in update_fields.items()})
+    record.reload()
+    apply_summary_deltas(old_deltas + summary_deltas(collection, record))
+
+
+def _delete_record(collection: Accounting | IncomeAccounting, record: Accounting | IncomeAccounting):
+    """刪除記帳資料並扣除每月統計"""
+    record.delete()
+    apply_summary_deltas(summary_deltas(collection, record, -1))
+# -- End. --
 
 
 @router.post("/transaction/history")
@@ -46,108 +88,215 @@ async def get_transaction_history(request: Request, query: FilterRequest):
     print(sort_order)
 
     @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
-    def _get_transaction_data(
+    async def _get_transaction_data(
         collection: Accounting | IncomeAccounting,
-        user_name: str,
-        line_user_id: str,
-        login_method: str,
+        owner_id: int,
         query: Dict[str, Any],
         sort_order: List[Tuple[str, int]],
         start_index: int,
-        end_index: int
+        per_page: int
     ):
         """
-        取得記帳資料
+        取得記帳資料 (僅取回當頁資料)
 
         Returns:
             response_data: 記帳資料
             max_page, 最大頁數
         """
-        # 根據登入方式設定查詢條件
-        if login_method == "bind":
-            match_condition = {"user_name": user_name,
-                               "line_user_id": line_user_id, **query}
-        elif login_method == "line":
-            match_condition = {"line_user_id": line_user_id, **query}
-        else:
-            match_condition = {"user_name": user_name, **query}
-
-        # 採用 aggregate 查詢
-        pipeline = [
-            {"$match": match_condition},
-        ]
-        if sort_order:
-            for field, order in sort_order:
-                pipeline.append({"$sort": {field: order}})
-        #
-
-        transaction_data = list(collection.objects.aggregate(*pipeline))
-        max_page = (len(transaction_data) + per_page - 1) // per_page
-
-        if collection.__name__ == "Accounting":
-            response_data = [
-                {
-                    "id": str(data["_id"]),
-                    "user_name": data["user_name"],
-                    "statistics_kind": data["statistics_kind"],
-                    "category": data["category"],
-                    "store_name": data["store_name"],
-                    "cost_name": data["cost_name"],
-                    "cost": data["cost"],
-                    "unit": data["unit"],
-                    "pay_method": data["pay_method"],
-                    "cost_status": data["cost_status"],
-                    "description": data["description"],
-                    "created_at": data["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
-                } for data in transaction_data[start_index:end_index]
-            ]
-        else:
-            response_data = [
-                {
-                    "id": str(data["_id"]),
-                    "user_name": data["user_name"],
-                    "income_kind": data["income_kind"],
-                    "category": data["category"],
-                    "amount": data["amount"],
-                    "unit": data["unit"],
-                    "payer": data["payer"],
-                    "pay_account": data["pay_account"],
-                    "description": data["description"],
-                    "created_at": data["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
-                } for data in transaction_data[start_index:end_index]
-            ]
-
-        return response_data, max_page
+        match_condition = get_transaction_match_condition(owner_id, query)
+        return await get_transaction_page(collection, match_condition, sort_order, start_index, per_page)
+
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=transaction_key_builder)
+    async def _get_transaction_cursor_data(
+        collection: Accounting | IncomeAccounting,
+        owner_id: int,
+        query: Dict[str, Any],
+        sort_order: List[Tuple[str, int]],
+        cursor: str | None,
+        per_page: int
+    ):
+        """
+        取得記帳資料 (游標分頁)
+
+        Returns:
+            response_data: 記帳資料
+            next_cursor, 下一頁游標 (沒有下一頁時為 None)
+        """
+        match_condition = get_transaction_match_condition(owner_id, query)
+        return await get_transaction_cursor_page(collection, match_condition, sort_order, cursor, per_page)
 
     try:
-        # 檢查使用者登入方式
-        payload = request.state.payload
-        user_name = payload.get("username")
-        line_user_id = payload.get("line_user_id", None)
-        login_method = check_user_login_method(payload)
+        owner_id = request.state.principal.user_id
 
         oper = query.oper
-        if oper in "01":
+        if oper in "01" and query.cursor_mode:
+            response_data, next_cursor = await _get_transaction_cursor_data(
+                Accounting if oper == "0" else IncomeAccounting,
+                owner_id,
+                query_conditions,
+                sort_order,
+                query.cursor,
+                per_page
+            )
+            return JSONResponse(status_code=200, content={"success": True, "data": response_data, "next_cursor": next_cursor})
+
+        elif oper in "01":
             response_data, max_page = await _get_transaction_data(
                 Accounting if oper == "0" else IncomeAccounting,
-                user_name,
-                line_user_id,
-                login_method,
+                owner_id,
                 query_conditions,
                 sort_order,
                 start_index,
-                end_index
+                per_page
             )
             return JSONResponse(status_code=200, content={"success": True, "data": response_data, "max_page": max_page})
 
         else:
             return JSONResponse(status_code=404, content={"success": True, "message": "找不到相應的頁面"})
 
+    except InvalidCursorError as e:
+        return JSONResponse(status_code=400, content={"success": False, "message": e.message})
+
     except Exception as e:
         print(f'error: {e}')
         return JSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者交易紀錄"})
 
 
+@router.post("/import")
+@verify_jwt_token
+async def import_users_accounting(
+    request: Request,
+    file: UploadFile = File(...),
+    oper: str = Form("0"),
+    timezone: str = Form("UTC+8"),
+    user_name: str | None = Form(None),
+    dry_run: bool = Form(False),
+    batch_size: int = Form(IMPORT_BATCH_SIZE, ge=1, le=10000)
+):
+    """
+      :router 批次匯入記帳資料 (CSV / JSON / NDJSON)
+
+      註:
+        - oper: 0 為支出 (欄位同 /create), 1 為收入 (欄位同 /create/income); 時間欄位為 user_time_data
+        - 每筆資料未填寫 timezone / user_name 時使用表單的值
+        - dry_run 只驗證資料並回傳錯誤明細, 不寫入
+        - 寫入中途失敗時回傳 500 與已寫入的筆數 (data.inserted, data.aborted)
+    """
+    import_format = get_import_format(file.filename)
+    if oper not in ("0", "1") or import_format is None:
+        return JSONResponse(status_code=400, content={"success": False, "message": "僅支援匯入 csv, json, ndjson 檔案"})
+
+    try:
+        principal = request.state.principal
+        owner_id = principal.user_id
+        login_method = check_user_login_method(request.state.payload)
+        line_user_id = request.state.payload.get("line_user_id") if login_method in ["bind", "line"] else None
+
+        defaults = {"timezone": timezone}
+        if user_name:
+            defaults["user_name"] = user_name
+
+        collection = Accounting if oper == "0" else IncomeAccounting
+        if collection is Accounting and not dry_run:
+            await prepare_month_spend(owner_id)
+
+        result = await run_blocking(
+            import_transactions, collection, file.file, import_format,
+            owner_id, defaults, line_user_id, dry_run, batch_size
+        )
+
+        # 寫入中斷時, 中斷前的批次已寫入 (快取版本號一律遞增, 避免中斷的批次有部分寫入)
+        if (result.inserted or result.aborted) and not dry_run:
+            await bump_cache_generation(owner_id)
+            await incr_unseen_records(owner_id, result.inserted)
+            if collection is Accounting:
+                await track_expense_delta(owner_id, result.month_cost)
+
+        if result.aborted:
+            return JSONResponse(status_code=500, content={
+                "success": False, "message": "匯入中斷, 已寫入的資料不會回復", "data": result.to_dict(dry_run)})
+        return JSONResponse(status_code=200, content={"success": result.error_count == 0, "data": result.to_dict(dry_run)})
+
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"success": False, "message": f"檔案格式錯誤: {e}"})
+
+    except Exception as e:
+        print(f'error: {e}')
+        return JSONResponse(status_code=500, content={"success": False, "message": "匯入記帳資料失敗"})
+
+    finally:
+        await file.close()
+
+
+@router.post("/bulk/update")
+@verify_jwt_token
+async def bulk_update_accounting(request: Request, data: BulkUpdateRequest):
+    """
+      :router 批次更新記帳資料 (以 ids 或 filters 選擇資料, 套用相同的欄位變更)
+    """
+    if data.oper not in ("0", "1"):
+        return JSONResponse(status_code=404, content={"success": True, "message": "找不到相應的頁面"})
+
+    try:
+        owner_id = request.state.principal.user_id
+        collection = Accounting if data.oper == "0" else IncomeAccounting
+        changes_schema = AccountingBulkChanges if collection is Accounting else IncomeBulkChanges
+        changes = changes_schema.model_validate(data.changes).model_dump(exclude_unset=True)
+        if not changes:
+            return JSONResponse(status_code=400, content={"success": False, "message": "未指定更新欄位"})
+        match_condition = get_bulk_match_condition(owner_id, data.ids, data.filters)
+
+    except (ValidationError, InvalidId, ValueError) as e:
+        return JSONResponse(status_code=400, content={"success": False, "message": f"參數錯誤: {e}"})
+
+    try:
+        if collection is Accounting:
+            await prepare_month_spend(owner_id)
+        counts, cost_delta = await run_blocking(bulk_update_records, collection, match_condition, changes)
+
+        if counts["modified"]:
+            await bump_cache_generation(owner_id)
+            await incr_unseen_records(owner_id, counts["modified"])
+            await track_expense_delta(owner_id, cost_delta)
+        return JSONResponse(status_code=200, content={"success": True, "data": counts, "message": "批次更新資料成功"})
+
+    except Exception as e:
+        print(f'error: {e}')
+        return JSONResponse(status_code=500, content={"success": False, "message": "批次更新資料失敗"})
+
+
+@router.post("/bulk/delete")
+@verify_jwt_token
+async def bulk_delete_accounting(request: Request, data: BulkDeleteRequest):
+    """
+      :router 批次刪除記帳資料 (以 ids 或 filters 選擇資料)
+    """
+    if data.oper not in ("0", "1"):
+        return JSONResponse(status_code=404, content={"success": True, "message": "找不到相應的頁面"})
+
+    try:
+        owner_id = request.state.principal.user_id
+        collection = Accounting if data.oper == "0" else IncomeAccounting
+        match_condition = get_bulk_match_condition(owner_id, data.ids, data.filters)
+
+    except (InvalidId, ValueError) as e:
+        return JSONResponse(status_code=400, content={"success": False, "message": f"參數錯誤: {e}"})
+
+    try:
+        if collection is Accounting:
+            await prepare_month_spend(owner_id)
+        counts, cost_delta = await run_blocking(bulk_delete_records, collection, match_condition)
+
+        if counts["deleted"]:
+            await bump_cache_generation(owner_id)
+            await track_expense_delta(owner_id, cost_delta)
+        return JSONResponse(status_code=200, content={"success": True, "data": counts, "message": "批次刪除資料成功"})
+
+    except Exception as e:
+        print(f'error: {e}')
+        return JSONResponse(status_code=500, content={"success": False, "message": "批次刪除資料失敗"})
+
+
 # - 記帳支出相關操作 -
 @router.post("/create")
 @verify_jwt_token
@@ -171,6 +320,7 @@ async def create_users_accounting(request: Request, data: AccountingCreate):
 
         # 以後可以做序列化的方式處理
         record = Accounting(
+            owner_id=request.state.principal.user_id,
             statistics_kind=data.statistics_kind,
             category=data.category,
             user_name=data.user_name,
@@ -187,7 +337,11 @@ async def create_users_accounting(request: Request, data: AccountingCreate):
             updated_at=utc_time
         )
 
-        record.save()
+        await prepare_month_spend(record.owner_id)
+        await run_blocking(_save_record, Accounting, record)
+        await bump_cache_generation(record.owner_id)
+        await incr_unseen_records(record.owner_id)
+        await track_expense_delta(record.owner_id, current_month_cost(record))
         return JSONResponse(status_code=201, content={"success": True, "message": "新增資料成功"})
 
     except Exception as e:
@@ -210,8 +364,8 @@ async def update_users_accounting(request: Request, data: AccountingUpdate):
         login_method = check_user_login_method(payload)
 
         # 先限定只有本人可以更新資料
-        record = Accounting.objects.get(id=ObjectId(
-            data.id), user_name=data.user_name)
+        record = await run_blocking(Accounting.objects.get, id=ObjectId(
+            data.id), owner_id=request.state.principal.user_id)
         utc_time = convert_to_utc_datetime(data.user_time_data, data.timezone)
 
         # 根據登入方式設定 line_user_id
@@ -233,7 +387,12 @@ async def update_users_accounting(request: Request, data: AccountingUpdate):
             "description": data.description,
             "created_at": utc_time
         }
-        record.update(**{f"set__{k}": v for k, v in update_fields.items()})
+        old_month_cost = current_month_cost(record)
+        await prepare_month_spend(record.owner_id)
+        await run_blocking(_update_record, Accounting, record, update_fields)
+        await bump_cache_generation(record.owner_id)
+        await incr_unseen_records(record.owner_id)
+        await track_expense_delta(record.owner_id, current_month_cost(record) - old_month_cost)
 
     except Accounting.DoesNotExist:
         return JSONResponse(status_code=404, content={"success": False, "message": "Data not found"})
@@ -256,10 +415,13 @@ async def delete_users_accounting(request: Request, data: AccountingDelete):
 
     try:
         # 先判斷只有使用者本人才可以做刪除操作
-        record = Accounting.objects(id=ObjectId(
-            data.id), user_name=data.user_name).first()
+        record = await run_blocking(Accounting.objects(id=ObjectId(
+            data.id), owner_id=request.state.principal.user_id).first)
         if record:
-            record.delete()
+            await prepare_month_spend(record.owner_id)
+            await run_blocking(_delete_record, Accounting, record)
+            await bump_cache_generation(record.owner_id)
+            await track_expense_delta(record.owner_id, -current_month_cost(record))
         else:
             return JSONResponse(status_code=404, content={"success": False, "message": "找不到對應的刪除資料或是非使用者本人操作"})
 
@@ -291,6 +453,7 @@ async def create_income_accounting(request: Request, data: IncomeCreate):
 
         # 以後可以做序列化的方式處理
         record = IncomeAccounting(
+            owner_id=request.state.principal.user_id,
             income_kind=data.income_kind,
             category=data.category,
             user_name=data.user_name,
@@ -304,7 +467,9 @@ async def create_income_accounting(request: Request, data: IncomeCreate):
             updated_at=utc_time
         )
 
-        record.save()
+        await run_blocking(_save_record, IncomeAccounting, record)
+        await bump_cache_generation(record.owner_id)
+        await incr_unseen_records(record.owner_id)
         return JSONResponse(status_code=201, content={"success": True, "message": "新增資料成功"})
 
     except Exception as e:
@@ -328,8 +493,8 @@ async def update_income_accounting(request: Request, data: IncomeUpdate):
         login_method = check_user_login_method(payload)
 
         # 先限定只有本人可以更新資料
-        record = IncomeAccounting.objects.get(id=ObjectId(
-            data.id), user_name=data.user_name)
+        record = await run_blocking(IncomeAccounting.objects.get, id=ObjectId(
+            data.id), owner_id=request.state.principal.user_id)
         utc_time = convert_to_utc_datetime(data.user_time_data, data.timezone)
 
         # 根據登入方式設定 line_user_id
@@ -348,7 +513,9 @@ async def update_income_accounting(request: Request, data: IncomeUpdate):
             "description": data.description,
             "created_at": utc_time,
         }
-        record.update(**{f"set__{k}": v for k, v in update_fields.items()})
+        await run_blocking(_update_record, IncomeAccounting, record, update_fields)
+        await bump_cache_generation(record.owner_id)
+        await incr_unseen_records(record.owner_id)
 
     except IncomeAccounting.DoesNotExist as e:
         print(e)
@@ -371,10 +538,11 @@ async def delete_income_accounting(request: Request, data: IncomeDelete):
 
     try:
         # 先判斷只有使用者本人才可以做刪除操作
-        record = IncomeAccounting.objects(id=ObjectId(
-            data.id), user_name=data.user_name).first()
+        record = await run_blocking(IncomeAccounting.objects(id=ObjectId(
+            data.id), owner_id=request.state.principal.user_id).first)
         if record:
-            record.delete()
+            await run_blocking(_delete_record, IncomeAccounting, record)
+            await bump_cache_generation(record.owner_id)
         else:
             return JSONResponse(status_code=404, content={"success": False, "message": "找不到對應的刪除資料或是非使用者本人操作"})
 
@@ -1,32 +1,370 @@
 # Fastapi
 from fastapi import APIRouter, Depends, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 # Databases & Schemas
-from app.schemas.dashboard import TimeInfo, DashboardMenuInfo
-from app.models.mongo_model import Accounting, IncomeAccounting
+from app.schemas.dashboard import TimeInfo, DashboardMenuInfo, DashboardRemainingInfo, DashboardBundleInfo
+from app.models.mongo_model import Accounting, IncomeAccounting, MonthlySummary
+from app.databases.mongo_setting import get_async_mongo_db
 
 from app.databases.mysql_setting import connect_mysql
-from app.models.sql_model import User, UserBudgetSetting
+from app.models.sql_model import UserBudgetSetting
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 # JWT
-from app.utils.jwt_verification import verify_jwt_token
+from app.utils.jwt_verification import verify_jwt_token, Principal
 
 # cache & key builder
 from fastapi_cache.decorator import cache
 from app.utils.cachekey import dashboard_balance_key_builder
 
 # Tools
-from app.utils.attach_info import verify_utc_time, convert_to_utc_datetime, check_user_login_method
+from app.utils.attach_info import verify_utc_time, convert_to_utc_datetime
+from app.utils.threadpool import run_blocking
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
+import asyncio
 
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
-_CACHE_MEMORY_TIME = 300  # (s)
+_CACHE_MEMORY_TIME = 6 * 60 * 60  # (s), 記帳資料異動時以使用者快取版本號失效
+_TOP_EXPENSE_KIND_COUNT = 3  # 剩餘區塊預設顯示的支出類別數量
+
+
+# -- 儀錶板共用查詢 (各區塊以 $facet 分支組成, bundle 時每個 collection 只需查詢一次) --
+def _get_match_condition(owner_id: int) -> Dict[str, Any]:
+    """設定使用者查詢條件 (所有登入方式皆以 owner_id 查詢)"""
+    return {"owner_id": owner_id}
+
+
+def _in_range(start_time: datetime, end_time: datetime) -> Dict[str, Any]:
+    """判斷 created_at 是否在時間範圍內 (aggregate 條件)"""
+    return {"$and": [
+        {"$gte": ["$created_at", start_time]},
+        {"$lt": ["$created_at", end_time]}
+    ]}
+
+
+async def _run_facets(collection: Accounting | IncomeAccounting, match_condition: Dict[str, Any], facets: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    以單一 aggregate ($facet) 取得多個區塊的統計結果 (async client, 不阻塞 event loop)
+
+    Returns:
+        各 facet 名稱對應的結果列表
+    """
+    cursor = await get_async_mongo_db()[collection._get_collection_name()].aggregate([
+        {"$match": match_condition},
+        {"$facet": facets}
+    ])
+    result = await cursor.to_list(1)
+    return result[0] if result else {name: [] for name in facets}
+
+
+def _get_menu_range_facet() -> List[Dict[str, Any]]:
+    """使用者最早與最新紀錄時間 (所有幣別)"""
+    return [
+        {"$group": {"_id": None, "first": {"$min": "$created_at"},
+                    "last": {"$max": "$created_at"}}}
+    ]
+
+
+def _build_menu(menu_range: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    取得選單列表資料
+
+    Returns:
+        (month_menu, year_menu)
+    """
+    if not menu_range or not menu_range[0]["first"] or not menu_range[0]["last"]:
+        now = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        return ["全部", now.strftime("%Y-%m")], [str(now.year)]
+
+    first_date = menu_range[0]["first"].replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_date = menu_range[0]["last"].replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    # 月份選單：由最新到最舊
+    month_menu = ["全部"]
+    current = last_date
+    while current >= first_date:
+        month_menu.append(current.strftime("%Y-%m"))
+        current -= relativedelta(months=1)
+
+    # 年份選單
+    year_menu = [str(year) for year in range(
+        last_date.year, first_date.year - 1, -1)]
+
+    return month_menu, year_menu
+
+
+def _get_menu_data(expense_range: List[Dict[str, Any]], income_range: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """組合收入 & 支出 & 年度統計選單"""
+    expense_month_menu, expense_year_menu = _build_menu(expense_range)
+    income_month_menu, income_year_menu = _build_menu(income_range)
+
+    return {
+        'expense_menu': expense_month_menu,
+        'income_menu': income_month_menu,
+        'year_statistics_menu': income_year_menu if len(income_year_menu) > len(expense_year_menu) else expense_year_menu
+    }
+
+
+def _get_balance_facet(amount_field: str, start_time: datetime, end_time: datetime, with_bonus: bool = False) -> List[Dict[str, Any]]:
+    """總金額 & 上個月金額 (收入另外計算上個月獎金)"""
+    group = {
+        "_id": None,
+        "total": {"$sum": f"${amount_field}"},
+        "last_month": {"$sum": {"$cond": [_in_range(start_time, end_time), f"${amount_field}", 0]}}
+    }
+    if with_bonus:
+        group["last_month_bonus"] = {"$sum": {"$cond": [
+            {"$and": [_in_range(start_time, end_time), {
+                "$eq": ["$income_kind", "獎金"]}]},
+            f"${amount_field}", 0
+        ]}}
+
+    return [
+        # - 此處未來需要處理匯率類型, 先以 TWD 為主 -
+        {"$match": {"unit": "TWD"}},
+        {"$group": group}
+    ]
+
+
+def _get_balance_data(expense_balance: List[Dict[str, Any]], income_balance: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    計算方式:
+        - 總餘額 = 總收入 - 總支出
+    """
+    expense_result = expense_balance[0] if expense_balance else {
+        "total": 0, "last_month": 0}
+    income_result = income_balance[0] if income_balance else {
+        "total": 0, "last_month": 0, "last_month_bonus": 0}
+
+    return {
+        "total_balance": income_result["total"] - expense_result["total"],
+        "last_month_expenses": expense_result["last_month"],
+        "last_month_incomes": income_result["last_month"],
+        "last_month_bonus": income_result["last_month_bonus"]
+    }
+
+
+def _get_menu_time_range(menu: str, utc_time: datetime) -> Tuple[datetime, datetime]:
+    """
+    取得選單對應的本月份時間範圍
+    ("全部" 為使用者目前所在月份, 其餘為 yyyy-mm 月份)
+    """
+    if menu == "全部":
+        current_start_time = utc_time
+    else:
+        current_start_time = datetime.strptime(menu, "%Y-%m")
+    return current_start_time, current_start_time + relativedelta(months=1)
+
+
+def _get_kind_facets(prefix: str, kind_field: str, amount_field: str, menu: str, current_start_time: datetime, current_end_time: datetime) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    選單範圍內各類別金額 (含本月份金額) & 上個月份總金額
+
+    Returns:
+        {f"{prefix}_kinds": ..., f"{prefix}_last_month": ...}
+    """
+    kind_match = {"unit": "TWD"}
+    if menu != "全部":
+        kind_match["created_at"] = {
+            "$gte": current_start_time, "$lt": current_end_time}
+
+    last_start_time = current_start_time - relativedelta(months=1)
+    return {
+        f"{prefix}_kinds": [
+            {"$match": kind_match},
+            {"$group": {
+                "_id": f"${kind_field}",
+                "total": {"$sum": f"${amount_field}"},
+                "current_month": {"$sum": {"$cond": [_in_range(current_start_time, current_end_time), f"${amount_field}", 0]}}
+            }}
+        ],
+        f"{prefix}_last_month": [
+            {"$match": {"unit": "TWD", "created_at": {
+                "$gte": last_start_time, "$lt": current_start_time}}},
+            {"$group": {"_id": None, "total": {"$sum": f"${amount_field}"}}}
+        ]
+    }
+
+
+def _get_income_data(income_kinds: List[Dict[str, Any]], income_last_month: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """計算全部收入, 薪資, 獎金, 其他 (含本月收入) 與成長率 & 成長金額"""
+    data = {
+        "total_income": 0, "incr_percent": 0.0,
+        "incr_income": 0, "total_salary": 0,
+        "total_bouns": 0, "others": 0
+    }
+
+    current_month_income = 0
+    for kind in income_kinds:
+        amount = kind["total"]
+        if kind["_id"] == "薪資":
+            data["total_salary"] += amount
+        elif kind["_id"] == "獎金":
+            data["total_bouns"] += amount
+        else:
+            data["others"] += amount
+        data["total_income"] += amount
+        current_month_income += kind["current_month"]
+
+    last_month_income = income_last_month[0]["total"] if income_last_month else 0
+    data["incr_income"] = current_month_income - last_month_income
+    data["incr_percent"] = round(
+        data["incr_income"] * 100 / last_month_income, 2) if last_month_income > 0 else 0.0
+
+    return data
+
+
+async def _get_budget_setting(sqldb: Session, principal: Principal) -> Tuple[bool, Any]:
+    """
+    取得預算設定 (SQLAlchemy 為阻塞操作, 交由 thread pool 執行)
+    註: verify_jwt_token 已確保 principal.user_id 存在, 直接以 user_id 查詢, 不需 join User
+
+    Returns:
+        (is_open_plan, budget)
+    """
+    budget_sql = select(UserBudgetSetting.is_open_plan, UserBudgetSetting.budget).where(
+        UserBudgetSetting.user_id == principal.user_id)
+    result = (await run_blocking(sqldb.execute, budget_sql)).first()
+    if result:
+        return result[0], result[1]
+    return False, 0
+
+
+def _get_expense_data(expense_kinds: List[Dict[str, Any]], expense_last_month: List[Dict[str, Any]], budget_setting: Tuple[bool, Any]) -> Dict[str, Any]:
+    """計算全部支出, 各類別支出 (含本月支出), 支出成長率與預算使用率"""
+    data = {
+        "total_expense": 0, "incr_expense_percent": 0.0,
+        "top_expense_kind": "", "top_expense_amout": 0,
+        "is_open_budget_setting": False,
+        "month_budget": 0, "budget_use_percent": 0.0
+    }
+
+    current_month_expense = 0
+    for kind in expense_kinds:
+        data["total_expense"] += kind["total"]
+        current_month_expense += kind["current_month"]
+
+    if expense_kinds:
+        top_expense_item = sorted(
+            expense_kinds, key=lambda item: item["total"], reverse=True)[0]
+        data["top_expense_kind"], data["top_expense_amout"] = top_expense_item["_id"], top_expense_item["total"]
+    #
+
+    # 上個月份時間範圍 (計算支出成長率)
+    last_month_expense = expense_last_month[0]["total"] if expense_last_month else 0
+    diff_expense = current_month_expense - last_month_expense
+    data["incr_expense_percent"] = round(
+        diff_expense * 100 / last_month_expense, 2) if last_month_expense > 0 else 0.0
+    #
+
+    # 預算設定相關
+    is_open_plan, budget = budget_setting
+    data["is_open_budget_setting"] = is_open_plan
+    data["month_budget"] = int(budget) if budget else 0
+
+    if data["month_budget"] > 0:
+        data["budget_use_percent"] = round(
+            current_month_expense * 100 / data["month_budget"], 2)
+    else:
+        data["budget_use_percent"] = 0.0
+
+    return data
+
+
+async def _get_year_data(match_condition: Dict[str, Any], year: str) -> Dict[str, List[int]]:
+    """由每月統計表取得年度各月份收入 & 支出金額"""
+    start_time = datetime.strptime(year, "%Y")
+    end_time = start_time + relativedelta(years=1)
+
+    data = {'income': [0] * 12, 'expense': [0] * 12}
+    datas = await get_async_mongo_db()[MonthlySummary._get_collection_name()].aggregate([
+        {"$match": {
+            **match_condition, "unit": "TWD",
+            "month": {"$gte": start_time, "$lt": end_time}
+        }},
+        {"$group": {
+            "_id": {"record_type": "$record_type", "month": "$month"},
+            "total": {"$sum": "$total"}
+        }}
+    ])
+    async for d in datas:
+        data[d["_id"]["record_type"]][d["_id"]["month"].month - 1] += d["total"]
+    return data
+
+
+def _get_remaining_facet(current_start_time: datetime, current_end_time: datetime, top_n: int = _TOP_EXPENSE_KIND_COUNT) -> List[Dict[str, Any]]:
+    """
+    本月份總支出 & 支出前 N 高類別 (含必要/想要金額), 於資料庫端一次計算完成
+        - 必要: cost_status 為 0 (必要), 2 (臨時必要)
+        - 想要: cost_status 為 1 (想要), 3 (臨時想要)
+    """
+    def _sum_status(status: List[int]) -> Dict[str, Any]:
+        return {"$sum": {"$cond": [{"$in": ["$cost_status", status]}, "$cost", 0]}}
+
+    return [
+        {"$match": {"unit": "TWD", "created_at": {
+            "$gte": current_start_time, "$lt": current_end_time}}},
+        {"$group": {
+            "_id": "$statistics_kind",
+            "total_expense": {"$sum": "$cost"},
+            "necessary": _sum_status([0, 2]),
+            "want": _sum_status([1, 3])
+        }},
+        {"$sort": {"total_expense": -1}},
+        {"$group": {
+            "_id": None,
+            "month_total": {"$sum": "$total_expense"},
+            "kinds": {"$push": "$$ROOT"}
+        }},
+        {"$project": {"_id": 0, "month_total": 1,
+                      "top_kinds": {"$slice": ["$kinds", top_n]}}}
+    ]
+
+
+def _get_remaining_data(
+    remaining: List[Dict[str, Any]],
+    current_end_time: datetime,
+    budget_setting: Tuple[bool, Any]
+) -> Dict[str, Any]:
+    """
+    計算剩餘區塊資訊
+        - 本月餘額
+        - 預期每日支出
+        - 平均每日支出
+        - 支出前 N 高類別名稱, 占比, 金額 (必要 & 想要)
+    """
+    is_open_plan, budget = budget_setting
+    result = remaining[0] if remaining else {"month_total": 0, "top_kinds": []}
+    total_expense = result["month_total"]
+
+    data = dict()
+    data["reduce_budget"] = float(round(
+        (budget - total_expense) * 100 / budget, 2)) if budget and budget > 0 else 0.0
+
+    max_day = (current_end_time - timedelta(days=1)).day
+    data["expect_expense_per_day"] = int(
+        round(budget / max_day, 0)) if budget and budget > 0 else 0
+    data["expense_per_day"] = int(round(total_expense / max_day, 0))
+
+    data["top_expense_data"] = [
+        {
+            "kind": top_kind["_id"],
+            "total_expense": top_kind["total_expense"],
+            "percent": round((top_kind["necessary"] + top_kind["want"]) * 100 / total_expense, 0),
+            "necessary": top_kind["necessary"],
+            "want": top_kind["want"]
+        } for top_kind in result["top_kinds"]
+    ]
+
+    return data
+# -- End. --
 
 
 @router.post("/")
@@ -39,85 +377,139 @@ async def get_user_data(request: Request):
         payload (dict), 使用者 token 資訊
     """
     payload = request.state.payload
-    return JSONResponse(status_code=200, content={"success": True, "data": payload})
+    return ORJSONResponse(status_code=200, content={"success": True, "data": payload})
 
 
-@router.post("/date_menu")
+@router.post("/bundle")
 @verify_jwt_token
-async def get_user_dashboard_date_menu(request: Request, timeInfo: TimeInfo):
+async def get_user_dashboard_bundle(request: Request, params: DashboardBundleInfo, sqldb: Session = Depends(connect_mysql)):
     """
-    取得儀錶板首頁選單資料
-        - 支出 & 收入 & 年度統計的選單
-    註: 計算使用者最早有紀錄的月份/年份 ~ 最新紀錄的月份/年份
+    一次取得儀錶板首頁所有區塊資料 (需攜帶時間資訊驗證是否合理)
+    註: 共用一次使用者解析 & 預算設定查詢, 支出/收入各只執行一次 $facet 查詢
+        結果依使用者快取版本號快取, 記帳資料異動後立即失效
 
     Returns:
         data:
-            - income_menu: 收入選單
-            - expense_menu: 支出選單
-            - year_statistics_menu: 年度統計選單
+            - date_menu: 同 /date_menu
+            - balance: 同 /balance/info
+            - income: 同 /income/info (income_menu)
+            - expense: 同 /expense/info (expense_menu)
+            - year_statistics: 同 /year/statistics/info (year_menu)
+            - remaining: 同 /remaining/info
     """
-    if not verify_utc_time(user_utc_time=timeInfo.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
+    if not verify_utc_time(user_utc_time=params.current_utc_time):
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
     # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
+    owner_id = request.state.principal.user_id
 
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    utc_time = convert_to_utc_datetime(params.user_time_data, params.timezone).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
     #
 
-    def _get_menu(collection: Accounting | IncomeAccounting) -> Tuple[List[str], List[str]]:
+    @cache(expire=_CACHE_MEMORY_TIME, key_builder=dashboard_balance_key_builder)
+    async def _get_bundle_data(
+        owner_id: int,
+        utc_time: datetime,
+        income_menu: str,
+        expense_menu: str,
+        year_menu: str | None,
+        remaining_top_n: int,
+        budget_setting: Tuple[bool, Any]
+    ) -> Dict[str, Any]:
         """
-        取得選單列表資料
+        取得儀錶板所有區塊資料 (預算設定作為快取 key 的一部分, 變更預算後會重新計算)
 
-        Returns:
-            (month_menu, year_menu)
+        Args:
+            utc_time (datetime): 使用者當月 1 日 (UTC)
         """
-        if login_method == "bind":
-            query = collection.objects(
-                user_name=user_name, line_user_id=line_user_id).only("created_at")
-        elif login_method == "line":
-            query = collection.objects(
-                line_user_id=line_user_id).only("created_at")
-        else:
-            query = collection.objects(user_name=user_name).only("created_at")
+        match_condition = _get_match_condition(owner_id)
+        month_end_time = utc_time + relativedelta(months=1)
+        last_month_start_time = utc_time - relativedelta(months=1)
+
+        income_start_time, income_end_time = _get_menu_time_range(
+            income_menu, utc_time)
+        expense_start_time, expense_end_time = _get_menu_time_range(
+            expense_menu, utc_time)
+
+        expense_result, income_result = await asyncio.gather(
+            _run_facets(Accounting, match_condition, {
+                "menu_range": _get_menu_range_facet(),
+                "balance": _get_balance_facet("cost", last_month_start_time, utc_time),
+                **_get_kind_facets("expense", "statistics_kind", "cost", expense_menu, expense_start_time, expense_end_time),
+                "remaining": _get_remaining_facet(utc_time, month_end_time, remaining_top_n)
+            }),
+            _run_facets(IncomeAccounting, match_condition, {
+                "menu_range": _get_menu_range_facet(),
+                "balance": _get_balance_facet("amount", last_month_start_time, utc_time, with_bonus=True),
+                **_get_kind_facets("income", "income_kind", "amount", income_menu, income_start_time, income_end_time)
+            })
+        )
 
-        first_data = query.order_by("created_at").first()
-        last_data = query.order_by("-created_at").first()
+        date_menu = _get_menu_data(
+            expense_result["menu_range"], income_result["menu_range"])
+        year_menu = year_menu or date_menu["year_statistics_menu"][0]
+
+        return {
+            "date_menu": date_menu,
+            "balance": _get_balance_data(expense_result["balance"], income_result["balance"]),
+            "income": _get_income_data(income_result["income_kinds"], income_result["income_last_month"]),
+            "expense": _get_expense_data(expense_result["expense_kinds"], expense_result["expense_last_month"], budget_setting),
+            "year_statistics": await _get_year_data(match_condition, year_menu),
+            "remaining": _get_remaining_data(expense_result["remaining"], month_end_time, budget_setting)
+        }
 
-        if not first_data or not last_data:
-            now = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            return ["全部", now.strftime("%Y-%m")], [str(now.year)]
+    try:
+        budget_setting = await _get_budget_setting(
+            sqldb, request.state.principal)
+        data = await _get_bundle_data(
+            owner_id,
+            utc_time,
+            params.income_menu,
+            params.expense_menu,
+            params.year_menu,
+            params.remaining_top_n,
+            budget_setting
+        )
+        return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
-        first_date = first_data.created_at.replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_date = last_data.created_at.replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0)
+    except Exception as e:
+        print(f'error: {e}')
+        return ORJSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者儀錶板資料"})
 
-        # 月份選單：由最新到最舊
-        month_menu = ["全部"]
-        current = last_date
-        while current >= first_date:
-            month_menu.append(current.strftime("%Y-%m"))
-            current -= relativedelta(months=1)
 
-        # 年份選單
-        year_menu = [str(year) for year in range(
-            last_date.year, first_date.year - 1, -1)]
+@router.post("/date_menu")
+@verify_jwt_token
+async def get_user_dashboard_date_menu(request: Request, timeInfo: TimeInfo):
+    """
+    取得儀錶板首頁選單資料
+        - 支出 & 收入 & 年度統計的選單
+    註: 計算使用者最早有紀錄的月份/年份 ~ 最新紀錄的月份/年份
 
-        return month_menu, year_menu
+    Returns:
+        data:
+            - income_menu: 收入選單
+            - expense_menu: 支出選單
+            - year_statistics_menu: 年度統計選單
+    """
+    if not verify_utc_time(user_utc_time=timeInfo.current_utc_time):
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
-    expense_month_menu, expense_year_menu = _get_menu(Accounting)
-    income_month_menu, income_year_menu = _get_menu(IncomeAccounting)
+    # 使用者參數處理
+    owner_id = request.state.principal.user_id
+    match_condition = _get_match_condition(owner_id)
+    #
 
-    data = {
-        'expense_menu': expense_month_menu,
-        'income_menu': income_month_menu,
-        'year_statistics_menu': income_year_menu if len(income_year_menu) > len(expense_year_menu) else expense_year_menu
-    }
-    return JSONResponse(status_code=200, content={"success": True, "data": data})
+    expense_result, income_result = await asyncio.gather(
+        _run_facets(Accounting, match_condition, {
+                    "menu_range": _get_menu_range_facet()}),
+        _run_facets(IncomeAccounting, match_condition, {
+                    "menu_range": _get_menu_range_facet()})
+    )
+
+    data = _get_menu_data(
+        expense_result["menu_range"], income_result["menu_range"])
+    return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
 
 # -- TODO: 以下 Route 的 DB 連線與 時間可以包裝成共用的 cache function --
@@ -133,15 +525,11 @@ async def get_user_balance_information(request: Request, timeInfo: TimeInfo):
         data, 總餘額頁面所需的資訊
     """
     if not verify_utc_time(user_utc_time=timeInfo.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
     # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    owner_id = request.state.principal.user_id
+    match_condition = {**_get_match_condition(owner_id), "unit": "TWD"}
 
     # 判斷上個月狀況使用
     utc_time = convert_to_utc_datetime(
@@ -151,49 +539,22 @@ async def get_user_balance_information(request: Request, timeInfo: TimeInfo):
     start_time = end_time - relativedelta(months=1)
     #
 
-    def _in_last_month(created_at: datetime):
-        """判斷是否在當前月份內"""
-        return start_time <= created_at < end_time
-
     try:
-        data = dict()
-        # - 此處未來需要處理匯率類型, 先以 TWD 為主 -
-        if login_method == "bind":
-            expenses = Accounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD")
-            incomes = IncomeAccounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD")
-        elif login_method == "line":
-            expenses = Accounting.objects(
-                line_user_id=line_user_id, unit="TWD")
-            incomes = IncomeAccounting.objects(
-                line_user_id=line_user_id, unit="TWD")
-        else:
-            expenses = Accounting.objects(user_name=user_name, unit="TWD")
-            incomes = IncomeAccounting.objects(user_name=user_name, unit="TWD")
-
-        # 總餘額
-        total_expenses = sum(x.cost for x in expenses)
-        total_incomes = sum(x.amount for x in incomes)
-        data["total_balance"] = total_incomes - total_expenses
-
-        # 上個月收入, 獎金, 支出
-        last_month_expenses = sum(
-            x.cost for x in expenses if _in_last_month(x.created_at))
-        last_month_incomes = sum(
-            x.amount for x in incomes if _in_last_month(x.created_at))
-        last_month_bonus = sum(
-            x.amount for x in incomes if x.income_kind == "獎金" and _in_last_month(x.created_at))
-
-        data["last_month_expenses"] = last_month_expenses
-        data["last_month_incomes"] = last_month_incomes
-        data["last_month_bonus"] = last_month_bonus
+        # 總支出 & 上個月支出 / 總收入 & 上個月收入, 獎金 (僅回傳加總結果, 不取回整份文件)
+        expense_result, income_result = await asyncio.gather(
+            _run_facets(Accounting, match_condition, {
+                "balance": _get_balance_facet("cost", start_time, end_time)}),
+            _run_facets(IncomeAccounting, match_condition, {
+                "balance": _get_balance_facet("amount", start_time, end_time, with_bonus=True)})
+        )
 
-        return JSONResponse(status_code=200, content={"success": True, "data": data})
+        data = _get_balance_data(
+            expense_result["balance"], income_result["balance"])
+        return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
     except Exception as e:
         print(f'error: {e}')
-        return JSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者儀錶板資料"})
+        return ORJSONResponse(status_code=500, content={"success": False, "message": "無法取得使用者儀錶板資料"})
 
 
 @router.post("/income/info")
@@ -209,88 +570,26 @@ async def get_user_income_information(request: Request, params: DashboardMenuInf
         data, 總餘額頁面所需的資訊
     """
     if not verify_utc_time(user_utc_time=params.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
     # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    owner_id = request.state.principal.user_id
+    match_condition = {**_get_match_condition(owner_id), "unit": "TWD"}
 
     menu: str = params.menu  # "全部" | "yyyy-mm"
     utc_time = convert_to_utc_datetime(params.user_time_data, params.timezone).replace(
         day=1, hour=0, minute=0, second=0, microsecond=0)
     #
 
-    data = {
-        "total_income": 0, "incr_percent": 0.0,
-        "incr_income": 0, "total_salary": 0,
-        "total_bouns": 0, "others": 0
-    }
-
-    if menu == "全部":
-        # 本月份時間範圍
-        current_start_time = utc_time
-        current_end_time = utc_time + relativedelta(months=1)
-        if login_method == "bind":
-            income_data = IncomeAccounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD")
-        elif login_method == "line":
-            income_data = IncomeAccounting.objects(
-                line_user_id=line_user_id, unit="TWD")
-        else:
-            income_data = IncomeAccounting.objects(
-                user_name=user_name, unit="TWD")
-    else:
-        # 本月份時間範圍
-        current_start_time = datetime.strptime(menu, "%Y-%m")
-        current_end_time = current_start_time + relativedelta(months=1)
-        if login_method == "bind":
-            income_data = IncomeAccounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
-        elif login_method == "line":
-            income_data = IncomeAccounting.objects(
-                line_user_id=line_user_id, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
-        else:
-            income_data = IncomeAccounting.objects(
-                user_name=user_name, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
-
-    # 計算全部收入, 薪資, 獎金, 其他 (含本月收入)
-    current_month_income = 0
-    for d in income_data:
-        amount = d.amount
-        if d.income_kind == "薪資":
-            data["total_salary"] += amount
-        elif d.income_kind == "獎金":
-            data["total_bouns"] += amount
-        else:
-            data["others"] += amount
-        data["total_income"] += amount
-
-        if current_start_time <= d.created_at < current_end_time:
-            current_month_income += amount
-    #
-
-    # 上個月份時間範圍 (計算成長率 & 成長金額)
-    last_start_time = current_start_time - relativedelta(months=1)
-    if login_method == "bind":
-        last_month_income = IncomeAccounting.objects(
-            user_name=user_name, line_user_id=line_user_id, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('amount')
-    elif login_method == "line":
-        last_month_income = IncomeAccounting.objects(
-            line_user_id=line_user_id, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('amount')
-    else:
-        last_month_income = IncomeAccounting.objects(
-            user_name=user_name, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('amount')
+    # 本月份時間範圍
+    current_start_time, current_end_time = _get_menu_time_range(
+        menu, utc_time)
+    income_result = await _run_facets(IncomeAccounting, match_condition, _get_kind_facets(
+        "income", "income_kind", "amount", menu, current_start_time, current_end_time))
 
-    data["incr_income"] = current_month_income - last_month_income
-    data["incr_percent"] = round(
-        data["incr_income"] * 100 / last_month_income, 2) if last_month_income > 0 else 0.0
-    #
-
-    return JSONResponse(status_code=200, content={"success": True, "data": data})
+    data = _get_income_data(
+        income_result["income_kinds"], income_result["income_last_month"])
+    return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
 
 @router.post("/expense/info")
@@ -306,126 +605,29 @@ async def get_user_expense_information(request: Request, params: DashboardMenuIn
         data, 總餘額頁面所需的資訊
     """
     if not verify_utc_time(user_utc_time=params.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
     # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    owner_id = request.state.principal.user_id
+    match_condition = {**_get_match_condition(owner_id), "unit": "TWD"}
 
     menu: str = params.menu  # "全部" | "yyyy-mm"
     utc_time = convert_to_utc_datetime(params.user_time_data, params.timezone).replace(
         day=1, hour=0, minute=0, second=0, microsecond=0)
     #
 
-    data = {
-        "total_expense": 0, "incr_expense_percent": 0.0,
-        "top_expense_kind": "", "top_expense_amout": 0,
-        "is_open_budget_setting": False,
-        "month_budget": 0, "budget_use_percent": 0.0
-    }
-    if menu == "全部":
-        # 本月份時間範圍
-        current_start_time = utc_time
-        current_end_time = utc_time + relativedelta(months=1)
-        if login_method == "bind":
-            expense_data = Accounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD")
-        elif login_method == "line":
-            expense_data = Accounting.objects(
-                line_user_id=line_user_id, unit="TWD")
-        else:
-            expense_data = Accounting.objects(user_name=user_name, unit="TWD")
-
-    else:
-        # 本月份時間範圍
-        current_start_time = datetime.strptime(menu, "%Y-%m")
-        current_end_time = current_start_time + relativedelta(months=1)
-        if login_method == "bind":
-            expense_data = Accounting.objects(
-                user_name=user_name, line_user_id=line_user_id, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
-        elif login_method == "line":
-            expense_data = Accounting.objects(
-                line_user_id=line_user_id, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
-        else:
-            expense_data = Accounting.objects(
-                user_name=user_name, unit="TWD", created_at__gte=current_start_time, created_at__lt=current_end_time)
+    # 本月份時間範圍
+    current_start_time, current_end_time = _get_menu_time_range(
+        menu, utc_time)
+    expense_result = await _run_facets(Accounting, match_condition, _get_kind_facets(
+        "expense", "statistics_kind", "cost", menu, current_start_time, current_end_time))
 
-    # 計算全部支出, 各類別支出 (含本月支出)
-    current_month_expense = 0
-    each_expense_kind = dict()
-
-    for d in expense_data:
-        statistics_kind, cost = d.statistics_kind, d.cost
-
-        data["total_expense"] += cost
-        each_expense_kind[statistics_kind] = each_expense_kind.get(
-            statistics_kind, 0) + cost
-
-        if current_start_time <= d.created_at < current_end_time:
-            current_month_expense += cost
-
-    if each_expense_kind.items():
-        top_expense_item: tuple = sorted(
-            each_expense_kind.items(), key=lambda item: item[1], reverse=True)[0]
-        data["top_expense_kind"], data["top_expense_amout"] = top_expense_item[0], top_expense_item[1]
-    else:
-        data["top_expense_kind"], data["top_expense_amout"] = "", 0
-    #
-
-    # 上個月份時間範圍 (計算支出成長率)
-    last_start_time = current_start_time - relativedelta(months=1)
-    if login_method == "bind":
-        last_month_expense = Accounting.objects(
-            user_name=user_name, line_user_id=line_user_id, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('cost')
-    elif login_method == "line":
-        last_month_expense = Accounting.objects(
-            line_user_id=line_user_id, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('cost')
-    else:
-        last_month_expense = Accounting.objects(
-            user_name=user_name, unit="TWD", created_at__gte=last_start_time, created_at__lt=current_start_time).sum('cost')
-
-    diff_expense = current_month_expense - last_month_expense
-    data["incr_expense_percent"] = round(
-        diff_expense * 100 / last_month_expense, 2) if last_month_expense > 0 else 0.0
-    #
-
-    # 預算設定相關
-    if login_method == "bind" or login_method == "password":
-        where_condition = User.username == user_name
-    elif login_method == "line":
-        where_condition = User.line_user_id == line_user_id
-    else:
-        where_condition = User.username == user_name
-
-    join_sql = (
-        select(
-            UserBudgetSetting.is_open_plan,
-            UserBudgetSetting.budget
-        )
-        .select_from(User)
-        .join(UserBudgetSetting, User.id == UserBudgetSetting.user_id)
-        .where(where_condition)
+    data = _get_expense_data(
+        expense_result["expense_kinds"],
+        expense_result["expense_last_month"],
+        await _get_budget_setting(sqldb, request.state.principal)
     )
-    result = sqldb.execute(join_sql).first()
-    if result:
-        is_open_plan, budget = result
-    else:
-        is_open_plan, budget = False, 0
-
-    data["is_open_budget_setting"] = is_open_plan
-    data["month_budget"] = int(budget) if budget else 0
-
-    if data["month_budget"] > 0:
-        data["budget_use_percent"] = round(
-            current_month_expense * 100 / data["month_budget"], 2)
-    else:
-        data["budget_use_percent"] = 0.0
-
-    return JSONResponse(status_code=200, content={"success": True, "data": data})
+    return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
 
 @router.post("/year/statistics/info")
@@ -441,51 +643,21 @@ async def get_user_year_statistics_information(request: Request, params: Dashboa
         data, 總餘額頁面所需的資訊
     """
     if not verify_utc_time(user_utc_time=params.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
-
-        # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    # 使用者參數處理
+    owner_id = request.state.principal.user_id
 
-    menu: str = params.menu  # "yyyy-mm"
+    menu: str = params.menu  # "yyyy"
     #
 
-    start_time = datetime.strptime(menu, "%Y")
-    end_time = start_time + relativedelta(years=1)
-
-    def _get_year_data(collection: Accounting | IncomeAccounting):
-        each_month_amount = [0] * 12
-        if login_method == "bind":
-            datas = collection.objects(user_name=user_name, line_user_id=line_user_id, unit="TWD",
-                                       created_at__lt=end_time, created_at__gte=start_time)
-        elif login_method == "line":
-            datas = collection.objects(line_user_id=line_user_id, unit="TWD",
-                                       created_at__lt=end_time, created_at__gte=start_time)
-        else:
-            datas = collection.objects(user_name=user_name, unit="TWD",
-                                       created_at__lt=end_time, created_at__gte=start_time)
-        for data in datas:
-            month = data.created_at.month
-            if hasattr(data, "amount"):
-                each_month_amount[month - 1] += data.amount
-            else:
-                each_month_amount[month - 1] += data.cost
-        return each_month_amount
-
-    data = {
-        'income': _get_year_data(IncomeAccounting),
-        'expense': _get_year_data(Accounting)
-    }
-    return JSONResponse(status_code=200, content={"success": True, "data": data})
+    data = await _get_year_data(_get_match_condition(owner_id), menu)
+    return ORJSONResponse(status_code=200, content={"success": True, "data": data})
 
 
 @router.post("/remaining/info")
 @verify_jwt_token
-async def get_user_remaining_information(request: Request, timeinfo: TimeInfo, sqldb: Session = Depends(connect_mysql)):
+async def get_user_remaining_information(request: Request, timeinfo: DashboardRemainingInfo, sqldb: Session = Depends(connect_mysql)):
     """
     取得儀錶板剩餘區塊資訊
     (需攜帶時間驗證)
@@ -495,126 +667,26 @@ async def get_user_remaining_information(request: Request, timeinfo: TimeInfo, s
             - 本月餘額
             - 預期每日支出
             - 平均每日支出
-            - 支出前三類別名稱, 占比, 金額 (必要 & 想要)
+            - 支出前 N 高類別名稱, 占比, 金額 (必要 & 想要), N 預設為 3
     """
     if not verify_utc_time(user_utc_time=timeinfo.current_utc_time):
-        return JSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
-
-        # 使用者參數處理
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
+        return ORJSONResponse(status_code=403, content={"success": False, "message": "使用者時區或使用者本地時間有誤"})
 
-    # 檢查使用者登入方式
-    login_method = check_user_login_method(payload)
+    # 使用者參數處理
+    owner_id = request.state.principal.user_id
+    match_condition = _get_match_condition(owner_id)
 
     utc_time = convert_to_utc_datetime(timeinfo.user_time_data, timeinfo.timezone).replace(
         day=1, hour=0, minute=0, second=0, microsecond=0)
-    #
-
-    # 取得預算設定
-    if login_method == "bind" or login_method == "password":
-        where_condition = User.username == user_name
-    elif login_method == "line":
-        where_condition = User.line_user_id == line_user_id
-    else:
-        where_condition = User.username == user_name
-
-    join_sql = (
-        select(
-            UserBudgetSetting.is_open_plan,
-            UserBudgetSetting.budget
-        )
-        .select_from(User)
-        .join(UserBudgetSetting, User.id == UserBudgetSetting.user_id)
-        .where(where_condition)
-    )
-    result = sqldb.execute(join_sql).first()
-    if result:
-        is_open_plan, budget = result
-    else:
-        is_open_plan, budget = False, 0
-
-    # 取得本月目前支出 (預期/平均 每日支出)
     current_end_time = utc_time + relativedelta(months=1)
-    if login_method == "bind":
-        total_expense = Accounting.objects(
-            user_name=user_name, line_user_id=line_user_id, unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-    elif login_method == "line":
-        total_expense = Accounting.objects(
-            line_user_id=line_user_id, unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-    else:
-        total_expense = Accounting.objects(
-            user_name=user_name, unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-
-    data = dict()
-    data["reduce_budget"] = float(round(
-        (budget - total_expense) * 100 / budget, 2)) if budget and budget > 0 else 0.0
+    #
 
-    max_day = (current_end_time - timedelta(days=1)).day
-    data["expect_expense_per_day"] = int(
-        round(budget / max_day, 0)) if budget and budget > 0 else 0
-    data["expense_per_day"] = int(round(total_expense / max_day, 0))
+    expense_result = await _run_facets(Accounting, {**match_condition, "unit": "TWD"}, {
+        "remaining": _get_remaining_facet(utc_time, current_end_time, timeinfo.top_n)})
 
-    # 取得當月支出前三高類別以及分別必要或想要的資料
-    if login_method == "bind":
-        match_condition = {
-            "user_name": user_name, "line_user_id": line_user_id, "unit": "TWD",
-            "created_at": {
-                "$gte": utc_time,
-                "$lt": current_end_time
-            }
-        }
-    elif login_method == "line":
-        match_condition = {
-            "line_user_id": line_user_id, "unit": "TWD",
-            "created_at": {
-                "$gte": utc_time,
-                "$lt": current_end_time
-            }
-        }
-    else:
-        match_condition = {
-            "user_name": user_name, "unit": "TWD",
-            "created_at": {
-                "$gte": utc_time,
-                "$lt": current_end_time
-            }
-        }
-
-    top_expense_kind = Accounting.objects.aggregate(
-        {"$match": match_condition},
-        {"$group": {"_id": "$statistics_kind", "total_expense": {"$sum": "$cost"}}},
-        {"$sort": {"total_expense": -1}},
-        {"$limit": 3}
+    data = _get_remaining_data(
+        expense_result["remaining"],
+        current_end_time,
+        await _get_budget_setting(sqldb, request.state.principal)
     )
-
-    data["top_expense_data"] = list()
-    for top_kind in top_expense_kind:
-        # 必要花費
-        if login_method == "bind":
-            necessary = Accounting.objects(user_name=user_name, line_user_id=line_user_id, statistics_kind=top_kind["_id"], cost_status__in=[
-                                           0, 2], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-            want = Accounting.objects(user_name=user_name, line_user_id=line_user_id, statistics_kind=top_kind["_id"], cost_status__in=[
-                                      1, 3], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum("cost")
-        elif login_method == "line":
-            necessary = Accounting.objects(line_user_id=line_user_id, statistics_kind=top_kind["_id"], cost_status__in=[
-                                           0, 2], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-            want = Accounting.objects(line_user_id=line_user_id, statistics_kind=top_kind["_id"], cost_status__in=[
-                                      1, 3], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum("cost")
-        else:
-            necessary = Accounting.objects(user_name=user_name, statistics_kind=top_kind["_id"], cost_status__in=[
-                                           0, 2], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum('cost')
-            want = Accounting.objects(user_name=user_name, statistics_kind=top_kind["_id"], cost_status__in=[
-                                      1, 3], unit="TWD", created_at__gte=utc_time, created_at__lt=current_end_time).sum("cost")
-
-        data["top_expense_data"].append({
-            "kind": top_kind["_id"],
-            "total_expense": top_kind["total_expense"],
-            "percent": round((necessary + want) * 100 / total_expense, 0),
-            "necessary": necessary,
-            "want": want
-        })
-
-    # print(f'[DEBUG] data: {data}')
-    return JSONResponse(status_code=200, content={"success": True, "data": data})
+    return ORJSONResponse(status_code=200, content={"success": True, "data": data})
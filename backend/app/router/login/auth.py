@@ -11,10 +11,11 @@ from app.models.sql_model import User
 
 # JWT
 from app.utils.jwt_verification import create_jwt_token, create_refresh_token, verify_refresh_token
-from passlib.context import CryptContext
+from app.services.password_services import hash_password, verify_password
 
 # request/response information & celery task
 from app.utils.attach_info import get_client_ip, set_cookies, clear_cookies
+from app.utils.threadpool import run_blocking
 from app.tasks.tasks import log_user_login
 
 # User api schema
@@ -32,7 +33,6 @@ import requests
 from datetime import datetime
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")  # 使用者密碼加密方式
 
 
 @router.post("/login")
@@ -54,7 +54,7 @@ async def login(request: Request, response: Response, data: UserLogin, sqldb: Se
         _log_data["method"] = "gmail"
         user = sqldb.query(User).filter(User.email == data.email).first()
 
-        if not user or not pwd_context.verify(data.password, user.password):
+        if not user or not await verify_password(data.password, user.password):
             log_user_login.delay(data=_log_data, status=False)   # 紀錄登入失敗內容
             return JSONResponse(status_code=401, content={
                 "success": False, "message": "帳號或密碼錯誤"})
@@ -66,6 +66,7 @@ async def login(request: Request, response: Response, data: UserLogin, sqldb: Se
 
         # - 新增 refresh token 來更新 access token -
         jwt_token = create_jwt_token(data={
+            "user_id": user.id,
             "username": user.username,
             "email": user.email,
             "line_user_name": user.line_user_name,
@@ -74,6 +75,7 @@ async def login(request: Request, response: Response, data: UserLogin, sqldb: Se
         })
 
         jwt_refresh_token = create_refresh_token(data={
+            "user_id": user.id,
             "username": user.username,
             "email": user.email,
             "line_user_name": user.line_user_name,
@@ -106,11 +108,13 @@ async def signup(data: UserSignUp, sqldb: Session = Depends(connect_mysql)):
             return JSONResponse(status_code=401, content={"success": False, "message": "Gmail 驗證碼錯誤"})
 
         else:
+            # 密碼 thread pool 飽和時由全域 handler 回應 503 (不可被下方的 except 轉為 500)
+            hashed_password = await hash_password(data.password)
             try:
                 new_user = User(
                     username=data.username,
                     email=data.email,
-                    password=pwd_context.hash(data.password),
+                    password=hashed_password,
                     is_active=False,  # 尚未綁定 line 帳號
                     line_user_name=None,
                     line_user_id=None
@@ -182,7 +186,7 @@ async def supports(data: UserAccountSupports, sqldb: Session = Depends(connect_m
 
     elif data.status == 2:
         user = sqldb.query(User).filter(User.email == data.email).first()
-        if not user or not pwd_context.verify(data.password, user.password):
+        if not user or not await verify_password(data.password, user.password):
             return JSONResponse(status_code=401, content={"success": False, "message": "使用者信箱或密碼錯誤"})
 
         user.username = data.new_username
@@ -203,9 +207,10 @@ async def reset_password(data: UserResetPassword, sqldb: Session = Depends(conne
     """
       修改使用者密碼
     """
+    hashed_password = await hash_password(data.new_password)
     try:
         user = sqldb.query(User).filter(User.email == data.email).first()
-        user.password = pwd_context.hash(data.new_password)
+        user.password = hashed_password
         sqldb.commit()
 
         return JSONResponse(status_code=201, content={"success": True, "message": "修改密碼成功"})
@@ -224,7 +229,7 @@ async def delete_account(data: UserDeleteAccount, sqldb: Session = Depends(conne
     if not user:
         return JSONResponse(status_code=403, content={"success": False, "message": "查無此使用者"})
 
-    if not pwd_context.verify(data.password, user.password):
+    if not await verify_password(data.password, user.password):
         return JSONResponse(status_code=401, content={"success": False, "message": "密碼錯誤"})
 
     sqldb.delete(user)
@@ -267,7 +272,7 @@ async def line_login_callback(request: Request, parms: dict, sqldb: Session = De
         return JSONResponse(status_code=400, content={"success": False, "message": "授權登入狀態已過期"})
 
     # 取得使用者 Access Token
-    response = requests.post(access_url, data=params)
+    response = await run_blocking(requests.post, access_url, data=params, timeout=10)
     if response.status_code != 200:
         return JSONResponse(status_code=400, content={"success": False, "message": "取得使用者 Access Token 失敗"})
 
@@ -304,6 +309,7 @@ async def line_login_callback(request: Request, parms: dict, sqldb: Session = De
 
     # - 新增 refresh token 來更新 access token -
     jwt_token = create_jwt_token(data={
+        "user_id": user.id,
         "username": user.username,
         "email": user.email,
         "line_user_name": user.line_user_name,
@@ -312,6 +318,7 @@ async def line_login_callback(request: Request, parms: dict, sqldb: Session = De
     })
 
     jwt_refresh_token = create_refresh_token(data={
+        "user_id": user.id,
         "username": user.username,
         "email": user.email,
         "line_user_name": user.line_user_name,
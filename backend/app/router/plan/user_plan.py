@@ -6,16 +6,20 @@ from fastapi.responses import JSONResponse
 # Databases
 from sqlalchemy.orm import Session
 from app.databases.mysql_setting import connect_mysql
-from app.models.sql_model import User, UserBudgetSetting, UserSavingsPlan, UserExpenseNotifySetting, UserIncomeNotifySetting
+from app.models.sql_model import UserBudgetSetting, UserSavingsPlan, UserExpenseNotifySetting, UserIncomeNotifySetting
 
 # Schemas
 from app.schemas.users_plan import PlanContent
 
 # JWT
-from app.utils.jwt_verification import verify_jwt_token
+from app.utils.jwt_verification import verify_jwt_token, resolve_user_id
+
+# notification
+from app.services.notify_scheduler import schedule_user_notifications
+from app.services.budget_tracker import invalidate_budget_setting
 
 # Tools
-from app.utils.attach_info import convert_datetime_to_date_string, convert_to_utc_datetime, check_user_login_method
+from app.utils.attach_info import convert_datetime_to_date_string, convert_to_utc_datetime
 from datetime import time, datetime
 from dateutil.relativedelta import relativedelta
 from typing import List
@@ -33,21 +37,8 @@ async def get_user_planning_menu(request: Request, timezone: str, sqldb: Session
     Returns:
         data.content: 輸出由上到下內容顯示格式與使用者的設定資料
     """
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(
-            User.username == user_name).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-
-    if not user:
+    user_id = await resolve_user_id(request.state.principal, sqldb)
+    if not user_id:
         return JSONResponse(status_code=401, content={"success": False, "message": "使用者名稱錯誤"})
 
     content: List[PlanContent] = []
@@ -75,7 +66,7 @@ async def get_user_planning_menu(request: Request, timezone: str, sqldb: Session
 
     # 預算設定
     budget_setting = sqldb.query(UserBudgetSetting).filter(
-        UserBudgetSetting.user_id == user.id).first()
+        UserBudgetSetting.user_id == user_id).first()
     if budget_setting:
         content.append(build_plan(
             index=0,
@@ -89,7 +80,7 @@ async def get_user_planning_menu(request: Request, timezone: str, sqldb: Session
         ))
 
     else:
-        _add_sql_data(UserBudgetSetting, user.id)
+        _add_sql_data(UserBudgetSetting, user_id)
         content.append(
             PlanContent(
                 sort=0, label="當月預算花費設定⭢$", isActive=False, threshold=0,
@@ -99,7 +90,7 @@ async def get_user_planning_menu(request: Request, timezone: str, sqldb: Session
 
     # 存錢目標規劃
     savings_plan = sqldb.query(UserSavingsPlan).filter(
-        UserSavingsPlan.user_id == user.id).first()
+        UserSavingsPlan.user_id == user_id).first()
     if savings_plan:
         content.append(build_plan(
             index=1,
@@ -113,7 +104,7 @@ async def get_user_planning_menu(request: Request, timezone: str, sqldb: Session
             isLine=savings_plan.is_period_line_notify
         ))
     else:
-        _add_sql_data(UserSavingsPlan, user.id)
+        _add_sql_data(UserSavingsPlan, user_id)
 
         # 默認時間的 reach_time 是 utc time + 1 個月
         default_reach_time = datetime.utcnow() + relativedelta(months=1)
@@ -148,27 +139,15 @@ async def update_user_plan_setting(request: Request, content: List[PlanContent],
     """
     更新理財計畫設定
     """
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(
-            User.username == user_name).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-    if not user:
+    user_id = await resolve_user_id(request.state.principal, sqldb)
+    if not user_id:
         # TODO: 需新增通知訊息 Log
         return JSONResponse(status_code=401, content={"success": False, "message": "使用者名稱錯誤"})
 
     try:
         # 更新預算設定
         budget_setting = sqldb.query(UserBudgetSetting).filter(
-            UserBudgetSetting.user_id == user.id).first()
+            UserBudgetSetting.user_id == user_id).first()
         budget_content, plan_content = content[0], content[1]
 
         budget_setting.is_open_plan = budget_content.isActive
@@ -179,7 +158,7 @@ async def update_user_plan_setting(request: Request, content: List[PlanContent],
 
         # 更新存錢計畫設定
         plan_setting = sqldb.query(UserSavingsPlan).filter(
-            UserSavingsPlan.user_id == user.id).first()
+            UserSavingsPlan.user_id == user_id).first()
         plan_setting.is_open_plan = plan_content.isActive
         plan_setting.target_amount = plan_content.threshold
         plan_setting.reach_time = convert_to_utc_datetime(
@@ -189,6 +168,10 @@ async def update_user_plan_setting(request: Request, content: List[PlanContent],
         plan_setting.is_period_line_notify = plan_content.isLine
 
         sqldb.commit()
+
+        # 通知設定變更後重新排程, 並清除預算警示使用的設定快取
+        schedule_user_notifications(sqldb, user_id)
+        await invalidate_budget_setting(user_id)
         return JSONResponse(status_code=200, content={"success": True, "message": "更新理財計畫設定成功"})
 
     except Exception as e:
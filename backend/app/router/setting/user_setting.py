@@ -6,16 +6,20 @@ from fastapi.responses import JSONResponse
 # Databases
 from sqlalchemy.orm import Session
 from app.databases.mysql_setting import connect_mysql
-from app.models.sql_model import User, UserBudgetSetting, UserSavingsPlan, UserExpenseNotifySetting, UserIncomeNotifySetting
+from app.models.sql_model import UserBudgetSetting, UserSavingsPlan, UserExpenseNotifySetting, UserIncomeNotifySetting
 
 # Schemas
 from app.schemas.users_setting import NotifyContent
 
 # JWT
-from app.utils.jwt_verification import verify_jwt_token
+from app.utils.jwt_verification import verify_jwt_token, resolve_user_id
+
+# notification
+from app.services.notify_scheduler import schedule_user_notifications
+from app.services.budget_tracker import invalidate_budget_setting
 
 # Tools
-from app.utils.attach_info import convert_time_to_utc_time, check_user_login_method
+from app.utils.attach_info import convert_time_to_utc_time
 from datetime import datetime, timedelta, time
 from dateutil.relativedelta import relativedelta
 from typing import List, Tuple
@@ -35,20 +39,8 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
     Returns:
         data.content: 輸出由上到下內容顯示格式與使用者的設定資料
     """
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(User.username == user_name).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-
-    if not user:
+    user_id = await resolve_user_id(request.state.principal, sqldb)
+    if not user_id:
         return JSONResponse(status_code=401, content={"success": False, "message": "使用者名稱錯誤"})
 
     content: List[NotifyContent] = []
@@ -72,7 +64,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         sqldb.commit()
 
     # 1 & 2. 預算設定
-    budget = sqldb.query(UserBudgetSetting).filter_by(user_id=user.id).first()
+    budget = sqldb.query(UserBudgetSetting).filter_by(user_id=user_id).first()
     if budget:
         content.append(build_notify(
             0, "定期預算通知",
@@ -94,7 +86,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         ))
     else:
         # 新增資料
-        _add_sql_data(UserBudgetSetting, user.id)
+        _add_sql_data(UserBudgetSetting, user_id)
 
         content += [
             NotifyContent(
@@ -104,7 +96,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         ]
 
     # 3 & 4. 存錢計畫設定
-    saving = sqldb.query(UserSavingsPlan).filter_by(user_id=user.id).first()
+    saving = sqldb.query(UserSavingsPlan).filter_by(user_id=user_id).first()
     if saving:
         content.append(build_notify(
             2, "定期存錢計畫通知",
@@ -126,7 +118,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         ))
     else:
         # 新增資料
-        _add_sql_data(UserSavingsPlan, user.id)
+        _add_sql_data(UserSavingsPlan, user_id)
 
         content += [
             NotifyContent(
@@ -137,7 +129,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
 
     # 5. 支出通知
     expense = sqldb.query(UserExpenseNotifySetting).filter_by(
-        user_id=user.id).first()
+        user_id=user_id).first()
     if expense:
         content.append(build_notify(
             4, "定期支出統計通知",
@@ -150,14 +142,14 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         ))
     else:
         # 新增資料
-        _add_sql_data(UserExpenseNotifySetting, user_id=user.id)
+        _add_sql_data(UserExpenseNotifySetting, user_id=user_id)
 
         content.append(NotifyContent(sort=4, label="定期支出統計通知", isActive=False, frequency=None, time=None,
                                      threshold=None, isEmail=False, isLine=False))
 
     # 6. 收入通知
     income = sqldb.query(UserIncomeNotifySetting).filter_by(
-        user_id=user.id).first()
+        user_id=user_id).first()
     if income:
         content.append(build_notify(
             5, "定期收入統計通知",
@@ -170,7 +162,7 @@ async def get_message_notify_setting(request: Request, timezone: str, sqldb: Ses
         ))
     else:
         # 新增資料
-        _add_sql_data(UserIncomeNotifySetting, user_id=user.id)
+        _add_sql_data(UserIncomeNotifySetting, user_id=user_id)
 
         content.append(NotifyContent(sort=5, label="定期收入統計通知", isActive=False, frequency=None, time=None,
                                      threshold=None, isEmail=False, isLine=False))
@@ -207,20 +199,8 @@ async def update_message_notify_setting(request: Request, content: List[NotifyCo
     更新訊息通知設定 
     註: 利用 sort 來判斷當前更新的 table 位置 (若 sort 改變此處需要更新)
     """
-    payload = request.state.payload
-    user_name = payload.get("username")
-    line_user_id = payload.get("line_user_id", None)
-    login_method = check_user_login_method(payload)
-
-    if login_method == "bind" or login_method == "password":
-        user = sqldb.query(User).filter(User.username == user_name).first()
-    elif login_method == "line":
-        user = sqldb.query(User).filter(
-            User.line_user_id == line_user_id).first()
-    else:
-        user = None
-
-    if not user:
+    user_id = await resolve_user_id(request.state.principal, sqldb)
+    if not user_id:
         # TODO: 需新增通知訊息 Log
         return JSONResponse(status_code=401, content={"success": False, "message": "使用者名稱錯誤"})
 
@@ -251,26 +231,30 @@ async def update_message_notify_setting(request: Request, content: List[NotifyCo
     # 更新 預算通知 相關
     try:
         budget_setting = sqldb.query(UserBudgetSetting).filter(
-            UserBudgetSetting.user_id == user.id).first()
+            UserBudgetSetting.user_id == user_id).first()
         _update_period_data(budget_setting, content[0])  # 定期預算通知
         _update_warning_data(budget_setting, content[1], "lower")  # 警示預算通知
 
         # 3 & 4. 更新存錢計畫 & 目標達成通知
         savings_plan = sqldb.query(UserSavingsPlan).filter(
-            UserSavingsPlan.user_id == user.id).first()
+            UserSavingsPlan.user_id == user_id).first()
         _update_period_data(savings_plan, content[2])  # 定期存錢計畫通知
         _update_warning_data(savings_plan, content[3], "upper")  # 目標達成通知
 
         # 5 & 6. 更新 定期支出/收入統計
         expense_notify = sqldb.query(UserExpenseNotifySetting).filter(
-            UserExpenseNotifySetting.user_id == user.id).first()
+            UserExpenseNotifySetting.user_id == user_id).first()
         _update_period_data(expense_notify, content[4])
 
         income_notify = sqldb.query(UserIncomeNotifySetting).filter(
-            UserIncomeNotifySetting.user_id == user.id).first()
+            UserIncomeNotifySetting.user_id == user_id).first()
         _update_period_data(income_notify, content[5])
 
         sqldb.commit()
+
+        # 通知設定變更後重新排程, 並清除預算警示使用的設定快取
+        schedule_user_notifications(sqldb, user_id)
+        await invalidate_budget_setting(user_id)
         return JSONResponse(status_code=200, content={"success": True, "message": "更新訊息通知設定成功"})
 
     except Exception as e:
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -108,3 +108,80 @@ class FilterRequest(BaseModel):
     page: int
     per_page: int
     filters: List[FilterRow]
+
+    # 游標分頁模式 (cursor_mode 開啟時忽略 page, 以上一頁回傳的 next_cursor 接續查詢)
+    cursor_mode: bool = False
+    cursor: Optional[str] = None
+
+    # 合併帳本 (oper = 2) 是否回傳累計餘額
+    with_balance: bool = False
+
+
+class ExportRequest(BaseModel):
+    # 匯出交易紀錄 (篩選條件同 FilterRequest, 不分頁)
+    oper: str  # 0: 支出, 1: 收入
+    filters: List[FilterRow] = []
+    format: str = "csv"  # csv | ndjson
+    gzip: bool = False
+
+
+# -- 批次更新/刪除 --
+class BulkSelect(BaseModel):
+    # 以 ids 或 filters (同 FilterRequest) 選擇資料, 兩者皆有時取交集
+    oper: str  # 0: 支出, 1: 收入
+    ids: Optional[List[str]] = None  # mongo document id
+    filters: Optional[List[FilterRow]] = None
+
+
+class BulkUpdateRequest(BulkSelect):
+    changes: dict  # 欄位: 新值 (支出見 AccountingBulkChanges, 收入見 IncomeBulkChanges)
+
+
+class BulkDeleteRequest(BulkSelect):
+    pass
+
+
+class _BulkChanges(BaseModel):
+    # 批次更新只包含要修改的欄位 (未傳入的欄位不修改), 不允許將欄位設為 null
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _reject_none(cls, value):
+        if value is None:
+            raise ValueError("欄位不可為 null")
+        return value
+
+
+class AccountingBulkChanges(_BulkChanges):
+    # 批次更新可修改的支出欄位 (建立時間需逐筆換算時區, 不開放批次修改)
+
+    statistics_kind: Optional[str] = None
+    category: Optional[str] = None
+    cost_name: Optional[str] = None
+    cost_status: Optional[int] = None
+    unit: Optional[str] = None
+    cost: Optional[int] = None
+    pay_method: Optional[int] = None
+    store_name: Optional[str] = None
+    description: Optional[str] = None
+
+
+class IncomeBulkChanges(_BulkChanges):
+    # 批次更新可修改的收入欄位
+
+    income_kind: Optional[str] = None
+    category: Optional[str] = None
+    amount: Optional[int] = None
+    unit: Optional[str] = None
+    payer: Optional[str] = None
+    pay_account: Optional[str] = None
+    description: Optional[str] = None
+
+
+class SearchRequest(BaseModel):
+    # 關鍵字搜尋 (cost_name / store_name / description / payer, 依相關程度排序)
+    oper: str  # 0: 支出, 1: 收入
+    keyword: str
+    page: int = 1
+    per_page: int = 20
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 
@@ -13,3 +13,15 @@ class TimeInfo(BaseModel):
 
 class DashboardMenuInfo(TimeInfo):
     menu: str
+
+
+class DashboardRemainingInfo(TimeInfo):
+    top_n: int = Field(default=3, ge=1, le=10)  # 顯示支出前 N 高的類別
+
+
+class DashboardBundleInfo(TimeInfo):
+    # 儀錶板一次取得全部區塊資料 (各區塊選單, 預設為選單第一個選項)
+    income_menu: Optional[str] = "全部"
+    expense_menu: Optional[str] = "全部"
+    year_menu: Optional[str] = None  # 預設為最新有紀錄的年份
+    remaining_top_n: int = Field(default=3, ge=1, le=10)
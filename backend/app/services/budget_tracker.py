@@ -0,0 +1,211 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Databases
+from app.databases.redis_setting import connect_async_redis
+from app.databases.mongo_setting import get_async_mongo_db
+from app.databases.mysql_setting import SessionLocal
+from app.models.mongo_model import Accounting, MonthlySummary
+from app.models.sql_model import UserBudgetSetting
+
+# Tools
+from app.tasks.tasks import send_budget_alert
+from app.services.notify_scheduler import get_notify_channels
+from app.utils.threadpool import run_blocking
+
+__all__ = ['prepare_month_spend', 'current_month_cost',
+           'track_expense_delta', 'invalidate_budget_setting']
+
+# redis/2 預算追蹤
+# budget-spend:{owner_id}:{yyyymm}: 當月累計支出 (TWD), 記帳寫入時以 INCRBY 調整
+#   註: 初始化 (讀取每月統計表) 與 INCRBY 無法與 mongo 寫入同步, 同時寫入時可能短暫偏差;
+#       只作為判斷是否跨越門檻的快速路徑, 發出警示前一律以每月統計表重新核對
+# budget-setting:{owner_id}: 預算設定快取 (hash), 更新預算/通知設定時刪除
+# budget-alert:{owner_id}:{yyyymm}:{level}: 當月已發出的警示 (SET NX 避免重複發送)
+_SPEND_KEY = "budget-spend"
+_SETTING_KEY = "budget-setting"
+_ALERT_KEY = "budget-alert"
+_MONTH_TTL = 40 * 24 * 60 * 60  # 超過一個月後自然過期 (s)
+_SETTING_TTL = 24 * 60 * 60
+
+_BUDGET_UNIT = "TWD"  # 預算以台幣計算 (同儀錶板)
+
+# 只在累計支出已初始化時 INCRBY (不存在時回傳 nil, 避免建立只包含本次變動金額的 key)
+_INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+def _current_month() -> datetime:
+    return datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _spend_key(owner_id: int, month: datetime) -> str:
+    return f"{_SPEND_KEY}:{owner_id}:{month:%Y%m}"
+
+
+def current_month_cost(record: Accounting | Dict[str, Any], month: Optional[datetime] = None) -> int:
+    """
+    記帳支出計入本月預算的金額 (非台幣或非本月的資料為 0)
+
+    Args:
+        record (Accounting | dict): 記帳支出資料 (mongoengine Document 或 raw dict)
+    """
+    month = month or _current_month()
+    if isinstance(record, dict):
+        unit, created_at, cost = record.get("unit"), record.get("created_at"), record.get("cost")
+    else:
+        unit, created_at, cost = record.unit, record.created_at, record.cost
+
+    if unit != _BUDGET_UNIT or not created_at:
+        return 0
+    if created_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0) != month:
+        return 0
+    return cost or 0
+
+
+async def prepare_month_spend(owner_id: int):
+    """
+    確認本月累計支出已初始化 (需在記帳寫入前呼叫)
+    註: 不存在時以每月統計表的本月支出初始化 (SET NX), 寫入後的 INCRBY 才不會重複計算
+    """
+    try:
+        redis_client = connect_async_redis(redis_db=2)
+        month = _current_month()
+        key = _spend_key(owner_id, month)
+        if await redis_client.exists(key):
+            return
+
+        await redis_client.set(key, await _get_summary_spend(owner_id, month), ex=_MONTH_TTL, nx=True)
+
+    except Exception as e:
+        print(f'error: {e}')
+
+
+async def _get_summary_spend(owner_id: int, month: datetime) -> int:
+    """由每月統計表取得當月台幣支出 (累計支出的正確值)"""
+    cursor = await get_async_mongo_db()[MonthlySummary._get_collection_name()].aggregate([
+        {"$match": {"owner_id": owner_id, "month": month,
+                    "record_type": "expense", "unit": _BUDGET_UNIT}},
+        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
+    ])
+    result = await cursor.to_list()
+    return result[0]["total"] if result else 0
+
+
+def _load_budget_setting(owner_id: int) -> Tuple[int, int, bool]:
+    """由 MySQL 取得預算設定 (阻塞操作)"""
+    sqldb = SessionLocal()
+    try:
+        setting = sqldb.query(UserBudgetSetting).filter(
+            UserBudgetSetting.user_id == owner_id).first()
+    finally:
+        sqldb.close()
+
+    if not setting or not setting.is_open_plan or not setting.budget:
+        return 0, 0, False
+    # 只計入已支援的通知方式 (只開啟 Line 通知時不發出警示, 也不佔用當月的警示紀錄)
+    enabled = "email" in get_notify_channels("budget_warning", setting)
+    return int(setting.budget), setting.lower_warning_percent or 0, enabled
+
+
+async def _get_budget_setting(redis_client, owner_id: int) -> Tuple[int, int, bool]:
+    """
+    取得預算設定 (先讀取 redis 快取)
+
+    Returns:
+        (預算, 剩餘預算低於多少 % 警示, 是否開啟警示通知)
+    """
+    key = f"{_SETTING_KEY}:{owner_id}"
+    cached = await redis_client.hgetall(key)
+    if cached:
+        return int(cached["budget"]), int(cached["percent"]), cached["enabled"] == "1"
+
+    budget, percent, enabled = await run_blocking(_load_budget_setting, owner_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping={"budget": budget, "percent": percent, "enabled": int(enabled)})
+        pipe.expire(key, _SETTING_TTL)
+        await pipe.execute()
+    return budget, percent, enabled
+
+
+def _get_thresholds(budget: int, percent: int) -> List[Tuple[str, float]]:
+    """
+    警示門檻 (累計支出金額)
+        - warning: 剩餘預算低於 lower_warning_percent %
+        - exceeded: 超出預算
+    """
+    thresholds = []
+    if 0 < percent < 100:
+        thresholds.append(("warning", budget * (100 - percent) / 100))
+    thresholds.append(("exceeded", budget))
+    return thresholds
+
+
+async def track_expense_delta(owner_id: int, delta: int) -> List[str]:
+    """
+    調整本月累計支出, 並在跨越預算門檻時發出警示 (每次寫入固定 O(1) 次 redis 操作, 不需定期掃描)
+    註: 支出減少而回到門檻以下時會清除警示紀錄, 之後再次超過會重新通知
+        累計支出不存在時不會 INCRBY, 改以每月統計表重新初始化 (避免以錯誤的累計金額判斷門檻)
+        redis 的累計支出為近似值 (同時寫入時可能重複或遺漏), 跨越門檻時先以每月統計表核對並修正後再判斷是否發出警示
+
+    Args:
+        owner_id (int): 使用者 id
+        delta (int): 本月支出的變動金額 (current_month_cost 新值 - 舊值)
+
+    Returns:
+        List[str]: 本次發出的警示 (warning | exceeded)
+    """
+    if not delta:
+        return []
+
+    fired = []
+    try:
+        redis_client = connect_async_redis(redis_db=2)
+        month = _current_month()
+        key = _spend_key(owner_id, month)
+        after = await redis_client.eval(_INCR_IF_EXISTS, 1, key, delta)
+        if after is None:
+            # 寫入前初始化失敗 (或 key 已過期): 每月統計表已包含本次寫入, 重新初始化後即為寫入後的累計支出
+            await prepare_month_spend(owner_id)
+            after = await redis_client.get(key)
+            if after is None:
+                return []
+        after = int(after)
+        before = after - delta
+
+        budget, percent, enabled = await _get_budget_setting(redis_client, owner_id)
+        if budget <= 0:
+            return []
+
+        thresholds = _get_thresholds(budget, percent)
+        if any(before < threshold <= after for _, threshold in thresholds):
+            # 每月統計表已包含本次寫入: 以正確值修正累計支出 (INCRBY 差額, 不覆蓋同時寫入的增減量)
+            actual = await _get_summary_spend(owner_id, month)
+            if actual != after:
+                await redis_client.incrby(key, actual - after)
+                after, before = actual, actual - delta
+
+        for level, threshold in thresholds:
+            alert_key = f"{_ALERT_KEY}:{owner_id}:{month:%Y%m}:{level}"
+            if before < threshold <= after:
+                if enabled and await redis_client.set(alert_key, 1, ex=_MONTH_TTL, nx=True):
+                    send_budget_alert.delay(owner_id, level, after, budget)
+                    fired.append(level)
+            elif after < threshold <= before:
+                await redis_client.delete(alert_key)
+
+    except Exception as e:
+        print(f'error: {e}')
+    return fired
+
+
+async def invalidate_budget_setting(user_id: int):
+    """刪除預算設定快取 (更新理財計畫 / 通知設定後呼叫)"""
+    try:
+        await connect_async_redis(redis_db=2).delete(f"{_SETTING_KEY}:{user_id}")
+    except Exception as e:
+        print(f'error: {e}')
@@ -0,0 +1,162 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting
+
+# monthly summary & budget
+from app.services.monthly_summary import summary_deltas, apply_summary_deltas
+from app.services.budget_tracker import current_month_cost
+
+# Tools
+from app.schemas.accounting import FilterRow
+from app.utils.query_map import handle_filter_query
+from app.services.transaction_services import get_transaction_match_condition
+from app.utils.search_tokens import SEARCH_FIELD_PREFIX, build_search_tokens
+from bson import ObjectId
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ['get_bulk_match_condition', 'bulk_update_records', 'bulk_delete_records']
+
+BULK_CHUNK_SIZE = 1000  # 每次讀取 / 寫入的筆數
+
+# 每月統計與預算追蹤需要的欄位
+_SUMMARY_FIELDS = {
+    "Accounting": ("owner_id", "created_at", "unit", "statistics_kind", "cost_status", "cost"),
+    "IncomeAccounting": ("owner_id", "created_at", "unit", "income_kind", "amount"),
+}
+
+
+def get_bulk_match_condition(owner_id: int, ids: Optional[List[str]], filters: Optional[List[FilterRow]]) -> Dict[str, Any]:
+    """
+    建立批次操作的查詢條件 (一定包含 owner_id, 只能操作本人的資料)
+
+    Raises:
+        ValueError: 未指定 ids 與 filters (避免誤刪/誤改全部資料)
+        bson.errors.InvalidId: id 格式錯誤
+    """
+    if not ids and not filters:
+        raise ValueError("需指定 ids 或 filters")
+
+    query = dict(handle_filter_query(query=filters)["mongo_query"]) if filters else dict()
+    if ids:
+        query["_id"] = {"$in": [ObjectId(record_id) for record_id in ids]}
+    return get_transaction_match_condition(owner_id, query)
+
+
+def _search_fields(collection: Accounting | IncomeAccounting) -> List[str]:
+    """資料表中可搜尋的欄位 (search_tokens 的來源)"""
+    return [field for field in SEARCH_FIELD_PREFIX if field in collection._fields]
+
+
+def _iter_chunks(collection: Accounting | IncomeAccounting, match_condition: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    依 _id 順序分批讀取符合條件的資料 (只取回統計與搜尋欄位)
+    註: 以 _id 範圍接續, 更新後不再符合條件的資料不會影響下一批
+    """
+    mongo_collection = collection._get_collection()
+    projection = {field: 1 for field in (*_SUMMARY_FIELDS[collection.__name__], *_search_fields(collection))}
+    last_id = None
+    while True:
+        condition = match_condition if last_id is None else {"$and": [match_condition, {"_id": {"$gt": last_id}}]}
+        docs = list(mongo_collection.find(condition, projection).sort("_id", 1).limit(BULK_CHUNK_SIZE))
+        if not docs:
+            return
+        yield docs
+        last_id = docs[-1]["_id"]
+
+
+def _month_cost(collection: Accounting | IncomeAccounting, doc: Dict[str, Any]) -> int:
+    return current_month_cost(doc) if collection is Accounting else 0
+
+
+def bulk_update_records(
+    collection: Accounting | IncomeAccounting,
+    match_condition: Dict[str, Any],
+    changes: Dict[str, Any]
+) -> Tuple[Dict[str, int], int]:
+    """
+    批次更新記帳資料 (阻塞操作, 由 route 透過 run_blocking 執行)
+    註:
+        - 不影響每月統計與搜尋的欄位 (例如 category, pay_method) 直接以一次 update_many 更新
+        - 修改金額/類別/幣別或可搜尋的欄位時, 每 BULK_CHUNK_SIZE 筆讀取舊值後逐筆 update_one,
+          條件包含讀取到的舊值 (讀取後被其他請求修改/刪除的資料不會更新, 計入 skipped),
+          只有確認寫入的資料才計入每月統計的增減量, 每批合併寫入一次
+
+    Args:
+        match_condition (Dict[str, Any]): get_bulk_match_condition 的回傳結果
+        changes (Dict[str, Any]): 欄位: 新值
+
+    Returns:
+        ({"matched": 符合筆數, "modified": 更新筆數, "skipped": 同時被修改而略過的筆數}, 本月台幣支出的變動金額)
+    """
+    mongo_collection = collection._get_collection()
+    update = {"$set": {**changes, "updated_at": datetime.utcnow()}}
+    search_fields = _search_fields(collection)
+    summary_fields = _SUMMARY_FIELDS[collection.__name__]
+    touches_summary = bool(set(changes) & set(summary_fields))
+    touches_search = bool(set(changes) & set(search_fields))
+
+    if not touches_summary and not touches_search:
+        result = mongo_collection.update_many(match_condition, update)
+        return {"matched": result.matched_count, "modified": result.modified_count, "skipped": 0}, 0
+
+    counts = {"matched": 0, "modified": 0, "skipped": 0}
+    cost_delta = 0
+    owner_id = match_condition["owner_id"]
+    guard_fields = (*summary_fields, *search_fields)
+    for docs in _iter_chunks(collection, match_condition):
+        deltas = []
+        for doc in docs:
+            updated = {**doc, **changes}
+            # 先計算增減量 (資料有誤時在寫入前失敗, 不會留下與統計不一致的資料)
+            doc_deltas = summary_deltas(collection, doc, -1) + summary_deltas(collection, updated) if touches_summary else []
+            doc_update = update
+            if touches_search:
+                doc_update = {"$set": {**update["$set"], "search_tokens": build_search_tokens(
+                    {**{field: doc.get(field) for field in search_fields}, **changes})}}
+
+            # 以讀取到的舊值作為條件 (缺少的欄位以 None 比對, 同 mongo 的 null 條件)
+            result = mongo_collection.update_one(
+                {"_id": doc["_id"], **{field: doc.get(field) for field in guard_fields}, "owner_id": owner_id}, doc_update)
+            if not result.matched_count:
+                counts["skipped"] += 1
+                continue
+
+            counts["matched"] += 1
+            counts["modified"] += result.modified_count
+            deltas += doc_deltas
+            if touches_summary:
+                cost_delta += _month_cost(collection, updated) - _month_cost(collection, doc)
+
+        if deltas:
+            apply_summary_deltas(deltas)
+
+    return counts, cost_delta
+
+
+def bulk_delete_records(
+    collection: Accounting | IncomeAccounting,
+    match_condition: Dict[str, Any]
+) -> Tuple[Dict[str, int], int]:
+    """
+    批次刪除記帳資料並扣除每月統計 (阻塞操作, 每 BULK_CHUNK_SIZE 筆一次 delete_many)
+
+    Returns:
+        ({"matched": 符合筆數, "deleted": 刪除筆數}, 本月台幣支出的變動金額)
+    """
+    mongo_collection = collection._get_collection()
+    counts = {"matched": 0, "deleted": 0}
+    cost_delta = 0
+
+    for docs in _iter_chunks(collection, match_condition):
+        result = mongo_collection.delete_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}, "owner_id": match_condition["owner_id"]})
+        counts["matched"] += len(docs)
+        counts["deleted"] += result.deleted_count
+
+        deltas = []
+        for doc in docs:
+            deltas += summary_deltas(collection, doc, -1)
+            cost_delta -= _month_cost(collection, doc)
+        apply_summary_deltas(deltas)
+
+    return counts, cost_delta
@@ -0,0 +1,276 @@
+import os
+import io
+import csv
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting
+from pymongo.errors import BulkWriteError
+
+# Validation Schema
+from pydantic import ValidationError
+from app.schemas.accounting import AccountingCreate, IncomeCreate
+
+# monthly summary & budget
+from app.services.monthly_summary import summary_deltas, apply_summary_deltas
+from app.services.budget_tracker import current_month_cost
+
+# Tools
+from app.utils.attach_info import convert_to_utc_datetime
+
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))  # 每次 insert_many 的筆數
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", 200000))  # 單次匯入筆數上限
+IMPORT_MAX_ERRORS = 100  # 回傳的錯誤明細上限 (錯誤總數另外計算)
+
+__all__ = ['IMPORT_FORMATS', 'IMPORT_BATCH_SIZE', 'get_import_format', 'import_transactions']
+
+_DECODE_ERROR_CHAR = "\ufffd"  # 無法以 UTF-8 解碼的位元組 (errors="replace")
+
+# 副檔名: 檔案格式
+IMPORT_FORMATS = {
+    ".csv": "csv",
+    ".json": "json",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+class ImportResult:
+    """
+    匯入結果
+
+    Attributes:
+        total (int): 讀取的資料筆數。
+        inserted (int): 寫入成功的筆數 (dry_run 時為驗證通過的筆數)。
+        errors (List[Dict]): 錯誤明細 [{"row": 第幾筆, "errors": [...]}] (最多 IMPORT_MAX_ERRORS 筆)。
+        error_count (int): 錯誤總筆數。
+        month_cost (int): 寫入的本月台幣支出 (預算追蹤使用)。
+        aborted (str | None): 寫入中斷的原因 (例如資料庫連線錯誤), 中斷前已寫入的批次不會回復。
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+        self.month_cost = 0
+        self.aborted: str | None = None
+
+    def add_error(self, row: int, errors: List[str]):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "errors": errors})
+
+    def to_dict(self, dry_run: bool) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "inserted": 0 if dry_run else self.inserted,
+            "valid": self.inserted,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "dry_run": dry_run,
+            "aborted": self.aborted,
+        }
+
+
+def get_import_format(filename: str) -> str | None:
+    """依副檔名判斷匯入格式 (不支援時為 None)"""
+    return IMPORT_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def _read_rows(file: BinaryIO, import_format: str) -> Iterator[Tuple[int, Any]]:
+    """
+    逐筆讀取上傳檔案 (CSV / NDJSON 不會一次載入整份檔案)
+    註: 單筆資料的編碼 (非 UTF-8) 或格式錯誤以 ValueError 回傳, 不中斷後續資料
+
+    Yields:
+        (第幾筆資料, 原始資料 | ValueError)
+    """
+    if import_format == "json":
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise ValueError("JSON 檔案需為陣列格式")
+        yield from enumerate(rows, start=1)
+        return
+
+    # 無法解碼的位元組以 U+FFFD 取代, 只讓該筆資料失敗
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    if import_format == "csv":
+        reader = csv.DictReader(text)
+        index = 0
+        while True:
+            index += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield index, ValueError(f"CSV 格式錯誤: {e}")
+                continue
+            if any(_DECODE_ERROR_CHAR in (value or "") for value in row.values() if isinstance(value, str)):
+                yield index, ValueError("編碼錯誤 (需為 UTF-8)")
+                continue
+            # 空白欄位視為未填寫 (使用預設值)
+            yield index, {key: value for key, value in row.items() if key and value not in ("", None)}
+    else:
+        index = 0
+        for line in text:
+            if line.strip():
+                index += 1
+                if _DECODE_ERROR_CHAR in line:
+                    yield index, ValueError("編碼錯誤 (需為 UTF-8)")
+                    continue
+                try:
+                    yield index, json.loads(line)
+                except ValueError:
+                    yield index, None
+
+
+def _format_validation_error(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+def _build_record(
+    collection: Accounting | IncomeAccounting,
+    data: AccountingCreate | IncomeCreate,
+    owner_id: int,
+    line_user_id: str | None
+) -> Accounting | IncomeAccounting:
+    """建立記帳資料 (欄位同 /create, /create/income)"""
+    utc_time = convert_to_utc_datetime(data.user_time_data, data.timezone)
+    fields = data.model_dump(exclude={"user_time_data", "timezone", "current_utc_time", "user_id", "created_at", "updated_at"})
+    record = collection(
+        owner_id=owner_id,
+        line_user_id=line_user_id,
+        created_at=utc_time,
+        updated_at=utc_time,
+        **fields
+    )
+    record.refresh_search_tokens()
+    return record
+
+
+def _insert_batch(collection: Accounting | IncomeAccounting, batch: List[Tuple[int, Any]], result: ImportResult):
+    """
+    以 insert_many 寫入一批資料並累加每月統計 (ordered=False: 單筆失敗不影響其他資料)
+    """
+    failed_index = dict()
+    try:
+        collection._get_collection().insert_many([record.to_mongo() for _, record in batch], ordered=False)
+    except BulkWriteError as e:
+        failed_index = {error["index"]: error.get("errmsg", "寫入失敗") for error in e.details.get("writeErrors", [])}
+
+    deltas = []
+    for index, (row, record) in enumerate(batch):
+        if index in failed_index:
+            result.add_error(row, [failed_index[index]])
+            continue
+        result.inserted += 1
+        deltas += summary_deltas(collection, record)
+        if collection is Accounting:
+            result.month_cost += current_month_cost(record)
+
+    apply_summary_deltas(deltas)
+
+
+def import_transactions(
+    collection: Accounting | IncomeAccounting,
+    file: BinaryIO,
+    import_format: str,
+    owner_id: int,
+    defaults: Dict[str, Any],
+    line_user_id: str | None = None,
+    dry_run: bool = False,
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> ImportResult:
+    """
+    匯入記帳資料 (阻塞操作, 由 route 透過 run_blocking 執行)
+    註: 每筆資料以 AccountingCreate / IncomeCreate 驗證, 通過的資料每 batch_size 筆以 insert_many 寫入,
+        每月統計也是每批合併後寫入一次
+
+    Args:
+        collection (Accounting | IncomeAccounting): 記帳資料表。
+        file (BinaryIO): 上傳檔案。
+        import_format (str): csv | json | ndjson (IMPORT_FORMATS)。
+        owner_id (int): 資料擁有者 (principal.user_id)。
+        defaults (Dict[str, Any]): 每筆資料未填寫時的預設欄位 (例如 timezone, user_name)。
+        line_user_id (str | None): Line 登入時寫入的 line_user_id。
+        dry_run (bool): 只驗證不寫入。
+        batch_size (int): 每次寫入的筆數。
+
+    Returns:
+        ImportResult (寫入中途發生非預期錯誤時不拋出例外, 以 aborted 記錄原因並回傳已寫入的筆數,
+                      呼叫端需依 inserted / month_cost 更新快取與預算)
+
+    Raises:
+        ValueError: JSON 檔案格式錯誤 (尚未寫入任何資料)
+    """
+    result = ImportResult()
+    try:
+        _import_rows(collection, file, import_format, owner_id, defaults, line_user_id, dry_run, batch_size, result)
+    except ValueError as e:
+        # 檔案格式錯誤 (尚未寫入時由呼叫端回傳 400)
+        if not result.inserted:
+            raise
+        result.aborted = str(e)
+    except Exception as e:
+        print(f'error: {e}')
+        result.aborted = str(e)
+    return result
+
+
+def _import_rows(
+    collection: Accounting | IncomeAccounting,
+    file: BinaryIO,
+    import_format: str,
+    owner_id: int,
+    defaults: Dict[str, Any],
+    line_user_id: str | None,
+    dry_run: bool,
+    batch_size: int,
+    result: ImportResult
+):
+    """逐筆驗證並分批寫入 (每批寫入後即累加 result.inserted / month_cost)"""
+    schema = AccountingCreate if collection is Accounting else IncomeCreate
+    defaults = {"user_id": None, "description": "", "current_utc_time": datetime.utcnow().isoformat(), **defaults}
+    batch: List[Tuple[int, Any]] = []
+
+    for row, raw in _read_rows(file, import_format):
+        if result.total >= IMPORT_MAX_ROWS:
+            result.add_error(row, [f"超過單次匯入上限 {IMPORT_MAX_ROWS} 筆"])
+            break
+        result.total += 1
+
+        if isinstance(raw, ValueError):
+            result.add_error(row, [str(raw)])
+            continue
+        if not isinstance(raw, dict):
+            result.add_error(row, ["資料格式錯誤"])
+            continue
+
+        try:
+            data = schema.model_validate({**defaults, **raw})
+            record = _build_record(collection, data, owner_id, line_user_id)
+        except ValidationError as e:
+            result.add_error(row, _format_validation_error(e))
+            continue
+        except ValueError as e:
+            result.add_error(row, [str(e)])
+            continue
+
+        if dry_run:
+            result.inserted += 1
+            continue
+
+        batch.append((row, record))
+        if len(batch) >= batch_size:
+            _insert_batch(collection, batch, result)
+            batch = []
+
+    if batch and not dry_run:
+        _insert_batch(collection, batch, result)
@@ -0,0 +1,160 @@
+import os
+import re
+import sys
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+from typing import Dict, List
+
+# mysql
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app.databases.mysql_setting import engine
+from app.models.sql_model import Base, JwtTokenLog, UserLoginLog
+
+load_dotenv()
+
+LOG_RETENTION_MONTHS = int(os.environ.get("LOG_RETENTION_MONTHS", 6))  # 保留月數 (不含本月)
+LOG_PARTITION_AHEAD_MONTHS = int(os.environ.get("LOG_PARTITION_AHEAD_MONTHS", 3))  # 預先建立的未來月份數
+
+__all__ = ['maintain_log_partitions']
+
+# 按月分區的日誌資料表
+_PARTITIONED_MODELS = (JwtTokenLog, UserLoginLog)
+
+# 分區名稱: p202501 存放 2025-01 的資料, p_future 承接尚未建立分區的資料
+_PARTITION_NAME = re.compile(r"^p(\d{4})(\d{2})$")
+_FUTURE_PARTITION = "p_future"
+
+
+def _partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_definitions(months: List[date]) -> str:
+    """
+    組合分區定義 (每月一個分區, 上界為下個月 1 日)
+    例如: PARTITION p202501 VALUES LESS THAN (TO_DAYS('2025-02-01')), ..., PARTITION p_future VALUES LESS THAN MAXVALUE
+    """
+    partitions = [
+        f"PARTITION {_partition_name(month)} VALUES LESS THAN (TO_DAYS('{month + relativedelta(months=1):%Y-%m-%d}'))"
+        for month in months
+    ]
+    partitions.append(f"PARTITION {_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return ", ".join(partitions)
+
+
+def _month_range(start: date, end: date) -> List[date]:
+    """start ~ end (含) 每個月的 1 日"""
+    months = []
+    while start <= end:
+        months.append(start)
+        start += relativedelta(months=1)
+    return months
+
+
+def _get_partitions(conn: Connection, table: str) -> List[str]:
+    """取得資料表目前的分區名稱 (未分區時為空列表)"""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table": table})
+    return [row[0] for row in rows]
+
+
+def _convert_to_partitioned(conn: Connection, table: str, current_month: date):
+    """
+    將既有資料表轉換為分區表 (只在第一次執行, 會重建資料表)
+        1. 主鍵改為 (id, created_at) 並移除其他 unique 索引 (分區表的 unique 索引需包含分區欄位)
+        2. 從最早的資料月份開始建立每月分區
+    """
+    conn.execute(text(f"UPDATE {table} SET created_at = UTC_TIMESTAMP() WHERE created_at IS NULL"))
+
+    # unique 索引改為一般索引 (例如 users_login_log.line_user_id)
+    alter_keys = []
+    unique_indexes = conn.execute(text(
+        "SELECT INDEX_NAME, GROUP_CONCAT(CONCAT('`', COLUMN_NAME, '`') ORDER BY SEQ_IN_INDEX) "
+        "FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY' "
+        "GROUP BY INDEX_NAME"
+    ), {"table": table})
+    for name, columns in unique_indexes:
+        alter_keys.append(f", DROP INDEX `{name}`, ADD INDEX `{name}` ({columns})")
+
+    conn.execute(text(
+        f"ALTER TABLE {table} MODIFY created_at DATETIME NOT NULL, "
+        f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)" + "".join(alter_keys)
+    ))
+
+    oldest = conn.execute(text(f"SELECT MIN(created_at) FROM {table}")).scalar()
+    first_month = min(oldest.date().replace(day=1), current_month) if oldest else current_month
+    months = _month_range(first_month, current_month + relativedelta(months=LOG_PARTITION_AHEAD_MONTHS))
+
+    conn.execute(text(
+        f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(created_at)) ({_partition_definitions(months)})"))
+    print(f'[{table}] 已轉換為分區表, 共 {len(months)} 個月份分區')
+
+
+def _maintain_table(conn: Connection, table: str, current_month: date) -> Dict[str, List[str]]:
+    """
+    建立未來月份的分區, 並刪除超過保留期限的分區 (DROP PARTITION 不需逐筆 DELETE)
+
+    Returns:
+        {"created": 新增的分區, "dropped": 刪除的分區}
+    """
+    partitions = _get_partitions(conn, table)
+    if not partitions:
+        _convert_to_partitioned(conn, table, current_month)
+        partitions = _get_partitions(conn, table)
+
+    existing_months = sorted(
+        date(int(match[1]), int(match[2]), 1)
+        for match in map(_PARTITION_NAME.match, partitions) if match
+    )
+
+    # 新增分區: 從 p_future 切出 (p_future 只在排程停止過久時才會有資料)
+    last_month = existing_months[-1] if existing_months else current_month - relativedelta(months=1)
+    new_months = _month_range(last_month + relativedelta(months=1),
+                              current_month + relativedelta(months=LOG_PARTITION_AHEAD_MONTHS))
+    if new_months:
+        conn.execute(text(
+            f"ALTER TABLE {table} REORGANIZE PARTITION {_FUTURE_PARTITION} INTO ({_partition_definitions(new_months)})"))
+
+    # 刪除分區: 保留本月與前 LOG_RETENTION_MONTHS 個月
+    cutoff = current_month - relativedelta(months=LOG_RETENTION_MONTHS)
+    expired = [_partition_name(month) for month in existing_months if month < cutoff]
+    if expired:
+        conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+
+    return {"created": [_partition_name(month) for month in new_months], "dropped": expired}
+
+
+def maintain_log_partitions() -> Dict[str, Dict[str, List[str]]]:
+    """
+    維護日誌資料表的月份分區 (由 celery beat 定期執行, 重複執行不會有影響)
+
+    Returns:
+        {資料表名稱: {"created": [...], "dropped": [...]}}
+    """
+    current_month = datetime.utcnow().date().replace(day=1)
+    result = dict()
+
+    # 資料表尚未建立時 (beat 早於 FastAPI 啟動) 先建立, 再轉換為分區表
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in _PARTITIONED_MODELS])
+
+    # ALTER TABLE 為 DDL (隱含 commit), 每張資料表各自執行
+    for model in _PARTITIONED_MODELS:
+        table = model.__tablename__
+        with engine.begin() as conn:
+            result[table] = _maintain_table(conn, table, current_month)
+        print(f'[{table}] 新增分區: {result[table]["created"]}, 刪除分區: {result[table]["dropped"]}')
+    return result
+
+
+if __name__ == "__main__":
+    # 用法: python -m app.services.log_partition (第一次執行會將既有資料表轉換為分區表)
+    if engine.dialect.name != "mysql":
+        print("日誌分區只支援 MySQL")
+        sys.exit(1)
+    maintain_log_partitions()
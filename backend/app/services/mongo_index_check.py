@@ -0,0 +1,160 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting, MonthlySummary
+
+# Tools
+from app.services.transaction_services import get_transaction_sort, get_cursor_condition
+from bson import ObjectId
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+import sys
+
+__all__ = ['sync_indexes', 'check_query_plans']
+
+# 驗證用的使用者條件 (所有登入方式皆以 owner_id 查詢)
+_OWNER_CONDITION = {"owner_id": 0}
+
+# 不允許出現在 winningPlan 的 stage (全表掃描 / 記憶體排序)
+_REJECT_STAGES = ("COLLSCAN", "SORT")
+
+Query = Tuple[str, Any, Dict[str, Any]]  # (名稱, collection, explain 指令)
+
+
+def sync_indexes(drop_extra: bool = False):
+    """
+    建立 model 定義的索引, 並列出資料庫中多餘的舊索引
+
+    Args:
+        drop_extra (bool): 是否刪除多餘的索引 (例如舊的 9 欄位 sparse 索引)
+    """
+    for model in (Accounting, IncomeAccounting, MonthlySummary):
+        model.ensure_indexes()
+        collection = model._get_collection()
+
+        extra = model.compare_indexes()["extra"]
+        for name, info in collection.index_information().items():
+            if info["key"] not in extra:
+                continue
+            if drop_extra:
+                collection.drop_index(name)
+            print(f'[{model.__name__}] {"刪除" if drop_extra else "多餘"}索引: {name}')
+
+
+def _canonical_queries() -> Iterator[Query]:
+    """
+    各路由實際使用的查詢形狀 (dashboard_api.py / transaction.py / users_accounting.py / figure.py)
+
+    Returns:
+        (名稱, collection, explain 指令)
+    """
+    now = datetime.utcnow().replace(microsecond=0)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0)
+    sort = get_transaction_sort([("created_at", -1)])
+
+    owner = _OWNER_CONDITION
+    for collection in (Accounting, IncomeAccounting):
+        name = collection.__name__
+        coll_name = collection._get_collection_name()
+
+        # 儀錶板: 以使用者條件 $match 後交由 $facet 計算
+        yield f"{name}/dashboard", collection, {
+            "aggregate": coll_name,
+            "pipeline": [{"$match": owner}, {"$group": {"_id": None, "count": {"$sum": 1}}}],
+            "cursor": {}
+        }
+
+        # 交易紀錄: 預設排序分頁 / 幣別 + 日期區間篩選 / 游標分頁
+        yield f"{name}/history", collection, {
+            "find": coll_name, "filter": owner, "sort": sort, "skip": 20, "limit": 10
+        }
+        yield f"{name}/history_filtered", collection, {
+            "find": coll_name,
+            "filter": {**owner, "unit": "TWD", "created_at": {"$gte": month_start - timedelta(days=90), "$lt": now}},
+            "sort": sort, "limit": 10
+        }
+        yield f"{name}/history_cursor", collection, {
+            "find": coll_name,
+            "filter": {"$and": [owner, get_cursor_condition(sort, [now, ObjectId()])]},
+            "sort": sort, "limit": 11
+        }
+
+        # 關鍵字搜尋 / 模糊篩選 (search_tokens)
+        yield f"{name}/search", collection, {
+            "find": coll_name, "filter": {**owner, "search_tokens": {"$all": ["d:全家", "d:lunch"]}}
+        }
+
+        # 新紀錄筆數
+        yield f"{name}/unseen_count", collection, {
+            "count": coll_name, "query": {**owner, "updated_at": {"$gt": now - timedelta(days=7)}}
+        }
+
+    # 每月統計表: 本月圓餅圖 (figure.py) / 年度統計 (dashboard_api.py)
+    coll_name = MonthlySummary._get_collection_name()
+    yield "MonthlySummary/figure", MonthlySummary, {
+        "find": coll_name,
+        "filter": {**owner, "record_type": "expense", "unit": "TWD", "month": month_start}
+    }
+    yield "MonthlySummary/year", MonthlySummary, {
+        "find": coll_name,
+        "filter": {**owner, "unit": "TWD", "month": {"$gte": month_start.replace(month=1), "$lt": month_start.replace(year=month_start.year + 1, month=1)}}
+    }
+
+
+def _plan_stages(explain: Any) -> Iterator[str]:
+    """取得 explain 結果中所有 winningPlan 的 stage 名稱 (包含 aggregate 內的 $cursor 與 SBE queryPlan)"""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield from _stage_names(value)
+            else:
+                yield from _plan_stages(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _plan_stages(value)
+
+
+def _stage_names(plan: Any) -> Iterator[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stage_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stage_names(value)
+
+
+def check_query_plans() -> List[str]:
+    """
+    對每個查詢執行 explain, 檢查 winningPlan 是否出現 COLLSCAN 或 SORT
+    註: collection 不存在時 winningPlan 為 EOF, 請在有資料的環境執行
+
+    Returns:
+        不符合的查詢說明列表
+    """
+    failures = []
+    for name, collection, command in _canonical_queries():
+        database = collection._get_collection().database
+        explain = database.command("explain", command, verbosity="queryPlanner")
+
+        stages = list(_plan_stages(explain))
+        rejected = [stage for stage in stages if stage in _REJECT_STAGES]
+        print(f'{"FAIL" if rejected else "OK  "} {name}: {" <- ".join(stages)}')
+        if rejected:
+            failures.append(f"{name}: {', '.join(rejected)}")
+    return failures
+
+
+if __name__ == "__main__":
+    # 用法: python -m app.services.mongo_index_check [--sync] [--drop-extra]
+    #   --sync: 先建立 model 定義的索引
+    #   --drop-extra: 同時刪除資料庫中多餘的舊索引 (隱含 --sync)
+    from app.databases.mongo_setting import connect_mongo
+
+    connect_mongo()
+    if "--sync" in sys.argv or "--drop-extra" in sys.argv:
+        sync_indexes(drop_extra="--drop-extra" in sys.argv)
+
+    failures = check_query_plans()
+    if failures:
+        print("\n".join(["", "以下查詢未使用索引或需要記憶體排序:", *failures]))
+        sys.exit(1)
@@ -0,0 +1,193 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting, MonthlySummary
+from pymongo import DeleteOne, UpdateOne
+
+# Tools
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+__all__ = ['summary_deltas', 'apply_summary_deltas', 'rebuild_monthly_summary']
+
+# 統計 key 欄位 (對應 MonthlySummary unique index)
+_KEY_FIELDS = ("owner_id", "month", "unit", "record_type", "kind", "cost_status")
+
+SummaryDelta = Tuple[Tuple[Any, ...], int, int]  # (key, amount, count)
+
+
+def get_month_start(utc_datetime: datetime) -> datetime:
+    """
+    取得 UTC 時間所在月份的起始時間。
+
+    Args:
+        utc_datetime (datetime): UTC 時間。
+
+    Returns:
+        datetime: 該月份 1 日 00:00:00。
+    """
+    return utc_datetime.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def summary_deltas(collection: Accounting | IncomeAccounting, record: Accounting | IncomeAccounting | Dict[str, Any], sign: int = 1) -> List[SummaryDelta]:
+    """
+    計算一筆記帳資料對每月統計表的增減量。
+
+    Args:
+        collection (Accounting | IncomeAccounting): 記帳資料表。
+        record (Document | dict): 記帳資料 (mongoengine Document 或 aggregate 回傳的 dict)。
+        sign (int): 1 為新增, -1 為移除。
+
+    Returns:
+        List[SummaryDelta]: [(統計 key, 金額增減, 筆數增減)]
+    """
+    def _field(name: str):
+        # raw dict 可能缺少未儲存的欄位 (例如尚未回填的 owner_id)
+        return record.get(name) if isinstance(record, dict) else getattr(record, name)
+
+    if collection.__name__ == "Accounting":
+        record_type, kind, cost_status, amount = "expense", _field("statistics_kind"), _field("cost_status"), _field("cost")
+    else:
+        record_type, kind, cost_status, amount = "income", _field("income_kind"), None, _field("amount")
+
+    key = (
+        _field("owner_id"),
+        get_month_start(_field("created_at")),
+        _field("unit"),
+        record_type,
+        kind,
+        cost_status
+    )
+    if key[0] is None:
+        # 尚未回填 owner_id 的舊資料不列入統計 (回填後由 rebuild_monthly_summary 重建)
+        return []
+    return [(key, sign * amount, sign)]
+
+
+def apply_summary_deltas(deltas: List[SummaryDelta]):
+    """
+    將增減量以 $inc 寫回每月統計表 (相同 key 會先合併, 例如更新時金額與月份未變動則不寫入)。
+
+    Args:
+        deltas (List[SummaryDelta]): summary_deltas 的回傳結果 (可合併多筆)。
+    """
+    merged: Dict[Tuple[Any, ...], List[int]] = dict()
+    for key, amount, count in deltas:
+        total = merged.setdefault(key, [0, 0])
+        total[0] += amount
+        total[1] += count
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            dict(zip(_KEY_FIELDS, key)),
+            {"$inc": {"total": amount, "count": count}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for key, (amount, count) in merged.items() if amount or count
+    ]
+    if operations:
+        MonthlySummary._get_collection().bulk_write(operations, ordered=False)
+
+
+def _group_pipeline(owner_id: int, record_type: str, kind_field: str, amount_field: str, with_status: bool) -> List[Dict[str, Any]]:
+    """由原始記帳資料計算單一使用者的每月統計 (輸出欄位同 MonthlySummary)"""
+    return [
+        {"$match": {"owner_id": owner_id}},
+        {"$group": {
+            "_id": {
+                "month": {"$dateFromParts": {
+                    "year": {"$year": "$created_at"},
+                    "month": {"$month": "$created_at"}
+                }},
+                "unit": "$unit",
+                "kind": f"${kind_field}",
+                "cost_status": "$cost_status" if with_status else None
+            },
+            "total": {"$sum": f"${amount_field}"},
+            "count": {"$sum": 1}
+        }},
+    ]
+
+
+def _summary_from_source(owner_id: int) -> Dict[Tuple[Any, ...], Tuple[int, int]]:
+    """
+    Returns:
+        {統計 key: (total, count)}
+    """
+    result = dict()
+    for collection, args in ((Accounting, ("expense", "statistics_kind", "cost", True)),
+                             (IncomeAccounting, ("income", "income_kind", "amount", False))):
+        for row in collection._get_collection().aggregate(_group_pipeline(owner_id, *args), allowDiskUse=True):
+            group = row["_id"]
+            key = (owner_id, group["month"], group.get("unit"), args[0], group.get("kind"), group.get("cost_status"))
+            result[key] = (row["total"], row["count"])
+    return result
+
+
+def _reconcile_owner(owner_id: int, max_passes: int) -> bool:
+    """
+    比對單一使用者的每月統計與原始資料, 只改寫不一致的統計 key (以 $set 設為正確值, 多餘的 key 刪除)
+    註: 寫入中的 $inc 可能剛好落在比對與改寫之間, 每次改寫後重新比對, 直到一致或達到 max_passes
+
+    Returns:
+        bool: 是否已一致
+    """
+    summary_collection = MonthlySummary._get_collection()
+    for _ in range(max_passes):
+        expected = _summary_from_source(owner_id)
+        current = {
+            tuple(doc.get(field) for field in _KEY_FIELDS): (doc.get("total", 0), doc.get("count", 0))
+            for doc in summary_collection.find({"owner_id": owner_id})
+        }
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                dict(zip(_KEY_FIELDS, key)),
+                {"$set": {"total": total, "count": count, "updated_at": now}},
+                upsert=True
+            )
+            for key, (total, count) in expected.items() if current.get(key) != (total, count)
+        ] + [
+            DeleteOne(dict(zip(_KEY_FIELDS, key))) for key in current.keys() - expected.keys()
+        ]
+        if not operations:
+            return True
+        summary_collection.bulk_write(operations, ordered=False)
+    return False
+
+
+def rebuild_monthly_summary(owner_ids: Optional[Iterable[int]] = None, max_passes: int = 3) -> List[int]:
+    """
+    從原始記帳資料重建每月統計表 (可在服務運行中執行)
+    註: 在原本的 collection 上逐一使用者比對並只改寫不一致的 key, 不取代整個 collection,
+        重建期間寫入的 $inc 不會被覆蓋; 持續寫入的使用者在 max_passes 次比對後仍可能不一致,
+        會列在回傳結果中, 可於離峰時以 owner_ids 再次執行
+
+    Args:
+        owner_ids (Iterable[int] | None): 指定重建的使用者 (None 為全部使用者)。
+        max_passes (int): 每位使用者最多比對次數。
+
+    Returns:
+        List[int]: 仍不一致的使用者 id
+    """
+    if owner_ids is None:
+        owner_ids = set()
+        for collection in (Accounting, IncomeAccounting, MonthlySummary):
+            owner_ids.update(collection._get_collection().distinct("owner_id"))
+        owner_ids.discard(None)
+
+    MonthlySummary.ensure_indexes()
+    unsettled = [owner_id for owner_id in sorted(owner_ids) if not _reconcile_owner(owner_id, max_passes)]
+
+    if unsettled:
+        print(f'[MonthlySummary] 重建完成, 仍不一致的使用者: {unsettled}')
+    else:
+        print('[MonthlySummary] 重建完成')
+    return unsettled
+
+
+if __name__ == "__main__":
+    from app.databases.mongo_setting import connect_mongo
+
+    connect_mongo()
+    rebuild_monthly_summary()
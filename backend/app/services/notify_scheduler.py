@@ -0,0 +1,257 @@
+from datetime import datetime, time, timedelta, timezone
+from dateutil.relativedelta import relativedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# redis
+from app.databases.redis_setting import connect_redis
+
+# mysql
+from sqlalchemy.orm import Session
+from app.models.sql_model import NotifyInterval, UserBudgetSetting, UserSavingsPlan, UserExpenseNotifySetting, UserIncomeNotifySetting
+
+__all__ = ['NOTIFY_KINDS', 'NOTIFY_CHANNELS', 'get_notify_channels', 'schedule_user_notifications', 'claim_due_notifications',
+           'load_due_settings', 'reschedule_notifications', 'rebuild_notify_schedule']
+
+# redis/2 通知排程 (sorted set, score 為下一次通知的 UTC timestamp, member 為 "{通知種類}:{設定 id}")
+_SCHEDULE_KEY = "notify-schedule"
+NOTIFY_LEASE_SECONDS = 300  # 取出後暫時延後的秒數, worker 中斷時到期會再次被取出
+
+# 通知種類: (資料表, 欄位前綴 period | warning, 通知名稱)
+NOTIFY_KINDS: Dict[str, Tuple[Any, str, str]] = {
+    "budget_period": (UserBudgetSetting, "period", "定期預算通知"),
+    "budget_warning": (UserBudgetSetting, "warning", "警示預算通知"),
+    "savings_period": (UserSavingsPlan, "period", "定期存錢計畫通知"),
+    "savings_warning": (UserSavingsPlan, "warning", "目標達成通知"),
+    "expense_period": (UserExpenseNotifySetting, "period", "定期支出統計通知"),
+    "income_period": (UserIncomeNotifySetting, "period", "定期收入統計通知"),
+}
+
+# 已支援的通知方式 (Line Messaging API 尚未串接, 只開啟 Line 通知的設定不排程)
+NOTIFY_CHANNELS = ("email",)
+
+# 固定間隔的通知週期
+_INTERVALS = {
+    NotifyInterval.DAY_1: relativedelta(days=1),
+    NotifyInterval.DAY_2: relativedelta(days=2),
+    NotifyInterval.DAY_3: relativedelta(days=3),
+    NotifyInterval.WEEK_1: relativedelta(weeks=1),
+    NotifyInterval.WEEK_2: relativedelta(weeks=2),
+    NotifyInterval.MONTH_1: relativedelta(months=1),
+    NotifyInterval.QUARTERLY: relativedelta(months=3),
+    NotifyInterval.SEMIANNUALLY: relativedelta(months=6),
+    NotifyInterval.YEARLY: relativedelta(years=1),
+}
+
+# -- Lua script: 取出到期的通知並暫時延後 (多個 worker 同時執行時不會重複取出) --
+_CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #due, 2 do
+    redis.call('ZADD', KEYS[1], ARGV[3], due[i])
+end
+return due
+"""
+
+
+def _to_score(value: datetime) -> float:
+    """UTC datetime (naive) 轉為 sorted set 的 score"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _is_day_allowed(frequency: int, day: datetime) -> bool:
+    """僅平日 / 僅假日的日期判斷"""
+    if frequency == NotifyInterval.ONLY_WEEKDAY:
+        return day.weekday() < 5
+    if frequency == NotifyInterval.ONLY_WEEKEND:
+        return day.weekday() >= 5
+    return True
+
+
+def next_fire_at(frequency: int, notify_time: time, now: datetime, last_fire_at: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    計算下一次通知時間 (UTC, 一定晚於 now)
+
+    Args:
+        frequency (int): NotifyInterval
+        notify_time (time): 通知時間 (UTC 機器時間)
+        last_fire_at (datetime | None): 上一次通知時間, 沒有時從 now 之後第一個通知時間開始
+
+    Returns:
+        datetime | None: 下一次通知時間, 週期設定錯誤時為 None
+    """
+    if frequency is None or frequency not in NotifyInterval._value2member_map_:
+        return None
+
+    interval = _INTERVALS.get(frequency)
+    if last_fire_at is not None and interval is not None:
+        # 固定間隔: 從上一次通知時間往後推算 (排程停止過久時略過已錯過的次數)
+        fire_at = datetime.combine(last_fire_at.date(), notify_time) + interval
+        while fire_at <= now:
+            fire_at += interval
+        return fire_at
+
+    fire_at = datetime.combine(now.date(), notify_time)
+    if fire_at <= now:
+        fire_at += timedelta(days=1)
+    while not _is_day_allowed(frequency, fire_at):
+        fire_at += timedelta(days=1)
+    return fire_at
+
+
+def get_notify_channels(kind: str, setting) -> List[str]:
+    """
+    取得通知方式 (通知未開啟時為空列表)
+
+    Returns:
+        NOTIFY_CHANNELS 的子集合
+    """
+    prefix = NOTIFY_KINDS[kind][1]
+    if setting is None or not getattr(setting, f"is_{prefix}_notify"):
+        return []
+    return [channel for channel in NOTIFY_CHANNELS if getattr(setting, f"is_{prefix}_{channel}_notify")]
+
+
+def _get_fire_at(kind: str, setting, now: datetime, last_fire_at: Optional[datetime] = None) -> Optional[datetime]:
+    prefix = NOTIFY_KINDS[kind][1]
+    if not get_notify_channels(kind, setting):
+        return None
+    return next_fire_at(
+        getattr(setting, f"{prefix}_frequency"),
+        getattr(setting, f"{prefix}_notify_time"),
+        now, last_fire_at
+    )
+
+
+def _apply_schedule(redis_client, schedule: Dict[str, Optional[datetime]]):
+    """更新排程 (fire_at 為 None 時移除)"""
+    if not schedule:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for member, fire_at in schedule.items():
+        if fire_at is None:
+            pipe.zrem(_SCHEDULE_KEY, member)
+        else:
+            pipe.zadd(_SCHEDULE_KEY, {member: _to_score(fire_at)})
+    pipe.execute()
+
+
+def schedule_user_notifications(sqldb: Session, user_id: int):
+    """
+    依使用者目前的通知設定重新排程 (更新通知設定 / 理財計畫後呼叫)
+    註: 只在 Redis 寫入失敗時印出錯誤, 不影響設定更新結果 (可執行 rebuild_notify_schedule 修復)
+
+    Args:
+        user_id (int): 使用者 id
+    """
+    now = datetime.utcnow()
+    schedule = dict()
+    settings = dict()
+
+    for kind, (model, _, _) in NOTIFY_KINDS.items():
+        if model not in settings:
+            settings[model] = sqldb.query(model).filter(model.user_id == user_id).first()
+        setting = settings[model]
+        if setting is not None:
+            schedule[f"{kind}:{setting.id}"] = _get_fire_at(kind, setting, now)
+
+    try:
+        _apply_schedule(connect_redis(redis_db=2), schedule)
+    except Exception as e:
+        print(f'error: {e}')
+
+
+def claim_due_notifications(now: datetime, limit: int = 500) -> List[Tuple[str, datetime]]:
+    """
+    取出已到期的通知 (只讀取 score <= now 的部分, 與總使用者數無關)
+    註: 取出的通知會暫時延後 NOTIFY_LEASE_SECONDS, 處理完成後需呼叫 reschedule_notifications
+
+    Returns:
+        [(member, 原本的通知時間), ...]
+    """
+    redis_client = connect_redis(redis_db=2)
+    due = redis_client.eval(
+        _CLAIM_SCRIPT, 1, _SCHEDULE_KEY,
+        _to_score(now), limit, _to_score(now + timedelta(seconds=NOTIFY_LEASE_SECONDS))
+    )
+    return [
+        (member, datetime.utcfromtimestamp(float(score)))
+        for member, score in zip(due[0::2], due[1::2])
+    ]
+
+
+def load_due_settings(sqldb: Session, members: List[str]) -> Dict[str, Any]:
+    """
+    依到期的 member 批次查詢通知設定 (每種資料表一次 IN 查詢)
+
+    Returns:
+        {member: setting}, 設定已刪除時不包含在結果中
+    """
+    ids_by_model: Dict[Any, set] = dict()
+    for member in members:
+        kind, setting_id = member.rsplit(":", 1)
+        if kind in NOTIFY_KINDS:
+            ids_by_model.setdefault(NOTIFY_KINDS[kind][0], set()).add(int(setting_id))
+
+    settings = dict()
+    for model, ids in ids_by_model.items():
+        for setting in sqldb.query(model).filter(model.id.in_(ids)).all():
+            settings[(model, setting.id)] = setting
+
+    result = dict()
+    for member in members:
+        kind, setting_id = member.rsplit(":", 1)
+        if kind in NOTIFY_KINDS and (NOTIFY_KINDS[kind][0], int(setting_id)) in settings:
+            result[member] = settings[(NOTIFY_KINDS[kind][0], int(setting_id))]
+    return result
+
+
+def reschedule_notifications(due: List[Tuple[str, datetime]], settings: Dict[str, Any], now: datetime):
+    """
+    依通知週期排定下一次通知 (設定已關閉或刪除時移除)
+
+    Args:
+        due: claim_due_notifications 的回傳結果
+        settings: load_due_settings 的回傳結果
+    """
+    schedule = dict()
+    for member, fire_at in due:
+        kind = member.rsplit(":", 1)[0]
+        schedule[member] = _get_fire_at(kind, settings.get(member), now, fire_at) if kind in NOTIFY_KINDS else None
+    _apply_schedule(connect_redis(redis_db=2), schedule)
+
+
+def rebuild_notify_schedule(sqldb: Session, batch_size: int = 1000) -> int:
+    """
+    從資料庫重建整份通知排程 (第一次部署或 redis 資料遺失時執行)
+
+    Returns:
+        int: 排程中的通知數量
+    """
+    now = datetime.utcnow()
+    redis_client = connect_redis(redis_db=2)
+    redis_client.delete(_SCHEDULE_KEY)
+
+    for kind, (model, _, _) in NOTIFY_KINDS.items():
+        last_id = 0
+        while True:
+            rows = sqldb.query(model).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            _apply_schedule(redis_client, {
+                f"{kind}:{row.id}": fire_at for row in rows
+                if (fire_at := _get_fire_at(kind, row, now)) is not None
+            })
+            last_id = rows[-1].id
+
+    return redis_client.zcard(_SCHEDULE_KEY)
+
+
+if __name__ == "__main__":
+    # 用法: python -m app.services.notify_scheduler (重建通知排程)
+    from app.databases.mysql_setting import SessionLocal
+
+    sqldb = SessionLocal()
+    try:
+        print(f'通知排程重建完成, 共 {rebuild_notify_schedule(sqldb)} 筆')
+    finally:
+        sqldb.close()
@@ -0,0 +1,157 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting
+
+# Databases
+from app.databases.mysql_setting import SessionLocal
+from app.models.sql_model import User
+
+# Tools
+from app.services.mongo_index_check import sync_indexes
+from app.services.monthly_summary import rebuild_monthly_summary
+from datetime import datetime
+from pymongo import UpdateOne
+from typing import Any, Dict, List, Optional, Tuple
+import sys
+import time
+
+__all__ = ['backfill_owner_id', 'migrate_owner_id']
+
+# 遷移進度 (checkpoint) 存放的 collection, 中斷後可從上次位置繼續
+_MIGRATION_COLLECTION = "migrations"
+_MIGRATION_NAME = "owner_id_backfill"
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _checkpoint_id(collection: Accounting | IncomeAccounting) -> str:
+    return f"{_MIGRATION_NAME}:{collection._get_collection_name()}"
+
+
+def _resolve_owner_ids(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    一次查詢整批資料對應的使用者 id
+
+    Returns:
+        (line_user_id -> User.id, username -> User.id)
+    """
+    line_user_ids = {row["line_user_id"] for row in rows if row.get("line_user_id")}
+    user_names = {row["user_name"] for row in rows if row.get("user_name")}
+
+    sqldb = SessionLocal()
+    try:
+        users = sqldb.query(User.id, User.username, User.line_user_id).filter(
+            User.line_user_id.in_(line_user_ids) | User.username.in_(user_names)).all()
+    finally:
+        sqldb.close()
+
+    by_line = {user.line_user_id: user.id for user in users if user.line_user_id}
+    by_name = {user.username: user.id for user in users if user.username}
+    return by_line, by_name
+
+
+def backfill_owner_id(
+    collection: Accounting | IncomeAccounting,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sleep_seconds: float = 0.0
+) -> Dict[str, int]:
+    """
+    分批回填記帳資料的 owner_id (可在服務運行中執行)
+    註: 依 _id 順序處理並記錄 checkpoint, 中斷後重新執行會從上次位置繼續;
+        只更新尚未有 owner_id 的資料, 不會覆蓋新版 API 已寫入的值
+
+    Args:
+        batch_size (int): 每批處理筆數。
+        sleep_seconds (float): 每批之間的等待秒數 (降低對線上服務的負載)。
+
+    Returns:
+        {"scanned": 掃描筆數, "updated": 更新筆數, "orphans": 找不到使用者的筆數}
+    """
+    mongo_collection = collection._get_collection()
+    migrations = mongo_collection.database[_MIGRATION_COLLECTION]
+    checkpoint_id = _checkpoint_id(collection)
+
+    checkpoint = migrations.find_one({"_id": checkpoint_id}) or dict()
+    last_id = checkpoint.get("last_id")
+    stats = {key: checkpoint.get(key, 0) for key in ("scanned", "updated", "orphans")}
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else dict()
+        rows = list(mongo_collection.find(
+            query, {"user_name": 1, "line_user_id": 1, "owner_id": 1}).sort("_id", 1).limit(batch_size))
+        if not rows:
+            break
+
+        pending = [row for row in rows if row.get("owner_id") is None]
+        by_line, by_name = _resolve_owner_ids(pending) if pending else ({}, {})
+
+        operations = []
+        for row in pending:
+            # 有 Line ID 時以 Line ID 為準 (bind 使用者兩者皆有)
+            owner_id: Optional[int] = by_line.get(row.get("line_user_id")) or by_name.get(row.get("user_name"))
+            if owner_id is None:
+                stats["orphans"] += 1
+                print(f'[{collection.__name__}] 找不到使用者: _id={row["_id"]}, user_name={row.get("user_name")}, line_user_id={row.get("line_user_id")}')
+                continue
+            operations.append(UpdateOne(
+                {"_id": row["_id"], "owner_id": None}, {"$set": {"owner_id": owner_id}}))
+
+        if operations:
+            stats["updated"] += mongo_collection.bulk_write(operations, ordered=False).modified_count
+        stats["scanned"] += len(rows)
+        last_id = rows[-1]["_id"]
+
+        migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, **stats, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        print(f'[{collection.__name__}] 已處理 {stats["scanned"]} 筆, 更新 {stats["updated"]} 筆')
+
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    return stats
+
+
+def migrate_owner_id(batch_size: int = DEFAULT_BATCH_SIZE, sleep_seconds: float = 0.0, reset: bool = False) -> bool:
+    """
+    owner_id 遷移流程:
+        1. 建立 owner_id 索引並刪除舊的 user_name / line_user_id 索引 (含每月統計表舊的 unique 索引)
+        2. 分批回填 Accounting / IncomeAccounting 的 owner_id
+        3. 以 owner_id 重建每月統計表
+
+    Args:
+        reset (bool): 清除 checkpoint, 從頭重新掃描。
+
+    Returns:
+        bool: 是否全部資料都已回填 (有找不到使用者的資料時為 False, 需人工確認)
+    """
+    sync_indexes(drop_extra=True)
+
+    orphans = 0
+    for collection in (Accounting, IncomeAccounting):
+        if reset:
+            collection._get_collection().database[_MIGRATION_COLLECTION].delete_one(
+                {"_id": _checkpoint_id(collection)})
+        orphans += backfill_owner_id(collection, batch_size, sleep_seconds)["orphans"]
+
+    rebuild_monthly_summary()
+    return orphans == 0
+
+
+if __name__ == "__main__":
+    # 用法: python -m app.services.owner_migration [--batch-size N] [--sleep S] [--reset]
+    from app.databases.mongo_setting import connect_mongo
+
+    def _arg(name: str, default: Any) -> Any:
+        return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    connect_mongo()
+    completed = migrate_owner_id(
+        batch_size=_arg("--batch-size", DEFAULT_BATCH_SIZE),
+        sleep_seconds=_arg("--sleep", 0.0),
+        reset="--reset" in sys.argv
+    )
+    if not completed:
+        print("部分資料找不到對應的使用者, 這些資料不會出現在任何使用者的查詢結果中")
+        sys.exit(1)
@@ -0,0 +1,99 @@
+import os
+import time
+from dotenv import load_dotenv
+
+# 密碼加密
+from passlib.context import CryptContext
+
+# 非同步處理模組
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.error_handle import PasswordHasherBusyError
+
+load_dotenv()
+
+# bcrypt 為 CPU 密集運算 (每次約數百毫秒), 交由專用 thread pool 執行 (bcrypt 計算時會釋放 GIL)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", 16))  # 等待中的上限, 超過直接回應 503
+
+__all__ = ['hash_password', 'verify_password', 'get_password_pool_metrics']
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")  # 使用者密碼加密方式
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hasher")
+
+# 統計資料 (只在 event loop 中更新, 不需要 lock)
+_metrics = {
+    "in_flight": 0,        # 執行中 + 等待中
+    "max_queue_depth": 0,  # 等待數量的最高值
+    "completed": 0,
+    "rejected": 0,
+    "total_seconds": 0.0,  # 完成的請求 (含等待) 總耗時
+}
+
+
+def _queue_depth() -> int:
+    """等待中 (尚未分配到 worker) 的請求數量"""
+    return max(0, _metrics["in_flight"] - PASSWORD_HASH_WORKERS)
+
+
+async def _run_in_pool(func, *args):
+    """
+    在密碼專用 thread pool 執行, 等待數量已滿時直接拒絕
+
+    Raises:
+        PasswordHasherBusyError: thread pool 已飽和
+    """
+    if _metrics["in_flight"] >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+        _metrics["rejected"] += 1
+        raise PasswordHasherBusyError()
+
+    _metrics["in_flight"] += 1
+    _metrics["max_queue_depth"] = max(_metrics["max_queue_depth"], _queue_depth())
+    start_time = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _metrics["in_flight"] -= 1
+        _metrics["completed"] += 1
+        _metrics["total_seconds"] += time.perf_counter() - start_time
+
+
+async def hash_password(password: str) -> str:
+    """
+    產生密碼雜湊值
+
+    Args:
+        password (str): 使用者密碼。
+
+    Returns:
+        str: bcrypt 雜湊值。
+    """
+    return await _run_in_pool(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    """
+    驗證密碼是否正確
+
+    Args:
+        password (str): 使用者輸入的密碼。
+        hashed_password (str): 資料庫中的 bcrypt 雜湊值。
+
+    Returns:
+        bool: 密碼是否正確。
+    """
+    return await _run_in_pool(pwd_context.verify, password, hashed_password)
+
+
+def get_password_pool_metrics() -> dict:
+    """取得密碼 thread pool 的使用狀況 (供 /metrics 使用)"""
+    completed = _metrics["completed"]
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_size": PASSWORD_HASH_QUEUE_SIZE,
+        "queue_depth": _queue_depth(),
+        **_metrics,
+        "avg_seconds": round(_metrics["total_seconds"] / completed, 4) if completed else 0.0,
+    }
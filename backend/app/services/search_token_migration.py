@@ -0,0 +1,87 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting
+
+# Tools
+from app.services.mongo_index_check import sync_indexes
+from app.utils.search_tokens import SEARCH_FIELD_PREFIX, build_search_tokens
+from pymongo import UpdateOne
+from typing import Any, Dict
+import sys
+import time
+
+__all__ = ['backfill_search_tokens', 'migrate_search_tokens']
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def backfill_search_tokens(
+    collection: Accounting | IncomeAccounting,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sleep_seconds: float = 0.0,
+    rebuild: bool = False
+) -> Dict[str, int]:
+    """
+    分批建立既有記帳資料的 search_tokens (可在服務運行中執行)
+    註: 只處理尚未有 search_tokens 的資料, 中斷後重新執行會略過已完成的部分;
+        調整 tokenizer 規則後以 rebuild=True 重新產生全部資料 (例如加入 token 截斷標記前建立的資料)
+
+    Args:
+        batch_size (int): 每批處理筆數。
+        sleep_seconds (float): 每批之間的等待秒數 (降低對線上服務的負載)。
+        rebuild (bool): 是否重新產生所有資料的 search_tokens。
+
+    Returns:
+        {"scanned": 掃描筆數, "updated": 更新筆數}
+    """
+    mongo_collection = collection._get_collection()
+    fields = [field for field in SEARCH_FIELD_PREFIX if field in collection._fields]
+    condition = dict() if rebuild else {"search_tokens": {"$exists": False}}
+    stats = {"scanned": 0, "updated": 0}
+    last_id = None
+
+    while True:
+        query = {**condition, "_id": {"$gt": last_id}} if last_id else condition
+        rows = list(mongo_collection.find(query, {field: 1 for field in fields}).sort("_id", 1).limit(batch_size))
+        if not rows:
+            break
+
+        operations = [
+            UpdateOne({"_id": row["_id"]}, {"$set": {"search_tokens": build_search_tokens(
+                {field: row.get(field) for field in fields})}})
+            for row in rows
+        ]
+        stats["updated"] += mongo_collection.bulk_write(operations, ordered=False).modified_count
+        stats["scanned"] += len(rows)
+        last_id = rows[-1]["_id"]
+        print(f'[{collection.__name__}] 已處理 {stats["scanned"]} 筆, 更新 {stats["updated"]} 筆')
+
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+    return stats
+
+
+def migrate_search_tokens(batch_size: int = DEFAULT_BATCH_SIZE, sleep_seconds: float = 0.0, rebuild: bool = False):
+    """
+    search_tokens 遷移流程:
+        1. 建立 owner_id + search_tokens 索引
+        2. 分批建立 Accounting / IncomeAccounting 的 search_tokens
+    """
+    sync_indexes()
+    for collection in (Accounting, IncomeAccounting):
+        backfill_search_tokens(collection, batch_size, sleep_seconds, rebuild)
+
+
+if __name__ == "__main__":
+    # 用法: python -m app.services.search_token_migration [--batch-size N] [--sleep S] [--rebuild]
+    from app.databases.mongo_setting import connect_mongo
+
+    def _arg(name: str, default: Any) -> Any:
+        return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    connect_mongo()
+    migrate_search_tokens(
+        batch_size=_arg("--batch-size", DEFAULT_BATCH_SIZE),
+        sleep_seconds=_arg("--sleep", 0.0),
+        rebuild="--rebuild" in sys.argv
+    )
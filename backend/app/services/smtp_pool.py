@@ -0,0 +1,251 @@
+import os
+import time
+import queue
+import smtplib
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Dict, Iterator, List, Tuple
+
+# redis
+from app.databases.redis_setting import connect_redis
+
+load_dotenv()
+
+# SMTP 設定 (本機測試可使用 aiosmtpd: python -m aiosmtpd -n -l localhost:8025, 並設定 SMTP_USE_SSL=False)
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "465"))
+SMTP_USER = os.environ.get("SMTP_USER")
+SMTP_APP_PASSWORD = os.environ.get("SMTP_APP_PASSWORD")  # Gmail 應用程式密碼, 未設定時不登入
+SMTP_FROM = os.environ.get("SMTP_FROM", SMTP_USER)
+SMTP_USE_SSL = os.environ.get("SMTP_USE_SSL", "True") == "True"  # False 時使用一般 SMTP (可搭配 SMTP_STARTTLS)
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "False") == "True"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 10))
+
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 4))  # 每個 worker process 的連線數上限
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))  # 超過後重新連線 (Gmail 會限制單一連線的寄送數)
+SMTP_IDLE_CHECK_SECONDS = int(os.environ.get("SMTP_IDLE_CHECK_SECONDS", 30))  # 閒置超過秒數的連線使用前先 NOOP
+
+__all__ = ['EmailMessage', 'SendFailure', 'send_messages', 'record_retry', 'get_mail_metrics']
+
+# redis/2 寄信統計 (各 worker process 累加, /metrics 讀取)
+_METRICS_KEY = "mail-metrics"
+
+EmailMessage = Tuple[str, str, str]  # (收件者, 主旨, 內容)
+
+
+@dataclass
+class SendFailure:
+    """
+    寄送失敗的信件
+
+    Attributes:
+        index (int): 在 send_messages 傳入列表中的位置。
+        error (str): 錯誤訊息。
+        permanent (bool): 是否為永久錯誤 (例如收件者不存在, 不需重試)。
+    """
+    index: int
+    error: str
+    permanent: bool
+
+
+@dataclass
+class _PooledConnection:
+    server: smtplib.SMTP
+    sent: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SmtpConnectionPool:
+    """
+    已登入的 SMTP 連線池 (每個 process 各自擁有, prefork fork 後重新建立)
+    註: 連線在同一批信件中重複使用, 避免每封信都重新 TLS 交握與登入
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE):
+        self.size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _open(self) -> _PooledConnection:
+        if SMTP_USE_SSL:
+            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                server.starttls()
+
+        if SMTP_APP_PASSWORD:
+            server.login(SMTP_USER, SMTP_APP_PASSWORD)
+
+        _record_metrics({"connections_opened": 1})
+        return _PooledConnection(server)
+
+    @staticmethod
+    def _is_alive(conn: _PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return conn.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn: _PooledConnection):
+        try:
+            conn.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _acquire(self) -> _PooledConnection:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if self._is_alive(conn):
+                return conn
+            self._close(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[_PooledConnection]:
+        """
+        取得連線 (連線數達上限時等待), 使用完畢後放回連線池
+        註: 發生連線錯誤或寄送數超過 SMTP_MAX_MESSAGES_PER_CONNECTION 時關閉連線
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._acquire()
+            yield conn
+        except (smtplib.SMTPException, OSError):
+            if conn is not None:
+                self._close(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                conn.last_used = time.monotonic()
+                if conn.sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+                    self._close(conn)
+                else:
+                    self._idle.put(conn)
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pool = SmtpConnectionPool()
+
+
+def _build_message(to_email: str, subject: str, body: str) -> str:
+    message = MIMEMultipart()
+    message["From"] = SMTP_FROM
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message.as_string()
+
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx 回應 (收件者被拒, 內容被拒) 重試也不會成功"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused)):
+        return error.smtp_code >= 500
+    return False
+
+
+def _send_chunk(messages: List[EmailMessage], offset: int, failures: List[SendFailure], metrics: Dict[str, float]):
+    """以單一連線寄送 (信件數不超過 SMTP_MAX_MESSAGES_PER_CONNECTION)"""
+    index = offset
+    try:
+        with _pool.connection() as conn:
+            for index, (to_email, subject, body) in enumerate(messages, start=offset):
+                start_time = time.perf_counter()
+                try:
+                    conn.server.sendmail(SMTP_FROM, to_email, _build_message(to_email, subject, body))
+                    conn.sent += 1
+                    metrics["sent"] += 1
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                    failures.append(SendFailure(index, str(e), _is_permanent(e)))
+                    conn.server.rset()
+                finally:
+                    metrics["send_seconds"] += time.perf_counter() - start_time
+
+    except (smtplib.SMTPException, OSError) as e:
+        # 連線失敗或中斷: 這個連線尚未寄出的信件全部回傳 (暫時性錯誤)
+        if failures and failures[-1].index == index:
+            index += 1
+        failures += [SendFailure(i, str(e), False) for i in range(index, offset + len(messages))]
+
+
+def send_messages(messages: List[EmailMessage]) -> List[SendFailure]:
+    """
+    以連線池中的 SMTP 連線依序寄送多封信件 (阻塞操作, 由 celery mail worker 呼叫)
+    註: 每個連線最多寄送 SMTP_MAX_MESSAGES_PER_CONNECTION 封, 連線中斷時剩餘信件皆視為暫時性錯誤, 由呼叫端決定是否重試
+
+    Returns:
+        List[SendFailure]: 寄送失敗的信件
+    """
+    failures: List[SendFailure] = []
+    metrics = {"sent": 0, "failed": 0, "send_seconds": 0.0, "batches": 1}
+
+    for offset in range(0, len(messages), SMTP_MAX_MESSAGES_PER_CONNECTION):
+        _send_chunk(messages[offset:offset + SMTP_MAX_MESSAGES_PER_CONNECTION], offset, failures, metrics)
+
+    metrics["failed"] = len(failures)
+    _record_metrics(metrics)
+    return failures
+
+
+def _record_metrics(metrics: Dict[str, float]):
+    """累加寄信統計 (redis 失敗時不影響寄信)"""
+    try:
+        pipe = connect_redis(redis_db=2).pipeline(transaction=False)
+        for name, value in metrics.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(_METRICS_KEY, name, value)
+            else:
+                pipe.hincrby(_METRICS_KEY, name, value)
+        pipe.execute()
+    except Exception as e:
+        print(f'error: {e}')
+
+
+def get_mail_metrics() -> Dict[str, float]:
+    """
+    取得寄信統計 (供 /metrics 使用, 吞吐量可由 sent 的變化率計算)
+
+    Returns:
+        {"sent", "failed", "retried", "batches", "connections_opened", "send_seconds", "avg_send_seconds", "messages_per_connection"}
+    """
+    raw = connect_redis(redis_db=2).hgetall(_METRICS_KEY)
+    metrics: Dict[str, float] = {
+        name: float(raw.get(name, 0))
+        for name in ("sent", "failed", "retried", "batches", "connections_opened", "send_seconds")
+    }
+    sent, connections = metrics["sent"], metrics["connections_opened"]
+    metrics["avg_send_seconds"] = round(metrics["send_seconds"] / sent, 4) if sent else 0.0
+    metrics["messages_per_connection"] = round(sent / connections, 2) if connections else 0.0
+    return metrics
+
+
+def record_retry():
+    """紀錄重試次數 (由 deliver_email 重試時呼叫)"""
+    _record_metrics({"retried": 1})
@@ -5,24 +5,18 @@ from dotenv import load_dotenv
 # redis
 from app.databases.redis_setting import connect_redis
 
-# SMTP services
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+# 信件交由 celery mail worker 寄送 (SMTP 連線設定見 smtp_pool)
+from app.tasks.mail_tasks import deliver_email
 
 # 非同步處理模組
 import asyncio
 
 load_dotenv()
 
-# 發送 Gmail SMTP 驗證碼的服務 (使用 Gmail 註冊時需要)
-SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.environ.get("SMTP_PORT", "465"))
-SMTP_USER = os.environ.get("SMTP_USER")
-SMTP_APP_PASSWORD = os.environ.get("SMTP_APP_PASSWORD")  # Gmail 應用程式密碼
 
+__all__ = ['send_email', 'send_notify_email', 'get_notify_subject', 'verify_digital_code']
 
-__all__ = ['send_email', 'verify_digital_code']
+_EMAIL_SUBJECT = "Sapphire 財務管理專案"
 
 
 def set_digital_code(to_email: str) -> str:
@@ -55,24 +49,27 @@ async def send_email(to_email: str):
     loop = asyncio.get_running_loop()
 
     def _handle_email():
-        message = MIMEMultipart()
-        message["From"] = SMTP_USER
-        message["To"] = to_email
-        message["Subject"] = "Sapphire 財務管理專案"
-
         body = f"Sapphire 財務管理驗證碼通知，您的驗證碼為： {set_digital_code(to_email=to_email)}, 此驗證碼將於 5 分鐘後失效，請盡快完成驗證。"
-        message.attach(MIMEText(body, "plain"))
+        deliver_email.delay(to_email, _EMAIL_SUBJECT, body)
 
-        try:
-            with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-                server.login(SMTP_USER, SMTP_APP_PASSWORD)
-                server.sendmail(SMTP_USER, to_email, message.as_string())
+    await loop.run_in_executor(None, _handle_email)
 
-            print(f'{to_email} 信件已送達')
-        except Exception as e:
-            print(f"{to_email} 信件送達失敗, {e}")
 
-    await loop.run_in_executor(None, _handle_email)
+def get_notify_subject(title: str) -> str:
+    """通知信主旨"""
+    return f"{_EMAIL_SUBJECT} - {title}"
+
+
+def send_notify_email(to_email: str, title: str, body: str):
+    """
+    發送通知信 (送入 mail queue, 大量發送時請使用 mail_tasks.enqueue_email_batches)。
+
+    Args:
+        to_email (str): 目標使用者信箱。
+        title (str): 通知名稱 (例如: 定期預算通知)。
+        body (str): 信件內容。
+    """
+    deliver_email.delay(to_email, get_notify_subject(title), body)
 
 
 async def verify_digital_code(to_email: str, code: str) -> bool:
@@ -0,0 +1,541 @@
+# mongo models
+from app.models.mongo_model import Accounting, IncomeAccounting
+from app.databases.mongo_setting import get_async_mongo_db
+
+# Tools
+from app.schemas.accounting import FilterRow
+from app.utils.query_map import handle_filter_query
+from app.utils.error_handle import InvalidCursorError
+from app.utils.search_tokens import SEARCH_FIELD_PREFIX, field_query_tokens
+from bson import SON, json_util
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import orjson
+import zlib
+
+__all__ = ['get_transaction_match_condition', 'get_transaction_page', 'get_transaction_cursor_page',
+           'get_api_projection', 'search_transactions', 'stream_transaction_export', 'EXPORT_FORMATS',
+           'get_ledger_queries', 'get_ledger_sort_order', 'get_ledger_page', 'get_ledger_cursor_page']
+
+# 匯出格式: media type
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+_EXPORT_BATCH_SIZE = 500  # 每次從 cursor 取回 / 輸出的筆數
+
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 關鍵字搜尋: 各欄位的權重, 與至少需符合的 token 比例 (任一欄位)
+_SEARCH_WEIGHTS = {"cost_name": 3, "store_name": 2, "payer": 2, "description": 1}
+_SEARCH_MIN_MATCH = 0.5
+
+# 交易紀錄回傳欄位 (只取回頁面需要的欄位)
+_ACCOUNTING_FIELDS = (
+    "user_name", "statistics_kind", "category", "store_name", "cost_name",
+    "cost", "unit", "pay_method", "cost_status", "description", "created_at"
+)
+_INCOME_FIELDS = (
+    "user_name", "income_kind", "category", "amount", "unit",
+    "payer", "pay_account", "description", "created_at"
+)
+
+# 合併帳本 (支出 + 收入) 的統一欄位, 與各資料表對應的欄位名稱 (未列出的欄位兩邊同名)
+_LEDGER_FIELDS = ("record_type", "kind", "category", "name", "amount", "unit", "description", "created_at")
+_LEDGER_COLLECTIONS = {
+    "expense": Accounting,
+    "income": IncomeAccounting,
+}
+_LEDGER_FIELD_MAP = {
+    "expense": {"kind": "statistics_kind", "name": "cost_name", "amount": "cost"},
+    "income": {"kind": "income_kind", "name": "payer", "amount": "amount"},
+}
+_NON_NULL_SORT_FIELDS = ("created_at", "_id")  # 一定有值的排序欄位 (游標條件不需處理 null)
+_LEDGER_SORT_FIELDS = ("kind", "category", "name", "amount", "unit", "created_at")
+
+
+def get_transaction_match_condition(owner_id: int, query: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    設定使用者的查詢條件 (所有登入方式皆以 owner_id 查詢, 對應 owner_indexes 的索引前綴)
+
+    Args:
+        owner_id (int): MySQL User.id (principal.user_id)
+        query (Dict[str, Any]): handle_filter_query 轉換後的篩選條件
+    """
+    return {"owner_id": owner_id, **query}
+
+
+def get_transaction_sort(sort_order: List[Tuple[str, int]]) -> SON:
+    """
+    將排序條件合併為單一 $sort (依序比較), 並以 _id 作為最後排序鍵確保分頁結果穩定
+    """
+    sort = SON((field, order) for field, order in sort_order)
+    if "_id" not in sort:
+        sort["_id"] = sort_order[-1][1] if sort_order else -1
+    return sort
+
+
+async def get_transaction_page(
+    collection: Accounting | IncomeAccounting,
+    match_condition: Dict[str, Any],
+    sort_order: List[Tuple[str, int]],
+    start_index: int,
+    per_page: int
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    取得單頁記帳資料
+    註: 只在資料庫端 $skip/$limit 取回當頁資料, 總筆數另外以 count_documents 計算
+
+    Returns:
+        response_data: 記帳資料
+        max_page, 最大頁數
+    """
+    fields = _ACCOUNTING_FIELDS if collection.__name__ == "Accounting" else _INCOME_FIELDS
+    mongo_collection = get_async_mongo_db()[collection._get_collection_name()]
+
+    pipeline = [
+        {"$match": match_condition},
+        {"$sort": get_transaction_sort(sort_order)},
+        {"$skip": start_index},
+        {"$limit": per_page},
+        {"$project": get_api_projection(fields)}
+    ]
+    # 當頁資料與總筆數同時查詢
+    transaction_data, total_count = await asyncio.gather(
+        _aggregate(mongo_collection, pipeline),
+        mongo_collection.count_documents(match_condition)
+    )
+    max_page = (total_count + per_page - 1) // per_page
+
+    return transaction_data, max_page
+
+
+async def _aggregate(mongo_collection, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """以 async client 執行 aggregate 並取回全部結果"""
+    cursor = await mongo_collection.aggregate(pipeline)
+    return await cursor.to_list()
+
+
+def get_api_projection(fields: Tuple[str, ...], sort: Optional[SON] = None) -> Dict[str, Any]:
+    """
+    在資料庫端直接轉換為 API 回傳格式 ($project), 不需建立 mongoengine Document 或逐筆 strftime
+    (fields 最後一個欄位為 created_at)
+
+    Args:
+        sort (SON | None): 游標分頁時另外取回排序鍵的原始值 (_sort), 供 encode_transaction_cursor 使用
+    """
+    projection = {
+        "_id": 0,
+        "id": {"$toString": "$_id"},
+        # 缺少的欄位回傳 null (同 Document.to_api_format)
+        **{field: {"$ifNull": [f"${field}", None]} for field in fields[:-1]},
+        "created_at": {"$dateToString": {"format": _DATETIME_FORMAT, "date": "$created_at"}},
+    }
+    if sort is not None:
+        # 缺少的欄位需回傳 null ($project 會省略不存在的欄位), 游標值的數量才會與 sort 一致
+        projection["_sort"] = {f"k{index}": {"$ifNull": [f"${field}", None]} for index, field in enumerate(sort)}
+    return projection
+
+
+def encode_transaction_cursor(sort: SON, values: List[Any]) -> str:
+    """
+    將最後一筆資料的排序鍵編碼為不透明的游標字串
+
+    Args:
+        sort (SON): get_transaction_sort 的回傳結果
+        values (List[Any]): 當頁最後一筆資料的排序鍵原始值 (依 sort 順序)
+    """
+    cursor = {"sort": list(sort.items()), "values": values}
+    return base64.urlsafe_b64encode(json_util.dumps(cursor).encode()).decode()
+
+
+def decode_transaction_cursor(cursor: str, sort: SON) -> List[Any]:
+    """
+    解析游標字串, 並確認游標的排序條件與目前查詢一致
+
+    Returns:
+        排序鍵對應的值
+
+    Raises:
+        InvalidCursorError: 游標格式錯誤或排序條件不同
+    """
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursorError()
+
+    if not isinstance(data, dict) or [tuple(item) for item in data.get("sort", [])] != list(sort.items()):
+        raise InvalidCursorError()
+    if len(data.get("values", [])) != len(sort):
+        raise InvalidCursorError()
+    return data["values"]
+
+
+def get_cursor_condition(sort: SON, values: List[Any]) -> Dict[str, Any]:
+    """
+    建立從游標位置往後查詢的範圍條件 (依排序鍵逐一比較)
+    例如 sort = (created_at: -1, _id: -1):
+        {"$or": [{"created_at": {"$lt": v1}}, {"created_at": v1, "_id": {"$lt": v2}}]}
+
+    註: 排序欄位需為同一種資料型態 (MongoDB 比較運算子不跨型態比較), null 與缺少的欄位視為最小值
+    """
+    conditions = []
+    prefix: Dict[str, Any] = dict()
+    for (field, order), value in zip(sort.items(), values):
+        if value is None:
+            # null (含缺少的欄位) 排序在所有值之前: 遞增時之後為所有非 null 的值, 遞減時之後沒有其他值
+            if order == 1:
+                conditions.append({**prefix, field: {"$ne": None}})
+        elif order == -1 and field not in _NON_NULL_SORT_FIELDS:
+            # 遞減時 null 排在最後 ($lt 不跨型態比較, 需另外加上 null)
+            conditions.append({**prefix, "$or": [{field: {"$lt": value}}, {field: None}]})
+        else:
+            conditions.append(
+                {**prefix, field: {"$gt" if order == 1 else "$lt": value}})
+        prefix[field] = value
+    return {"$or": conditions}
+
+
+async def get_transaction_cursor_page(
+    collection: Accounting | IncomeAccounting,
+    match_condition: Dict[str, Any],
+    sort_order: List[Tuple[str, int]],
+    cursor: Optional[str],
+    per_page: int
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    以游標 (keyset) 方式取得單頁記帳資料
+    註: 以範圍條件接續上一頁的最後一筆, 不論翻到第幾頁查詢成本都相同 (不使用 $skip 與總筆數)
+
+    Returns:
+        response_data: 記帳資料
+        next_cursor: 下一頁游標, 沒有下一頁時為 None
+    """
+    fields = _ACCOUNTING_FIELDS if collection.__name__ == "Accounting" else _INCOME_FIELDS
+    sort = get_transaction_sort(sort_order)
+
+    if cursor:
+        match_condition = {"$and": [
+            match_condition,
+            get_cursor_condition(sort, decode_transaction_cursor(cursor, sort))
+        ]}
+
+    # 多取一筆判斷是否還有下一頁
+    transaction_data = await _aggregate(get_async_mongo_db()[collection._get_collection_name()], [
+        {"$match": match_condition},
+        {"$sort": sort},
+        {"$limit": per_page + 1},
+        {"$project": get_api_projection(fields, sort)}
+    ])
+
+    has_next = len(transaction_data) > per_page
+    transaction_data = transaction_data[:per_page]
+    sort_values = [list(data.pop("_sort").values()) for data in transaction_data]
+    next_cursor = encode_transaction_cursor(
+        sort, sort_values[-1]) if has_next else None
+
+    return transaction_data, next_cursor
+
+
+def get_ledger_queries(filters: List[FilterRow]) -> Dict[str, Dict[str, Any]]:
+    """
+    將合併帳本的篩選條件 (統一欄位名稱, 例如 name / kind / amount) 轉換為支出、收入各自的查詢條件
+    註: 篩選條件包含某一邊沒有的欄位時 (例如 pay_method / payer), 該資料表不會出現在結果中;
+        排除條件 (ne / exclude) 則直接略過該欄位
+
+    Returns:
+        {"expense": mongo_query, "income": mongo_query} (不符合的資料表不會出現)
+    """
+    queries = dict()
+    for record_type, collection in _LEDGER_COLLECTIONS.items():
+        field_map = _LEDGER_FIELD_MAP[record_type]
+        rows, matched = [], True
+        for row in filters:
+            field = field_map.get(row.field, row.field)
+            if field in collection._fields or field == "date":
+                rows.append(row.model_copy(update={"field": field}))
+            elif row.operator not in ("ne", "exclude"):
+                matched = False
+                break
+        if matched:
+            queries[record_type] = handle_filter_query(query=rows)["mongo_query"]
+    return queries
+
+
+def get_ledger_sort_order(filters: List[FilterRow]) -> List[Tuple[str, int]]:
+    """
+    合併帳本的排序條件 (統一欄位名稱)
+
+    Raises:
+        ValueError: 排序欄位不在 _LEDGER_SORT_FIELDS 中
+    """
+    sort_order = handle_filter_query(query=filters)["sort_order"]
+    for field, _ in sort_order:
+        if field not in _LEDGER_SORT_FIELDS:
+            raise ValueError(f"合併帳本不支援以 {field} 排序")
+    return sort_order
+
+
+def _ledger_branch(
+    record_type: str,
+    match_condition: Dict[str, Any],
+    sort: SON,
+    limit: Optional[int]
+) -> List[Dict[str, Any]]:
+    """
+    單一資料表轉換為統一欄位的 pipeline
+    註: limit 不為 None 時先在資料表內 $sort + $limit (可使用 owner_id 開頭的索引), 合併後只需排序少量資料
+    """
+    field_map = _LEDGER_FIELD_MAP[record_type]
+    pipeline: List[Dict[str, Any]] = [{"$match": match_condition}]
+    if limit is not None:
+        pipeline += [
+            {"$sort": SON((field_map.get(field, field), order) for field, order in sort.items())},
+            {"$limit": limit}
+        ]
+    pipeline.append({"$project": {
+        "record_type": {"$literal": record_type},
+        **{field: f"${field_map.get(field, field)}" for field in _LEDGER_FIELDS[1:]}
+    }})
+    return pipeline
+
+
+async def _aggregate_ledger(
+    owner_id: int,
+    queries: Dict[str, Dict[str, Any]],
+    sort: SON,
+    cursor_values: Optional[List[Any]],
+    skip: int,
+    limit: int,
+    with_balance: bool
+) -> List[Dict[str, Any]]:
+    """
+    以 $unionWith 在資料庫端合併支出與收入, 依統一欄位排序後取回 [skip, skip + limit) 的資料
+
+    不含餘額: 游標條件與 $limit 先套用在各資料表 (各自使用索引), 合併後再排序取前 limit 筆
+    含餘額: 依時間順序以 $setWindowFields 累加 (支出為負, 收入為正, 依幣別分開計算),
+            需先取得篩選後的全部資料, 游標條件與分頁在累加之後套用, 餘額不受分頁影響
+    """
+    branches = []
+    for record_type, query in queries.items():
+        field_map = _LEDGER_FIELD_MAP[record_type]
+        match_condition = get_transaction_match_condition(owner_id, query)
+        if cursor_values is not None and not with_balance:
+            branch_sort = SON((field_map.get(field, field), order) for field, order in sort.items())
+            match_condition = {"$and": [match_condition, get_cursor_condition(branch_sort, cursor_values)]}
+        branches.append((record_type, _ledger_branch(
+            record_type, match_condition, sort, None if with_balance else skip + limit)))
+
+    if not branches:
+        return []
+
+    (first_type, pipeline), *others = branches
+    for record_type, branch in others:
+        pipeline.append({"$unionWith": {
+            "coll": _LEDGER_COLLECTIONS[record_type]._get_collection_name(),
+            "pipeline": branch
+        }})
+
+    fields = _LEDGER_FIELDS
+    if with_balance:
+        fields = (*_LEDGER_FIELDS[:-1], "balance", "created_at")
+        pipeline.append({"$setWindowFields": {
+            "partitionBy": "$unit",
+            "sortBy": {"created_at": 1, "_id": 1},
+            "output": {"balance": {
+                "$sum": {"$cond": [{"$eq": ["$record_type", "expense"]}, {"$multiply": ["$amount", -1]}, "$amount"]},
+                "window": {"documents": ["unbounded", "current"]}
+            }}
+        }})
+        if cursor_values is not None:
+            pipeline.append({"$match": get_cursor_condition(sort, cursor_values)})
+
+    pipeline += [{"$sort": sort}, {"$skip": skip}, {"$limit": limit}] if skip else [{"$sort": sort}, {"$limit": limit}]
+    pipeline.append({"$project": get_api_projection(fields, sort)})
+
+    cursor = await get_async_mongo_db()[_LEDGER_COLLECTIONS[first_type]._get_collection_name()].aggregate(
+        pipeline, allowDiskUse=with_balance)
+    return await cursor.to_list()
+
+
+async def get_ledger_page(
+    owner_id: int,
+    queries: Dict[str, Dict[str, Any]],
+    sort_order: List[Tuple[str, int]],
+    start_index: int,
+    per_page: int,
+    with_balance: bool = False
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    取得合併帳本 (支出 + 收入) 的單頁資料
+
+    Args:
+        queries (Dict[str, Dict[str, Any]]): get_ledger_queries 的回傳結果
+        with_balance (bool): 是否回傳累計餘額 (balance)
+
+    Returns:
+        response_data: 帳本資料 (record_type: expense | income)
+        max_page, 最大頁數
+    """
+    mongo_db = get_async_mongo_db()
+    ledger_data, *counts = await asyncio.gather(
+        _aggregate_ledger(owner_id, queries, get_transaction_sort(sort_order), None, start_index, per_page, with_balance),
+        *(mongo_db[_LEDGER_COLLECTIONS[record_type]._get_collection_name()].count_documents(
+            get_transaction_match_condition(owner_id, query)) for record_type, query in queries.items())
+    )
+    for data in ledger_data:
+        data.pop("_sort")
+    max_page = (sum(counts) + per_page - 1) // per_page
+
+    return ledger_data, max_page
+
+
+async def get_ledger_cursor_page(
+    owner_id: int,
+    queries: Dict[str, Dict[str, Any]],
+    sort_order: List[Tuple[str, int]],
+    cursor: Optional[str],
+    per_page: int,
+    with_balance: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    以游標 (keyset) 方式取得合併帳本的單頁資料 (游標格式同 get_transaction_cursor_page)
+    註: 支出與收入的 _id 皆為 ObjectId, 合併後仍可作為最後排序鍵
+
+    Returns:
+        response_data: 帳本資料 (record_type: expense | income)
+        next_cursor: 下一頁游標, 沒有下一頁時為 None
+    """
+    sort = get_transaction_sort(sort_order)
+    cursor_values = decode_transaction_cursor(cursor, sort) if cursor else None
+
+    # 多取一筆判斷是否還有下一頁
+    ledger_data = await _aggregate_ledger(owner_id, queries, sort, cursor_values, 0, per_page + 1, with_balance)
+
+    has_next = len(ledger_data) > per_page
+    ledger_data = ledger_data[:per_page]
+    sort_values = [list(data.pop("_sort").values()) for data in ledger_data]
+    next_cursor = encode_transaction_cursor(
+        sort, sort_values[-1]) if has_next else None
+
+    return ledger_data, next_cursor
+
+
+async def search_transactions(
+    collection: Accounting | IncomeAccounting,
+    owner_id: int,
+    keyword: str,
+    start_index: int,
+    per_page: int
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    關鍵字搜尋 (依相關程度排序)
+    註: 以 owner_id + search_tokens 索引取得候選資料 ($in), 再依各欄位符合的 token 比例與權重計算分數;
+        只有候選資料會進入排序, 不需掃描使用者的全部資料
+
+    Returns:
+        response_data: 記帳資料 (含 score)
+        has_next: 是否還有下一頁
+    """
+    fields = _ACCOUNTING_FIELDS if collection.__name__ == "Accounting" else _INCOME_FIELDS
+    field_tokens = {
+        field: tokens for field in SEARCH_FIELD_PREFIX
+        if field in collection._fields and (tokens := field_query_tokens(field, keyword))
+    }
+    if not field_tokens:
+        return [], False
+
+    # 各欄位符合的 token 比例 (0 ~ 1)
+    ratios = {
+        field: {"$divide": [
+            {"$size": {"$filter": {"input": tokens, "cond": {"$in": ["$$this", "$search_tokens"]}}}}, len(tokens)]}
+        for field, tokens in field_tokens.items()
+    }
+    transaction_data = await _aggregate(get_async_mongo_db()[collection._get_collection_name()], [
+        {"$match": {
+            "owner_id": owner_id,
+            "search_tokens": {"$in": sorted({token for tokens in field_tokens.values() for token in tokens})}
+        }},
+        {"$addFields": {
+            "_best": {"$max": list(ratios.values())},
+            "_score": {"$add": [{"$multiply": [_SEARCH_WEIGHTS[field], ratio]} for field, ratio in ratios.items()]}
+        }},
+        {"$match": {"_best": {"$gte": _SEARCH_MIN_MATCH}}},
+        {"$sort": {"_score": -1, "created_at": -1, "_id": -1}},
+        {"$skip": start_index},
+        {"$limit": per_page + 1},
+        {"$project": {**get_api_projection(fields), "score": {"$round": ["$_score", 3]}}}
+    ])
+
+    return transaction_data[:per_page], len(transaction_data) > per_page
+
+
+def _encode_export_rows(export_format: str, fields: Tuple[str, ...], rows: List[Dict[str, Any]]) -> str:
+    """將一批資料轉換為 CSV / NDJSON 文字"""
+    if export_format == "ndjson":
+        return b"".join(orjson.dumps(row) + b"\n" for row in rows).decode("utf-8")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=("id", *fields), lineterminator="\n")
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def stream_transaction_export(
+    collection: Accounting | IncomeAccounting,
+    match_condition: Dict[str, Any],
+    sort_order: List[Tuple[str, int]],
+    export_format: str = "csv",
+    use_gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    逐批讀取 mongo cursor 並輸出匯出檔內容 (供 StreamingResponse 使用)
+    註: 每次只保留 _EXPORT_BATCH_SIZE 筆資料在記憶體中, 與匯出總筆數無關
+
+    Args:
+        export_format (str): csv | ndjson (EXPORT_FORMATS)
+        use_gzip (bool): 是否以 gzip 壓縮輸出
+
+    Yields:
+        bytes: 匯出檔內容片段
+    """
+    fields = _ACCOUNTING_FIELDS if collection.__name__ == "Accounting" else _INCOME_FIELDS
+    compressor = zlib.compressobj(wbits=31) if use_gzip else None  # wbits=31: gzip 格式
+
+    def _encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    if export_format == "csv":
+        # BOM 讓 Excel 以 UTF-8 開啟中文欄位
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow(("id", *fields))
+        yield _encode("\ufeff" + header.getvalue())
+
+    cursor = await get_async_mongo_db()[collection._get_collection_name()].aggregate([
+        {"$match": match_condition},
+        {"$sort": get_transaction_sort(sort_order)},
+        {"$project": get_api_projection(fields)}
+    ], batchSize=_EXPORT_BATCH_SIZE)
+    try:
+        rows = []
+        async for data in cursor:
+            rows.append(data)
+            if len(rows) >= _EXPORT_BATCH_SIZE:
+                chunk = _encode(_encode_export_rows(export_format, fields, rows))
+                rows = []
+                if chunk:
+                    yield chunk
+
+        chunk = _encode(_encode_export_rows(export_format, fields, rows)) if rows else b""
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+
+    finally:
+        await cursor.close()
@@ -0,0 +1,118 @@
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from typing import Tuple
+
+# Databases
+from app.databases.redis_setting import connect_async_redis
+
+load_dotenv()
+
+__all__ = ['incr_unseen_records', 'get_unseen_record_count',
+           'init_unseen_records', 'reset_unseen_records']
+
+# redis/2 交易紀錄新紀錄筆數 (側邊欄徽章)
+# unseen-record:{owner_id} (hash):
+#   count: 上次瀏覽後新增/更新的筆數 (記帳寫入時 HINCRBY)
+#   since: 上次瀏覽時間 (UTC ISO 格式), 不存在時表示計數尚未初始化 (由資料庫重新計算)
+# unseen-record-persist:{owner_id}: 瀏覽時間近期已寫入 MySQL (SET NX, 過期前不再寫入)
+_UNSEEN_KEY = "unseen-record"
+_PERSIST_KEY = "unseen-record-persist"
+_UNSEEN_TTL = 30 * 24 * 60 * 60  # 超過 30 天未瀏覽時自然過期, 之後由資料庫重新計算 (s)
+UNSEEN_PERSIST_INTERVAL = int(os.environ.get("UNSEEN_PERSIST_INTERVAL", 10 * 60))  # 瀏覽時間寫入 MySQL 的最短間隔 (s)
+
+# 初始化計數 (已初始化時不變動): count 加上 (資料庫筆數 - 計算前讀取的 count), 保留計算期間 HINCRBY 的筆數
+# KEYS[1]: unseen-record:{owner_id}, ARGV: 資料庫筆數, 計算前的 count, since, TTL
+_INIT_IF_ABSENT = """
+if redis.call('HEXISTS', KEYS[1], 'since') == 0 then
+    redis.call('HINCRBY', KEYS[1], 'count', ARGV[1] - ARGV[2])
+    redis.call('HSET', KEYS[1], 'since', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return redis.call('HGET', KEYS[1], 'count')
+"""
+
+
+def _unseen_key(owner_id: int) -> str:
+    return f"{_UNSEEN_KEY}:{owner_id}"
+
+
+async def incr_unseen_records(owner_id: int, count: int = 1):
+    """
+    累加新紀錄筆數 (記帳新增/更新後呼叫)
+    註: 以寫入次數計算, 同一筆資料更新多次會重複計算; 刪除資料不扣除
+        計數尚未初始化時只會建立 count 欄位, 讀取時仍視為未初始化
+
+    Args:
+        count (int): 新增/更新的筆數
+    """
+    if count <= 0:
+        return
+
+    try:
+        await connect_async_redis(redis_db=2).hincrby(_unseen_key(owner_id), "count", count)
+    except Exception as e:
+        print(f'error: {e}')
+
+
+async def get_unseen_record_count(owner_id: int) -> Tuple[int, bool]:
+    """
+    取得新紀錄筆數 (一次 HMGET)
+
+    Returns:
+        (筆數, 是否已初始化); 未初始化或 redis 無法使用時, 改由資料庫計算後呼叫 init_unseen_records
+        (未初始化時的筆數為計算前已累加的 count, 作為 init_unseen_records 的 baseline)
+    """
+    try:
+        count, since = await connect_async_redis(redis_db=2).hmget(_unseen_key(owner_id), "count", "since")
+    except Exception as e:
+        print(f'error: {e}')
+        return 0, False
+
+    return int(count or 0), since is not None
+
+
+async def init_unseen_records(owner_id: int, count: int, since: datetime, baseline: int = 0) -> int:
+    """
+    以資料庫計算的筆數初始化計數 (已由其他請求初始化時不變動)
+    註: 不直接覆寫 count, 計算期間寫入的 HINCRBY 不會遺失 (可能與資料庫筆數重複計算)
+
+    Args:
+        count (int): 上次瀏覽後新增/更新的筆數 (資料庫計算)
+        since (datetime): 上次瀏覽時間 (UTC)
+        baseline (int): 計算前讀取的 count (get_unseen_record_count 的回傳值)
+
+    Returns:
+        int: 初始化後的筆數 (redis 無法使用時為資料庫計算的筆數)
+    """
+    try:
+        result = await connect_async_redis(redis_db=2).eval(
+            _INIT_IF_ABSENT, 1, _unseen_key(owner_id), count, baseline, since.isoformat(), _UNSEEN_TTL)
+        return int(result or 0)
+    except Exception as e:
+        print(f'error: {e}')
+        return count
+
+
+async def reset_unseen_records(owner_id: int, view_at: datetime) -> bool:
+    """
+    歸零新紀錄筆數 (使用者瀏覽交易紀錄頁面時呼叫)
+
+    Args:
+        view_at (datetime): 瀏覽時間 (UTC)
+
+    Returns:
+        bool: 是否需要將瀏覽時間寫入 MySQL
+              (距離上次寫入超過 UNSEEN_PERSIST_INTERVAL 或 redis 無法使用時為 True)
+    """
+    try:
+        async with connect_async_redis(redis_db=2).pipeline(transaction=True) as pipe:
+            pipe.hset(_unseen_key(owner_id), mapping={"count": 0, "since": view_at.isoformat()})
+            pipe.expire(_unseen_key(owner_id), _UNSEEN_TTL)
+            pipe.set(f"{_PERSIST_KEY}:{owner_id}", 1, ex=UNSEEN_PERSIST_INTERVAL, nx=True)
+            *_, should_persist = await pipe.execute()
+        return bool(should_persist)
+
+    except Exception as e:
+        print(f'error: {e}')
+        return True
@@ -0,0 +1,133 @@
+import os
+import atexit
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from typing import Any, Dict, List
+
+# celery signals
+from celery.signals import worker_process_shutdown, worker_shutdown
+
+# mysql
+from sqlalchemy import insert
+from app.databases.mysql_setting import SessionLocal
+
+load_dotenv()
+
+LOG_BUFFER_SIZE = int(os.environ.get("LOG_BUFFER_SIZE", 200))  # 累積筆數達到上限時立即寫入
+LOG_FLUSH_INTERVAL_MS = int(os.environ.get("LOG_FLUSH_INTERVAL_MS", 1000))  # 最長等待時間 (ms)
+
+__all__ = ['LogBuffer', 'flush_log_buffers']
+
+_buffers: List["LogBuffer"] = []
+
+
+class LogBuffer:
+    """
+    日誌寫入緩衝區 (Celery worker 內使用)
+    累積 LOG_BUFFER_SIZE 筆或等待 LOG_FLUSH_INTERVAL_MS 後, 以單一 bulk INSERT 寫入 MySQL
+
+    註:
+        - 每個 worker process 各自擁有緩衝區, prefork fork 後會重新建立 lock 與背景執行緒
+        - worker 正常關閉時 (worker_process_shutdown / worker_shutdown / atexit) 會寫入剩餘資料
+    """
+
+    def __init__(self, model, max_rows: int = LOG_BUFFER_SIZE, flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS):
+        self.model = model
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self._reset()
+        _buffers.append(self)
+
+    def _reset(self):
+        """初始化 process 內的狀態 (fork 後 lock 與執行緒不會被子 process 繼承, 需重新建立)"""
+        self._pid = os.getpid()
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._flush_loop, name=f"log-buffer-{self.model.__tablename__}", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        """背景執行緒: 每隔 flush_interval 或緩衝區已滿時寫入"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def add(self, row: Dict[str, Any]):
+        """
+        加入一筆日誌 (建立時間以加入時為準, 不受寫入延遲影響)
+
+        Args:
+            row (Dict[str, Any]): model 欄位與值
+        """
+        row.setdefault("created_at", datetime.utcnow())
+        with self._lock:
+            self._ensure_thread()
+            self._rows.append(row)
+            is_full = len(self._rows) >= self.max_rows
+
+        if is_full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        寫入緩衝區內的所有日誌
+        註: bulk INSERT 失敗時改為逐筆寫入, 只捨棄有問題的資料 (例如違反 unique 限制)
+
+        Returns:
+            int: 寫入筆數
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+
+            sqldb = SessionLocal()
+            try:
+                sqldb.execute(insert(self.model), rows)
+                sqldb.commit()
+                return len(rows)
+
+            except Exception as e:
+                sqldb.rollback()
+                print(f'[Celery]批次寫入 {self.model.__tablename__} 失敗, 改為逐筆寫入: {e}')
+                return self._insert_each(sqldb, rows)
+
+            finally:
+                sqldb.close()
+
+    def _insert_each(self, sqldb, rows: List[Dict[str, Any]]) -> int:
+        inserted = 0
+        for row in rows:
+            try:
+                sqldb.execute(insert(self.model), row)
+                sqldb.commit()
+                inserted += 1
+            except Exception as e:
+                sqldb.rollback()
+                print(f'[Celery]寫入 {self.model.__tablename__} 失敗: {e}')
+        return inserted
+
+
+def flush_log_buffers(**kwargs):
+    """寫入所有緩衝區的剩餘日誌 (worker 關閉時呼叫)"""
+    for buffer in _buffers:
+        if buffer._pid == os.getpid():
+            buffer.flush()
+
+
+# prefork 子 process 結束 / worker 主 process 結束 (solo, threads pool) / 直譯器結束
+worker_process_shutdown.connect(flush_log_buffers, weak=False)
+worker_shutdown.connect(flush_log_buffers, weak=False)
+atexit.register(flush_log_buffers)
@@ -0,0 +1,74 @@
+from app.celery import celery
+import smtplib
+from typing import List
+
+# SMTP 連線池
+from app.services.smtp_pool import EmailMessage, send_messages, record_retry
+
+# 信件任務統一送到 mail queue (由 celery-mail worker 處理, 見 app/celery.py task_routes)
+MAIL_MAX_RETRIES = 5
+MAIL_BATCH_SIZE = 50  # 每個 deliver_email_batch 任務的信件數
+
+
+@celery.task(bind=True, autoretry_for=(smtplib.SMTPException, OSError), retry_backoff=True,
+             retry_backoff_max=600, retry_jitter=True, max_retries=MAIL_MAX_RETRIES)
+def deliver_email(task, to_email: str, subject: str, body: str) -> bool:
+    """
+    寄送單封信件 (使用 SMTP 連線池), 暫時性錯誤以指數退避重試
+
+    Args:
+        task: 任務物件，通常為背景排程傳入的任務上下文。
+        to_email (str): 收件者信箱。
+        subject (str): 主旨。
+        body (str): 內容。
+
+    Returns:
+        bool: 是否寄送成功 (永久錯誤時為 False, 不重試)
+    """
+    failures = send_messages([(to_email, subject, body)])
+    if not failures:
+        return True
+
+    if failures[0].permanent:
+        print(f'[Celery]{to_email} 信件送達失敗 (不重試): {failures[0].error}')
+        return False
+
+    if task.request.retries < MAIL_MAX_RETRIES:
+        record_retry()
+    raise smtplib.SMTPException(failures[0].error)
+
+
+@celery.task(bind=True)
+def deliver_email_batch(task, messages: List[EmailMessage]) -> int:
+    """
+    以同一個 SMTP 連線寄送多封信件, 失敗的信件 (暫時性錯誤) 改由 deliver_email 個別重試
+
+    Args:
+        task: 任務物件，通常為背景排程傳入的任務上下文。
+        messages (List[EmailMessage]): [(收件者, 主旨, 內容), ...]
+
+    Returns:
+        int: 寄送成功的信件數量
+    """
+    failures = send_messages(messages)
+    for failure in failures:
+        to_email, subject, body = messages[failure.index]
+        if failure.permanent:
+            print(f'[Celery]{to_email} 信件送達失敗 (不重試): {failure.error}')
+        else:
+            record_retry()
+            deliver_email.apply_async((to_email, subject, body), countdown=5)
+    return len(messages) - len(failures)
+
+
+def enqueue_email_batches(messages: List[EmailMessage], batch_size: int = MAIL_BATCH_SIZE) -> int:
+    """
+    將信件分批送入 mail queue
+
+    Returns:
+        int: 建立的任務數量
+    """
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+    for batch in batches:
+        deliver_email_batch.delay(batch)
+    return len(batches)
@@ -1,13 +1,25 @@
 # Depends & celery & data type check
 from app.celery import celery
-from typing import Dict
+from datetime import datetime
+from typing import Dict, List, Tuple
 
 # mysql models
 from app.databases.mysql_setting import SessionLocal
-from app.models.sql_model import UserLoginLog, JwtTokenLog
+from app.models.sql_model import User, UserBudgetSetting, UserLoginLog, JwtTokenLog
+from app.tasks.log_buffer import LogBuffer
+from app.services.log_partition import maintain_log_partitions
+
+# notification
+from app.services.notify_scheduler import NOTIFY_KINDS, get_notify_channels, claim_due_notifications, load_due_settings, reschedule_notifications
+from app.services.smtp_services import send_notify_email, get_notify_subject
+from app.tasks.mail_tasks import enqueue_email_batches
 
 __all__ = ['log_user_login']
 
+# 登入失敗或 token 過期大量發生時, 日誌先累積在 worker 內再批次寫入
+_login_log_buffer = LogBuffer(UserLoginLog)
+_jwt_log_buffer = LogBuffer(JwtTokenLog)
+
 
 @celery.task(bind=True)
 def log_user_login(task, data: Dict[str, str | None], status: bool):
@@ -25,24 +37,18 @@ def log_user_login(task, data: Dict[str, str | None], status: bool):
 
         status (bool): 登入是否成功。
     """
-    sqldb = SessionLocal()
     try:
-        new_log = UserLoginLog(
-            ip=data["ip"],
-            email=data["email"],
-            line_user_name=data["line_user_name"],
-            line_user_id=data["line_user_id"],
-            method=data["method"],
-            success_status=status
-        )
-        sqldb.add(new_log)
-        sqldb.commit()
+        _login_log_buffer.add({
+            "ip": data["ip"],
+            "email": data["email"],
+            "line_user_name": data["line_user_name"],
+            "line_user_id": data["line_user_id"],
+            "method": data["method"],
+            "success_status": status
+        })
 
     except Exception as e:
-        sqldb.rollback()
         print(f'[Celery]紀錄使用者登入日誌失敗: {e}')
-    finally:
-        sqldb.close()
 
 
 @celery.task(bind=True)
@@ -56,13 +62,115 @@ def jwt_exception_log(task, ip: str, user_agent: str, token: str):
         user_agent (str): 使用者 UA。
         token (str): 使用者 token 欄位資料
     """
-    sqldb = SessionLocal()
     try:
-        new_log = JwtTokenLog(ip=ip, ua=user_agent)
-        sqldb.add(new_log)
-        sqldb.commit()
+        _jwt_log_buffer.add({"ip": ip, "ua": user_agent})
     except Exception as e:
-        sqldb.rollback()
         print(f'[Celery]紀錄 JWT Token 日誌失敗: {e}')
+
+
+@celery.task(bind=True)
+def rotate_log_partitions(task):
+    """
+    排程任務 (celery beat)：建立日誌資料表未來月份的分區, 並刪除超過保留期限的分區。
+
+    Args:
+        task: 任務物件，通常為背景排程傳入的任務上下文。
+    """
+    try:
+        maintain_log_partitions()
+    except Exception as e:
+        print(f'[Celery]維護日誌分區失敗: {e}')
+
+
+@celery.task(bind=True)
+def dispatch_due_notifications(task, batch_size: int = 500):
+    """
+    排程任務 (celery beat 每分鐘)：取出已到期的通知, 批次送入 mail queue 後再排定下一次通知時間。
+    註: 只查詢已到期的通知 (redis/2 sorted set), 每次執行的成本與到期數量成正比, 與總使用者數無關
+
+    Args:
+        task: 任務物件，通常為背景排程傳入的任務上下文。
+        batch_size (int): 每批取出的通知數量。
+    """
+    now = datetime.utcnow()
+    while True:
+        due = claim_due_notifications(now, batch_size)
+        if not due:
+            return
+
+        sqldb = SessionLocal()
+        try:
+            settings = load_due_settings(sqldb, [member for member, _ in due])
+            notifications = []  # [(kind, user_id, channels), ...]
+            for member, setting in settings.items():
+                kind = member.rsplit(":", 1)[0]
+                channels = get_notify_channels(kind, setting)
+                if channels:
+                    notifications.append((kind, setting.user_id, channels))
+
+            _send_scheduled_notifications(sqldb, notifications)
+            reschedule_notifications(due, settings, now)
+
+        except Exception as e:
+            # 未重新排程的通知會在 lease 到期後再次被取出
+            print(f'[Celery]發送到期通知失敗: {e}')
+            return
+        finally:
+            sqldb.close()
+
+        if len(due) < batch_size:
+            return
+
+
+def _send_scheduled_notifications(sqldb, notifications: List[Tuple[str, int, List[str]]]):
+    """
+    發送定期/警示通知 (信箱以一次 IN 查詢取得, 信件分批交由 SMTP 連線池寄送)
+
+    Args:
+        notifications: [(通知種類, 使用者 id, 通知方式), ...]
+    """
+    email_user_ids = {user_id for _, user_id, channels in notifications if "email" in channels}
+    emails = dict()
+    if email_user_ids:
+        emails = dict(sqldb.query(User.id, User.email).filter(User.id.in_(email_user_ids)).all())
+
+    messages = []
+    for kind, user_id, channels in notifications:
+        title = NOTIFY_KINDS[kind][2]
+        if "email" in channels and emails.get(user_id):
+            messages.append((emails[user_id], get_notify_subject(title),
+                             f"您設定的「{title}」時間已到，請登入 Sapphire 財務管理查看最新的統計資料。"))
+
+    enqueue_email_batches(messages)
+
+
+@celery.task(bind=True)
+def send_budget_alert(task, user_id: int, level: str, spent: int, budget: int):
+    """
+    發送預算警示通知 (記帳支出跨越預算門檻時由 budget_tracker 觸發)
+
+    Args:
+        task: 任務物件，通常為背景排程傳入的任務上下文。
+        user_id (int): 使用者 id。
+        level (str): warning (剩餘預算低於設定比例) | exceeded (超出預算)。
+        spent (int): 本月累計支出。
+        budget (int): 每月預算。
+    """
+    sqldb = SessionLocal()
+    try:
+        row = sqldb.query(User.email, UserBudgetSetting.is_warning_email_notify).join(
+            UserBudgetSetting, User.id == UserBudgetSetting.user_id).filter(User.id == user_id).first()
     finally:
         sqldb.close()
+
+    if not row:
+        return
+
+    title = NOTIFY_KINDS["budget_warning"][2]
+    if level == "exceeded":
+        body = f"本月支出 {spent} 元已超出預算 {budget} 元。"
+    else:
+        body = f"本月支出 {spent} 元, 剩餘預算 {budget - spent} 元, 已低於您設定的警示比例。"
+
+    if row.is_warning_email_notify and row.email:
+        send_notify_email(row.email, title, body)
@@ -1,50 +1,95 @@
+from fastapi_cache import FastAPICache
+from typing import Any, Callable, Dict, Optional, Tuple
 import hashlib
+import inspect
 import json
 
+# 使用者快取版本號 (每次記帳資料異動時遞增, 舊版本的快取 key 不再被讀取, 交由 TTL 自然過期)
+_GENERATION_PREFIX = "cache-generation"
 
-def transaction_key_builder(func, namespace, request, *args, **kwargs):
+
+def _generation_key(owner_id: Optional[int]) -> Optional[str]:
+    """取得使用者對應的版本號 key"""
+    return f"{_GENERATION_PREFIX}:owner:{owner_id}" if owner_id is not None else None
+
+
+async def get_cache_generation(owner_id: Optional[int]) -> str:
     """
-    設定交易查詢資料的快取 key，用於 fastapi-cache 快取系統。
+    取得使用者目前的快取版本號
 
-    快取 key 結構範例：
-    fastapi-cache:_get_transaction_data:IncomeAccounting:alice:fdc2ab...:73bc99...
+    Returns:
+        版本號字串 (尚未有異動時為 0)
+    """
+    key = _generation_key(owner_id)
+    if key is None:
+        return "0"
 
-    參數說明：
-        - func: 被快取的函式本身，例如 _get_transaction_data
-        - namespace: 快取命名空間（通常是 fastapi-cache）
-        - request: FastAPI 的 Request 物件，可用於取登入者、路徑等
-        - *args: 傳入函式的位置參數（例如 collection、user_name、start_index）
-        - **kwargs: 傳入函式的命名參數（如 query dict、sort_order list）
+    value = await FastAPICache.get_backend().redis.get(key)
+    return str(int(value or 0))
+
+
+async def bump_cache_generation(*owner_ids: Optional[int]):
+    """
+    遞增使用者的快取版本號 (記帳資料新增/更新/刪除後呼叫), 之後的查詢會重新讀取資料庫
+    註: 只在 Redis 寫入失敗時印出錯誤, 不影響記帳寫入結果
+    """
+    keys = {_generation_key(owner_id) for owner_id in owner_ids} - {None}
+    if not keys:
+        return
+
+    try:
+        async with FastAPICache.get_backend().redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+            await pipe.execute()
+    except Exception as e:
+        print(f'error: {e}')
+
+
+async def _build_user_cache_key(func: Callable, namespace: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
     """
+    組合使用者資料的快取 key
+    快取函式需包含 owner_id 參數, 其餘參數序列化後做 md5 hash
+
+    快取 key 結構範例:
+        fastapi-cache::_get_transaction_data:42:3:fdc2ab...
+    """
+    arguments = inspect.signature(func).bind_partial(*args, **kwargs).arguments
+    owner_id = arguments.get("owner_id")
+    generation = await get_cache_generation(owner_id)
+
+    # collection 等 class 參數以名稱表示, 排序鍵避免 key 不穩
+    params = {name: value.__name__ if isinstance(value, type) else value
+              for name, value in arguments.items()}
+    params_str = json.dumps(params, sort_keys=True, default=str)
+    digest = hashlib.md5(params_str.encode()).hexdigest()
 
-    # 將所有位置參數轉為字串，作為 key 的一部分
-    key_parts = [str(a) for a in args]
+    return f"{namespace}:{func.__name__}:{owner_id}:{generation}:{digest}"
 
-    # 對 query dict 參數進行 JSON 序列化（排序鍵避免 key 不穩），再做 md5 hash，確保 key 長度簡短且唯一
-    if "query" in kwargs:
-        q_str = json.dumps(kwargs["query"], sort_keys=True)
-        key_parts.append(hashlib.md5(q_str.encode()).hexdigest())
 
-    # 對 sort_order list 也進行序列化與 hash，避免資料過長或順序變動導致快取命中錯誤
-    if "sort_order" in kwargs:
-        s_str = json.dumps(kwargs["sort_order"])
-        key_parts.append(hashlib.md5(s_str.encode()).hexdigest())
+async def transaction_key_builder(func, namespace, request=None, response=None, args=(), kwargs=None):
+    """
+    設定交易查詢資料的快取 key，用於 fastapi-cache 快取系統。
 
-    # 將命名空間、函式名稱與參數片段組成完整 Redis 快取 key
-    return f"{namespace}:{func.__name__}:{':'.join(key_parts)}"
+    參數說明：
+        - func: 被快取的函式本身，例如 _get_transaction_data
+        - namespace: 快取命名空間（通常是 fastapi-cache）
+        - request: FastAPI 的 Request 物件 (內部快取函式沒有傳入, 為 None)
+        - args: 傳入函式的位置參數（例如 collection、owner_id、query、sort_order）
+        - kwargs: 傳入函式的命名參數
+    """
+    return await _build_user_cache_key(func, namespace, args, kwargs or {})
 
 
-def dashboard_balance_key_builder(func, namespace, request, *args, **kwargs):
+async def dashboard_balance_key_builder(func, namespace, request=None, response=None, args=(), kwargs=None):
     """
-    設定'儀錶板總餘額'的快取 key
+    設定'儀錶板'的快取 key
     """
-    key_parts = [str(a) for a in args]
-    return f"{namespace}:{func.__name__}:{','.join(key_parts)}"
+    return await _build_user_cache_key(func, namespace, args, kwargs or {})
 
 
-def accounting_figure_key_builder(func, namespace, request, *args, **kwargs):
+async def accounting_figure_key_builder(func, namespace, request=None, response=None, args=(), kwargs=None):
     """
     設定'記帳圖表'的快取 key
     """
-    key_parts = [str(a) for a in args]
-    return f"{namespace}:{func.__name__}:{','.join(key_parts)}"
+    return await _build_user_cache_key(func, namespace, args, kwargs or {})
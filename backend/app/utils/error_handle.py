@@ -5,3 +5,15 @@ class AuthorizationError(Exception):
         self.user_agent = request.headers.get("User-Agent")
         self.token = request.headers.get("Authorization")
         super().__init__(self.message)
+
+
+class InvalidCursorError(Exception):
+    def __init__(self, message="分頁游標無效或與排序條件不符"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class PasswordHasherBusyError(Exception):
+    def __init__(self, message="伺服器忙碌中, 請稍後再試"):
+        self.message = message
+        super().__init__(self.message)
@@ -2,17 +2,87 @@ from fastapi import Request
 
 from datetime import datetime, timedelta
 from jose import ExpiredSignatureError, JWTError, jwt
+from dataclasses import dataclass, replace
 from functools import wraps
-from typing import Callable
+from typing import Callable, Optional
 import os
 
+from sqlalchemy.orm import Session
+from app.databases.mysql_setting import SessionLocal
+from app.models.sql_model import User
+from app.utils.attach_info import check_user_login_method
 from app.utils.error_handle import AuthorizationError
+from app.utils.threadpool import run_blocking
 
 ALGORITHM = "HS256"
 TOKEN_EXPIRES = 15  # 15 minute
 JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
 
 
+@dataclass(frozen=True)
+class Principal:
+    """
+    JWT 驗證後的使用者身分 (request.state.principal)
+
+    Attributes:
+        user_id (int | None): 使用者 id (User.id), 舊版 token 沒有此欄位時由 verify_jwt_token 查詢後補上。
+        user_name (str | None): 使用者名稱。
+        line_user_id (str | None): 使用者 Line ID。
+        login_method (str): 登入方式 (bind | line | password)。
+    """
+    user_id: Optional[int]
+    user_name: Optional[str]
+    line_user_id: Optional[str]
+    login_method: str
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "Principal":
+        return cls(
+            user_id=payload.get("user_id"),
+            user_name=payload.get("username"),
+            line_user_id=payload.get("line_user_id"),
+            login_method=check_user_login_method(payload)
+        )
+
+
+async def resolve_user_id(principal: Principal, sqldb: Session) -> Optional[int]:
+    """
+    取得使用者 id (token 已帶 user_id 時不查詢資料庫)
+    註: 只有未包含 user_id 的舊版 token 才會依登入方式查詢 User
+
+    Returns:
+        int | None: 使用者 id, 找不到使用者時為 None
+    """
+    if principal.user_id is not None:
+        return principal.user_id
+
+    if principal.login_method == "line":
+        condition = User.line_user_id == principal.line_user_id
+    else:
+        condition = User.username == principal.user_name
+    user = await run_blocking(sqldb.query(User.id).filter(condition).first)
+    return user.id if user else None
+
+
+async def _resolve_legacy_principal(request: Request, principal: Principal) -> Principal:
+    """
+    舊版 token (未包含 user_id) 查詢使用者 id, 讓後續查詢一律使用 owner_id
+    註: token 過期後重新簽發即會帶有 user_id, 只在過渡期間查詢資料庫
+
+    Raises:
+        AuthorizationError: 找不到對應的使用者
+    """
+    sqldb = SessionLocal()
+    try:
+        user_id = await resolve_user_id(principal, sqldb)
+    finally:
+        sqldb.close()
+
+    if user_id is None:
+        raise AuthorizationError(request)
+    return replace(principal, user_id=user_id)
+
+
 def create_jwt_token(data: dict):
     """
     建立 JWT token。
@@ -130,7 +200,12 @@ def verify_jwt_token(func: Callable) -> Callable:
             raise AuthorizationError(request)
 
         # 設定 request.state 將使用者訊息帶到 api (類似 flask.g)
+        principal = Principal.from_payload(payload)
+        if principal.user_id is None:
+            principal = await _resolve_legacy_principal(request, principal)
+
         request.state.payload = payload
+        request.state.principal = principal
         return await func(request, *args, **kwargs)
 
     return _jwt_authiorization
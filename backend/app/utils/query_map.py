@@ -2,6 +2,7 @@ from collections import defaultdict
 from typing import Dict, Any
 from datetime import datetime, timedelta
 from app.schemas.accounting import FilterRow
+from app.utils.search_tokens import field_filter_tokens
 
 OPERATOR_MAP = {
     "ne": "$ne",
@@ -28,9 +29,21 @@ _PAY_METHOD_MAP = {
 
 
 def handle_filter_query(query: list[FilterRow]) -> Dict[str, Any]:
+    """
+    將前端的篩選/排序條件轉換為 mongo 查詢條件
+
+    註: 模糊包含 (include + fuzzy) 的查詢字串全為中日韓文字時, 另外以 search_tokens 索引先篩選候選資料,
+        再以 regex 確認; 這個前置篩選依賴 search_tokens, 上線前需先執行
+        `python -m app.services.search_token_migration --rebuild` 建立既有資料的 token (含截斷標記),
+        否則尚未回填的資料不會出現在篩選結果中
+
+    Returns:
+        {"mongo_query": 查詢條件, "sort_order": [(欄位, 1 | -1), ...]}
+    """
     mongo_query = defaultdict(dict)
     sort_order = []
     eq_accumulator = defaultdict(list)  # 收集同一欄位多個 eq 值
+    token_conditions = []  # 模糊篩選的索引條件 (owner_id + search_tokens 索引)
     isDefaultOrder = True
 
     for column in query:
@@ -68,6 +81,13 @@ def handle_filter_query(query: list[FilterRow]) -> Dict[str, Any]:
             if mode == "exact":
                 eq_accumulator[field].append(value)
             elif mode == "fuzzy":
+                tokens, truncated_token = field_filter_tokens(field, value)
+                if tokens:
+                    # 以索引 token 取得候選資料 (token 截斷的資料一律列入候選), 再以 regex 確認連續字串
+                    token_conditions.append({"$or": [
+                        {"search_tokens": {"$all": tokens}},
+                        {"search_tokens": truncated_token}
+                    ]})
                 mongo_query[field] = {"$regex": value, "$options": "i"}
 
         elif operator == "exclude":
@@ -83,6 +103,9 @@ def handle_filter_query(query: list[FilterRow]) -> Dict[str, Any]:
             order = 1 if column.sortOrder == "+" else -1
             sort_order.append((field, order))
 
+    if token_conditions:
+        mongo_query["$and"] = token_conditions
+
     # 合併 eq 為 $in 或單值
     for field, values in eq_accumulator.items():
         mongo_query[field] = {"$in": values} if len(values) > 1 else values[0]
@@ -0,0 +1,119 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Set, Tuple
+
+# 可搜尋的欄位: token 前綴 (同一筆資料的 token 存在同一個 search_tokens 陣列, 以前綴區分欄位)
+SEARCH_FIELD_PREFIX = {
+    "cost_name": "c",
+    "store_name": "s",
+    "description": "d",
+    "payer": "p",
+}
+
+_MAX_PREFIX_LENGTH = 12  # 英數單字最多建立的前綴長度 (查詢字串較長時截斷)
+_MAX_FIELD_TOKENS = 200  # 每個欄位最多的 token 數 (避免過長的備註產生大量 token)
+_TRUNCATED_TOKEN = "*"  # 欄位 token 超過上限時加入的標記 (該欄位無法只以 token 判斷是否包含查詢字串)
+
+# 中日韓文字 (逐字切分) | 英數單字
+_CJK_RANGES = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_PATTERN = re.compile(f"[{_CJK_RANGES}]+|[0-9a-z]+")
+_CJK_PATTERN = re.compile(f"[{_CJK_RANGES}]")
+_CJK_TEXT_PATTERN = re.compile(f"[{_CJK_RANGES}\\s]+")
+
+
+def _normalize(text: str) -> str:
+    """全形轉半形並轉為小寫 (例如: ＡＢＣ -> abc)"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _tokenize(text: Any) -> Tuple[List[str], bool]:
+    """
+    Returns:
+        (token, 是否超過 _MAX_FIELD_TOKENS 而截斷)
+    """
+    if not text or not isinstance(text, str):
+        return [], False
+
+    tokens: Dict[str, None] = dict()  # 保留順序的 set
+    for run in _TOKEN_PATTERN.findall(_normalize(text)):
+        if _CJK_PATTERN.match(run):
+            tokens.update(dict.fromkeys(run))
+            tokens.update(dict.fromkeys(run[i:i + 2] for i in range(len(run) - 1)))
+        else:
+            tokens.update(dict.fromkeys(run[:i] for i in range(1, min(len(run), _MAX_PREFIX_LENGTH) + 1)))
+        if len(tokens) > _MAX_FIELD_TOKENS:
+            return list(tokens)[:_MAX_FIELD_TOKENS], True
+    return list(tokens), False
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    建立索引用的 token (寫入時使用)
+        - 中日韓文字: 單字 + 相鄰兩字 (例如 全家便利 -> 全, 家, 便, 利, 全家, 家便, 便利)
+        - 英數單字: 所有前綴 (例如 7eleven -> 7, 7e, 7el, ...), 支援前綴搜尋
+    """
+    return _tokenize(text)[0]
+
+
+def query_tokens(text: str) -> List[str]:
+    """
+    建立查詢用的 token (資料需包含全部 token 才符合)
+        - 中日韓文字: 相鄰兩字 (只有一個字時為單字)
+        - 英數單字: 單字本身 (對應索引的前綴)
+    """
+    tokens: Set[str] = set()
+    for run in _TOKEN_PATTERN.findall(_normalize(text or "")):
+        if _CJK_PATTERN.match(run):
+            tokens.update([run] if len(run) == 1 else (run[i:i + 2] for i in range(len(run) - 1)))
+        else:
+            tokens.add(run[:_MAX_PREFIX_LENGTH])
+    return sorted(tokens)
+
+
+def build_search_tokens(values: Dict[str, Any]) -> List[str]:
+    """
+    依欄位值建立 search_tokens (只處理 SEARCH_FIELD_PREFIX 中的欄位)
+
+    Args:
+        values (Dict[str, Any]): 欄位: 值
+
+    Returns:
+        List[str]: ["s:全家", "c:lunch", ...] (欄位 token 超過上限時另外加入 "d:*")
+    """
+    tokens: List[str] = []
+    for field, prefix in SEARCH_FIELD_PREFIX.items():
+        if field in values:
+            field_tokens, truncated = _tokenize(values[field])
+            tokens += [f"{prefix}:{token}" for token in field_tokens]
+            if truncated:
+                tokens.append(f"{prefix}:{_TRUNCATED_TOKEN}")
+    return tokens
+
+
+def field_query_tokens(field: str, text: str) -> List[str]:
+    """
+    指定欄位的查詢 token (欄位不支援搜尋或沒有可用的 token 時為空列表)
+
+    Returns:
+        List[str]: ["s:全家", ...]
+    """
+    prefix = SEARCH_FIELD_PREFIX.get(field)
+    if prefix is None:
+        return []
+    return [f"{prefix}:{token}" for token in query_tokens(text)]
+
+
+def field_filter_tokens(field: str, text: str) -> Tuple[List[str], str | None]:
+    """
+    模糊篩選 (包含字串) 可使用的索引 token
+    註: 只有查詢字串全為中日韓文字時, 包含該字串的資料一定包含其相鄰兩字的 token, 可作為 regex 的前置篩選;
+        英數只建立單字前綴 (例如 leven 不是 7eleven 的前綴), 無法保證符合, 不使用 token
+
+    Returns:
+        (資料需全部包含的 token, 截斷標記 token); 無法使用 token 時為 ([], None)
+        token 超過上限而截斷的欄位需另外以截斷標記取得 (例如 {"$or": [{"$all": tokens}, 截斷標記]})
+    """
+    prefix = SEARCH_FIELD_PREFIX.get(field)
+    if prefix is None or not _CJK_TEXT_PATTERN.fullmatch(text or ""):
+        return [], None
+    return [f"{prefix}:{token}" for token in query_tokens(text)], f"{prefix}:{_TRUNCATED_TOKEN}"
@@ -0,0 +1,33 @@
+from anyio import CapacityLimiter, to_thread
+from functools import partial
+from typing import Any, Callable, TypeVar
+import os
+
+T = TypeVar("T")
+
+# 同時執行阻塞操作 (mongoengine 寫入 / SQLAlchemy 查詢 / 外部 HTTP) 的 thread 數量上限
+# 註: 預設與 MySQL 連線池大小 (pool_size + max_overflow) 相同, 避免 thread 等待連線
+BLOCKING_THREAD_LIMIT = int(os.getenv("BLOCKING_THREAD_LIMIT", 20))
+
+_limiter: CapacityLimiter | None = None
+
+
+def _get_limiter() -> CapacityLimiter:
+    """取得共用的 CapacityLimiter (需在 event loop 中建立)"""
+    global _limiter
+    if _limiter is None:
+        _limiter = CapacityLimiter(BLOCKING_THREAD_LIMIT)
+    return _limiter
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    將阻塞函式交由有上限的 thread pool 執行, 避免 async route 卡住 event loop
+
+    Args:
+        func (Callable): 阻塞函式 (例如 record.save, sqldb.execute)
+
+    Returns:
+        func 的回傳值 (例外會原樣拋出)
+    """
+    return await to_thread.run_sync(partial(func, *args, **kwargs), limiter=_get_limiter())
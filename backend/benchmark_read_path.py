@@ -0,0 +1,137 @@
+"""
+交易紀錄讀取路徑的 microbenchmark (每筆資料的平均耗時)
+
+    舊: mongoengine Document 建立 -> Accounting.to_api_format() (逐筆 strftime) -> json.dumps (JSONResponse)
+    新: pymongo aggregate $project 直接輸出 API 格式 (get_api_projection) -> orjson.dumps (ORJSONResponse)
+
+用法:
+    python benchmark_read_path.py                 # 只比較 Python 端 (BSON 解碼 + 格式轉換 + 序列化), 不需資料庫
+    python benchmark_read_path.py --mongo         # 連線 MONGO_URI, 寫入測試資料後比較查詢 + 序列化的完整耗時
+    python benchmark_read_path.py --rows 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import orjson
+import bson
+from bson import ObjectId
+
+from app.models.mongo_model import Accounting
+from app.services.transaction_services import _ACCOUNTING_FIELDS, get_api_projection
+
+_BENCHMARK_OWNER_ID = -1  # 測試資料的 owner_id (結束後刪除)
+
+
+def _json_dumps(content: Any) -> bytes:
+    """同 starlette JSONResponse.render"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _make_raw_docs(rows: int) -> List[Dict[str, Any]]:
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "owner_id": _BENCHMARK_OWNER_ID,
+            "user_name": "benchmark",
+            "statistics_kind": "飲食",
+            "category": "午餐",
+            "store_name": f"店家 {i % 50}",
+            "cost_name": f"品項 {i}",
+            "cost": i % 1000,
+            "unit": "TWD",
+            "pay_method": i % 5,
+            "cost_status": i % 4,
+            "description": "",
+            "created_at": start + timedelta(minutes=i),
+            "updated_at": start + timedelta(minutes=i),
+        } for i in range(rows)
+    ]
+
+
+def _to_projected(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """模擬 $project 的輸出 (離線模式下由資料庫完成的部分不計入)"""
+    return {
+        "id": str(doc["_id"]),
+        **{field: doc.get(field) for field in _ACCOUNTING_FIELDS[:-1]},
+        "created_at": doc["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def _measure(name: str, rows: int, repeat: int, func: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    per_row = best / rows * 1e6
+    print(f"{name:<48} {best * 1000:>9.2f} ms  {per_row:>7.2f} µs/row")
+    return per_row
+
+
+def run_offline(rows: int, repeat: int):
+    """
+    兩種方式都從 driver 收到的 BSON 開始計時 (資料庫端的 $project 不計入):
+        舊: 解碼完整資料 -> _from_son -> to_api_format -> json.dumps
+        新: 解碼 $project 後的資料 -> orjson.dumps
+    """
+    raw_docs = _make_raw_docs(rows)
+    raw_bson = b"".join(bson.encode(doc) for doc in raw_docs)
+    projected = [_to_projected(doc) for doc in raw_docs]
+    projected_bson = b"".join(bson.encode(doc) for doc in projected)
+
+    print(f"[離線] {rows} 筆, 取 {repeat} 次中最快的一次")
+    old = _measure("舊: BSON 解碼 + _from_son + to_api_format + json.dumps", rows, repeat,
+                   lambda: _json_dumps([Accounting._from_son(doc).to_api_format() for doc in bson.decode_all(raw_bson)]))
+    _measure("   (其中 json.dumps)", rows, repeat, lambda: _json_dumps(projected))
+    new = _measure("新: BSON 解碼 ($project 輸出) + orjson.dumps", rows, repeat,
+                   lambda: orjson.dumps(bson.decode_all(projected_bson)))
+    _measure("   (其中 orjson.dumps)", rows, repeat, lambda: orjson.dumps(projected))
+    print(f"每筆耗時: {old:.2f} -> {new:.2f} µs ({old / new:.1f}x)")
+
+
+def run_mongo(rows: int, repeat: int):
+    from app.databases.mongo_setting import connect_mongo, get_async_mongo_db
+    connect_mongo()
+
+    collection = Accounting._get_collection()
+    collection.insert_many(_make_raw_docs(rows))
+    match = {"owner_id": _BENCHMARK_OWNER_ID}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$project": get_api_projection(_ACCOUNTING_FIELDS)},
+    ]
+
+    async def _new_path():
+        cursor = await get_async_mongo_db()[Accounting._get_collection_name()].aggregate(pipeline)
+        return orjson.dumps(await cursor.to_list())
+
+    loop = asyncio.new_event_loop()
+    try:
+        print(f"[MongoDB] {rows} 筆, 取 {repeat} 次中最快的一次")
+        old = _measure("舊: Accounting.objects + to_api_format + json.dumps", rows, repeat, lambda: _json_dumps(
+            [record.to_api_format() for record in Accounting.objects(owner_id=_BENCHMARK_OWNER_ID).order_by("-created_at", "-id")]))
+        new = _measure("新: aggregate $project + orjson.dumps", rows, repeat,
+                       lambda: loop.run_until_complete(_new_path()))
+        print(f"每筆耗時: {old:.2f} -> {new:.2f} µs ({old / new:.1f}x)")
+    finally:
+        loop.close()
+        collection.delete_many(match)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="交易紀錄讀取路徑 benchmark")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo", action="store_true", help="連線 MongoDB 比較查詢 + 序列化")
+    args = parser.parse_args()
+
+    if args.mongo:
+        run_mongo(args.rows, args.repeat)
+    else:
+        run_offline(args.rows, args.repeat)